@@ -7,6 +7,7 @@ from .endpoints.collections import router as collections
 from .endpoints.documents import router as documents
 from .endpoints.conversations import router as conversations
 from .endpoints.messages import router as messages
+from .endpoints.health import router as health
 
 api_router = APIRouter()
 api_router.include_router(auth,prefix="/auth" , tags=["auth"])
@@ -17,5 +18,6 @@ api_router.include_router(collections,prefix="/collections", tags=["collections"
 api_router.include_router(documents,prefix="/documents", tags=["documents"])
 api_router.include_router(conversations,prefix="/conversations", tags=["conversations"])
 api_router.include_router(messages,prefix="/messages", tags=["messages"])
+api_router.include_router(health,prefix="/health", tags=["health"])
 
 
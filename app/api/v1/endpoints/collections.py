@@ -2,7 +2,9 @@
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from app.schemas.rag import CollectionCreate, CollectionInDB, CollectionOutDB
-from app.database.crud import create_collection, get_collections_by_user
+from app.database.crud import create_collection, get_collections_by_user, get_collection_by_id
+from app.services.document_cleanup import delete_collection_data
+from uuid import UUID
 from app.integrations.supabase_connect import get_supabase_client,set_supabase_rls_user_context
 from supabase import Client
 from typing import List
@@ -77,4 +79,36 @@ def get_all_user_collections(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to retrieve collections: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+
+@router.delete("/{collection_id}")
+async def delete_user_collection(
+    collection_id: UUID,
+    current_user: dict = Depends(get_current_user),
+    _rls_context: None = Depends(set_supabase_rls_user_context),
+    supabase: Client = Depends(get_supabase_client)
+):
+    """Delete a collection with all of its documents, vectors and conversations."""
+    user_id = str(current_user["_id"])
+    try:
+        collection = get_collection_by_id(supabase, collection_id)
+        if not collection or str(collection.get("user_id")) != user_id:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Collection not found")
+
+        result = await delete_collection_data(supabase, user_id, collection_id)
+        return JSONResponse(
+            content={
+                "status": "success",
+                "message": "Collection deleted successfully!",
+                "data": result,
+            },
+            status_code=status.HTTP_200_OK
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to delete collection: {str(e)}"
+        )
@@ -3,10 +3,14 @@
 from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, BackgroundTasks, status, Query
 from uuid import UUID
 from app.schemas.rag import DocumentUploadResponse
-from app.database.crud import create_document, update_document_status,get_documents_by_collection
+from app.database.crud import create_document, update_document_status,get_documents_by_collection,get_document_by_id,find_document_by_file_hash,count_documents_by_storage_path,update_document_file
 from app.integrations.supabase_connect import get_supabase_client,set_supabase_rls_user_context,get_pdf_bucket_name
-from app.services.rag_service import process_pdf_for_rag
+from app.services.rag_service import process_pdf_for_rag, copy_document_for_rag
+from app.services.document_cleanup import delete_document_data
+from app.services.ingestion_queue import get_ingestion_queue
+from app.services.storage_manager import get_storage_uploader
 from supabase import Client
+import hashlib
 import io
 from datetime import datetime
 from app.services.auth_services import get_current_user,get_current_user_or_guest
@@ -19,6 +23,20 @@ from app.core.config import settings
 
 router = APIRouter()
 
+# Read size when hashing an upload, so the PDF is never held in memory whole
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def _hash_upload(file: UploadFile) -> str:
+    """sha256 of the spooled upload, read in chunks; leaves the file at its start."""
+    digest = hashlib.sha256()
+    file.file.seek(0)
+    for block in iter(lambda: file.file.read(HASH_CHUNK_BYTES), b""):
+        digest.update(block)
+    file.file.seek(0)
+    return digest.hexdigest()
+
+
 @router.post("/upload", response_model=DocumentUploadResponse, status_code=status.HTTP_202_ACCEPTED)
 def upload_document(
     file: UploadFile = File(...),
@@ -36,6 +54,10 @@ def upload_document(
     2. Saves it to Supabase Storage
     3. Creates a document record in the database
     4. Starts a background task for RAG processing
+
+    If the user already indexed the exact same PDF (same sha256), the stored
+    file is reused and its chunks and vectors are copied instead of running
+    extraction and embedding again.
     
     Returns immediately with a 202 Accepted response while processing continues in the background.
     """
@@ -71,25 +93,39 @@ def upload_document(
         safe_filename = f"{current_user['_id']}/chat_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{file.filename}"
         supabase_bucket_name = get_pdf_bucket_name()
 
-        # 4. Read file content (only once for efficiency)
-        file_content_bytes = file.file.read()
-        
-        # 5. Upload to Supabase Storage
+        # 4. Hash the spooled upload; processing re-reads it from there
+        file_hash = _hash_upload(file)
+
+        # Look for an identical PDF this user has already indexed
+        duplicates = []
         try:
-            res = supabase.storage.from_(supabase_bucket_name).upload(
-                path=safe_filename,
-                file_options={"content-type": "application/pdf"},
-                file=file_content_bytes
-            )
-            if hasattr(res, 'error') and res.error:
-                raise Exception(f"Storage error: {res.error}")
-                
+            duplicates = find_document_by_file_hash(supabase, str(current_user['_id']), file_hash)
         except Exception as e:
-            logger.error(f"Failed to upload file to storage: {e}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
-                detail="Failed to upload file to storage."
+            logger.error(f"Failed to look up duplicate uploads: {e}")
+        existing = next((doc for doc in duplicates if str(doc['collection_id']) == str(collection_id)), None)
+        if existing:
+            return DocumentUploadResponse(
+                document_id=UUID(existing['id']),
+                file_name=existing['file_name'],
+                status=existing['status'],
+                message="This PDF is already in the collection."
             )
+        source_document = duplicates[0] if duplicates else None
+        
+        # 5. Upload to Supabase Storage (duplicates reuse the stored object)
+        if source_document:
+            safe_filename = source_document['storage_path']
+        else:
+            try:
+                # Streamed from the spooled upload; large files go up in resumable parts
+                get_storage_uploader().upload(supabase_bucket_name, safe_filename, file.file)
+
+            except Exception as e:
+                logger.error(f"Failed to upload file to storage: {e}")
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
+                    detail="Failed to upload file to storage."
+                )
 
         # 6. Create document record in database
         try:
@@ -98,36 +134,62 @@ def upload_document(
                 collection_id,
                 str(current_user['_id']),
                 file.filename,
-                safe_filename
+                safe_filename,
+                file_hash=file_hash
             )
             document_id = new_document['id']
         except Exception as e:
             logger.error(f"Failed to create document record: {e}")
             # Clean up the uploaded file if document creation fails
-            try:
-                supabase.storage.from_(supabase_bucket_name).remove([safe_filename])
-            except Exception as cleanup_error:
-                logger.error(f"Failed to clean up storage after document creation failed: {cleanup_error}")
+            if not source_document:
+                try:
+                    supabase.storage.from_(supabase_bucket_name).remove([safe_filename])
+                except Exception as cleanup_error:
+                    logger.error(f"Failed to clean up storage after document creation failed: {cleanup_error}")
             
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to create document record."
             )
 
-        # 7. Start background task for RAG processing
+        # 7. Start RAG processing: hand it to the ingestion worker when the
+        #    durable queue is enabled, otherwise run it as a background task
         try:
-            background_tasks.add_task(
-                process_pdf_for_rag,
-                user_id=str(current_user['_id']),
-                collection_id=collection_id,
-                document_id=UUID(document_id),
-                file_name=file.filename,
-                file_content_bytes=file_content_bytes,
-                file=file,
-                supabase_client=supabase  # Pass the client to avoid creating a new one
-            )
+            if source_document:
+                # Only copies existing chunks and vectors, cheap enough for the web process
+                background_tasks.add_task(
+                    copy_document_for_rag,
+                    user_id=str(current_user['_id']),
+                    source_document_id=UUID(source_document['id']),
+                    collection_id=collection_id,
+                    document_id=UUID(document_id),
+                    file_name=file.filename,
+                    file_hash=file_hash,
+                    file=file,
+                    supabase_client=supabase
+                )
+            elif settings.INGESTION_BACKEND == "queue":
+                get_ingestion_queue().enqueue(
+                    user_id=str(current_user['_id']),
+                    collection_id=str(collection_id),
+                    document_id=str(document_id),
+                    file_name=file.filename,
+                    storage_path=safe_filename
+                )
+                update_document_status(supabase, document_id, "queued")
+            else:
+                background_tasks.add_task(
+                    process_pdf_for_rag,
+                    user_id=str(current_user['_id']),
+                    collection_id=collection_id,
+                    document_id=UUID(document_id),
+                    file_name=file.filename,
+                    file_content_bytes=None,
+                    file=file,
+                    supabase_client=supabase  # Pass the client to avoid creating a new one
+                )
         except Exception as e:
-            logger.error(f"Failed to start background task: {e}")
+            logger.error(f"Failed to start document processing: {e}")
             # Update document status to failed
             update_document_status(supabase, document_id, "failed")
             raise HTTPException(
@@ -154,6 +216,150 @@ def upload_document(
             detail="An unexpected error occurred during document upload."
         )
 
+@router.post("/{document_id}/reindex", response_model=DocumentUploadResponse, status_code=status.HTTP_202_ACCEPTED)
+def reindex_document(
+    document_id: UUID,
+    file: UploadFile = File(...),
+    background_tasks: BackgroundTasks = BackgroundTasks(),
+    current_user: dict = Depends(get_current_user),
+    _rls_context: None = Depends(set_supabase_rls_user_context),
+    supabase: Client = Depends(get_supabase_client)
+):
+    """
+    Replaces the PDF of an existing document with a revised version and re-indexes it.
+
+    Only chunks whose content changed are embedded and upserted again; vectors
+    for chunks that no longer exist are deleted.
+    """
+    logger = logging.getLogger(__name__)
+
+    if file.content_type != "application/pdf":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Only PDF files are allowed."
+        )
+
+    try:
+        document = get_document_by_id(supabase, document_id)
+    except Exception as e:
+        logger.error(f"Failed to fetch document {document_id}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch document."
+        )
+    if not document or str(document.get("user_id")) != str(current_user['_id']):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found.")
+    if document.get("status") in ("queued", "processing", "extracting", "embedding", "indexing"):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Document is already being processed.")
+
+    file_hash = _hash_upload(file)
+    supabase_bucket_name = get_pdf_bucket_name()
+
+    # Overwrite the stored PDF in place, unless deduplicated uploads share it;
+    # then the revision gets its own object so the other documents keep their file
+    storage_path = document["storage_path"]
+    try:
+        shared = count_documents_by_storage_path(supabase, storage_path) > 1
+        if shared:
+            storage_path = f"{current_user['_id']}/chat_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{document['file_name']}"
+        get_storage_uploader().upload(supabase_bucket_name, storage_path, file.file, upsert=not shared)
+    except Exception as e:
+        logger.error(f"Failed to upload revised file to storage: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to upload file to storage."
+        )
+
+    # The hash must follow the content, or later uploads of the old PDF would dedupe to this one
+    try:
+        update_document_file(supabase, document_id, storage_path, file_hash)
+    except Exception as e:
+        logger.error(f"Failed to update document {document_id} with the revised file: {e}")
+        if shared:
+            try:
+                supabase.storage.from_(supabase_bucket_name).remove([storage_path])
+            except Exception as cleanup_error:
+                logger.error(f"Failed to clean up storage after the document update failed: {cleanup_error}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to update document record."
+        )
+
+    try:
+        if settings.INGESTION_BACKEND == "queue":
+            get_ingestion_queue().enqueue(
+                user_id=str(current_user['_id']),
+                collection_id=str(document["collection_id"]),
+                document_id=str(document_id),
+                file_name=document["file_name"],
+                storage_path=storage_path
+            )
+            update_document_status(supabase, document_id, "queued")
+        else:
+            update_document_status(supabase, document_id, "processing")
+            background_tasks.add_task(
+                process_pdf_for_rag,
+                user_id=str(current_user['_id']),
+                collection_id=UUID(str(document["collection_id"])),
+                document_id=document_id,
+                file_name=document["file_name"],
+                file_content_bytes=None,
+                file=file,
+                supabase_client=supabase
+            )
+    except Exception as e:
+        logger.error(f"Failed to start re-indexing: {e}")
+        update_document_status(supabase, document_id, "failed")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to start document processing."
+        )
+
+    return DocumentUploadResponse(
+        document_id=document_id,
+        file_name=document["file_name"],
+        status="processing",
+        message="Revised PDF uploaded. Re-indexing changed content in the background."
+    )
+
+@router.delete("/{document_id}")
+async def delete_document_endpoint(
+    document_id: UUID,
+    current_user: dict = Depends(get_current_user),
+    _rls_context: None = Depends(set_supabase_rls_user_context),
+    supabase: Client = Depends(get_supabase_client)
+):
+    """Deletes a document together with its vectors, chunks and (if not shared) stored PDF."""
+    logger = logging.getLogger(__name__)
+    user_id = str(current_user['_id'])
+    try:
+        document = get_document_by_id(supabase, document_id)
+    except Exception as e:
+        logger.error(f"Failed to fetch document {document_id}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch document."
+        )
+    if not document or str(document.get("user_id")) != user_id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found.")
+
+    try:
+        result = await delete_document_data(supabase, user_id, document)
+    except Exception as e:
+        logger.error(f"Failed to delete document {document_id}: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to delete document: {str(e)}"
+        )
+    return JSONResponse(
+        content={
+            "status": "success",
+            "message": "Document deleted successfully!",
+            "data": result,
+        },
+        status_code=status.HTTP_200_OK
+    )
+
 # (Optional: Add GET /documents to list documents in a collection)
 @router.get("/", response_model=List[DocumentOutDB])
 async def get_documents_in_collection(
@@ -0,0 +1,69 @@
+# app/api/v1/endpoints/health.py
+
+from fastapi import APIRouter
+from app.integrations.model_registry import model_registry
+from app.services.embedding_cache import get_embedding_cache
+from app.services.answer_cache import get_answer_cache
+from app.services.document_cleanup import get_last_gc_report
+from app.services.pdf_executor import get_pdf_executor
+from app.core.metrics import metrics_snapshot
+
+router = APIRouter()
+
+
+@router.get("/models")
+async def get_resolved_models():
+    """Returns the chat and embedding models resolved by the model registry."""
+    return {
+        "status": "ok",
+        "models": model_registry.snapshot()
+    }
+
+
+@router.get("/embedding-cache")
+async def get_embedding_cache_stats():
+    """Returns hit/miss counters for the embedding cache."""
+    cache = get_embedding_cache()
+    return {
+        "status": "ok",
+        "enabled": cache is not None,
+        "stats": cache.stats() if cache else None
+    }
+
+
+@router.get("/answer-cache")
+async def get_answer_cache_stats():
+    """Returns hit/miss counters for the semantic answer cache."""
+    cache = get_answer_cache()
+    return {
+        "status": "ok",
+        "enabled": cache is not None,
+        "stats": cache.stats() if cache else None
+    }
+
+
+@router.get("/pdf-pool")
+async def get_pdf_pool_stats():
+    """Returns load and saturation counters of the PDF tool process pool."""
+    return {
+        "status": "ok",
+        "pool": get_pdf_executor().stats()
+    }
+
+
+@router.get("/metrics")
+async def get_latency_metrics():
+    """Returns the latency histograms recorded in this worker process."""
+    return {
+        "status": "ok",
+        "histograms": metrics_snapshot()
+    }
+
+
+@router.get("/vector-gc")
+async def get_vector_gc_report():
+    """Returns the last vector garbage-collection report of this worker process."""
+    return {
+        "status": "ok",
+        "report": get_last_gc_report()
+    }
@@ -1,5 +1,4 @@
 from fastapi import File, UploadFile,Depends,APIRouter,Request,HTTPException,status
-from PyPDF2 import PdfMerger # Ensure this is imported
 from app.database.connection import get_mongo_db
 from app.services.auth_services import get_current_user_or_guest
 from app.integrations.supabase_connect import get_supabase_client,get_pdf_bucket_name
@@ -7,7 +6,8 @@ from fastapi.responses import JSONResponse
 from fastapi import HTTPException
 from datetime import datetime, timedelta
 from io import BytesIO
-from typing import List
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import asyncio
 from bson.objectid import ObjectId
 from fastapi.encoders import jsonable_encoder
 from fastapi import Form
@@ -15,12 +15,163 @@ import fitz  # PyMuPDF
 from app.core.config import settings
 import os
 import json
-from app.utils.compress import compress_pdf_content
+import shutil
+import tempfile
+from app.utils.compress import COMPRESSION_PROFILES, compress_pdf_with_report
 from app.utils.protect import protect_pdf_content
+from app.utils.merge import merge_pdf_files
+from app.services.pdf_executor import get_pdf_executor, PdfExecutorSaturated, PdfJobTimeout
+from app.services.storage_manager import get_storage_uploader
 from app.integrations.supabase_connect import set_supabase_rls_user_context
 
 router = APIRouter()
 
+_SPOOL_CHUNK_BYTES = 1024 * 1024
+
+
+def _saturated_error(e: PdfExecutorSaturated) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail={"status": "error", "message": f"{e}. Please try again shortly."},
+        headers={"Retry-After": "5"}
+    )
+
+
+async def run_pdf_job(operation: str, fn, *args):
+    """Runs a CPU-bound PDF function in the shared process pool, off the event loop."""
+    try:
+        return await get_pdf_executor().run(operation, fn, *args)
+    except PdfExecutorSaturated as e:
+        raise _saturated_error(e)
+    except PdfJobTimeout as e:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail={"status": "error", "message": str(e)}
+        )
+
+
+def spool_upload(upload_file: UploadFile, path: str) -> int:
+    """Copies an upload to ``path`` in fixed-size chunks and returns its size in bytes."""
+    upload_file.file.seek(0)
+    with open(path, "wb") as spooled:
+        shutil.copyfileobj(upload_file.file, spooled, _SPOOL_CHUNK_BYTES)
+        return spooled.tell()
+
+
+def get_public_url(supabase_client, bucket: str, file_path: str) -> str:
+    """Public URL of a stored file, whatever shape this supabase-py version returns."""
+    public = supabase_client.storage.from_(bucket).get_public_url(file_path)
+    public_url = None
+    if isinstance(public, dict):
+        public_url = public.get("publicURL") or public.get("publicUrl") or public.get("public_url")
+    elif isinstance(public, str):
+        public_url = public
+    else:
+        pdata = getattr(public, "data", None)
+        if isinstance(pdata, dict):
+            public_url = pdata.get("publicUrl") or pdata.get("publicURL") or pdata.get("public_url")
+    if not public_url:
+        base = settings.SUPABASE_URL.rstrip("/")
+        public_url = f"{base}/storage/v1/object/public/{bucket}/{file_path}"
+    return public_url
+
+
+async def process_file_batch(
+    files: List[UploadFile],
+    operation: str,
+    fn,
+    fn_args: tuple,
+    path_for: Callable[[UploadFile, int], str],
+    is_valid: Callable[[UploadFile], bool],
+) -> List[Dict[str, Any]]:
+    """
+    Runs ``fn(content, *fn_args)`` for every uploaded file and stores the outputs.
+    ``fn`` returns the output bytes, or ``(bytes, details)`` to attach details
+    to the file's result.
+
+    All files are read up front; transforms then run concurrently in the PDF
+    process pool, at most one per pool worker so a large batch never fills the
+    pool's queue by itself, and each output is uploaded as soon as it is ready,
+    with at most PDF_TOOL_UPLOAD_CONCURRENCY uploads at once. Returns one
+    result per file, in upload order, with its own status, URL or error.
+    Raises 503 if the pool is saturated by other requests.
+    """
+    supabase_client = await get_supabase_client()
+    bucket = get_pdf_bucket_name()
+    executor = get_pdf_executor()
+    job_slots = asyncio.Semaphore(max(1, executor.max_workers))
+    upload_slots = asyncio.Semaphore(max(1, settings.PDF_TOOL_UPLOAD_CONCURRENCY))
+    contents = await asyncio.gather(*(
+        upload_file.read() if is_valid(upload_file) else asyncio.sleep(0, result=None)
+        for upload_file in files
+    ))
+
+    async def process_one(index: int, upload_file: UploadFile, content: Optional[bytes]) -> Dict[str, Any]:
+        result = {"file_name": upload_file.filename, "status": "error", "download_url": None, "error": None}
+        if content is None:
+            result["error"] = "File is not a PDF."
+            return result
+        try:
+            async with job_slots:
+                output = await executor.run(operation, fn, content, *fn_args)
+            if isinstance(output, tuple):
+                output, result["details"] = output
+            file_path = path_for(upload_file, index)
+            async with upload_slots:
+                await get_storage_uploader().upload_async(bucket, file_path, output)
+            result["download_url"] = get_public_url(supabase_client, bucket, file_path)
+            result["status"] = "success"
+        except PdfExecutorSaturated:
+            raise
+        except Exception as e:
+            print(f"Error during PDF {operation} of {upload_file.filename}: {e}")
+            result["error"] = str(e)
+        return result
+
+    tasks = [
+        asyncio.ensure_future(process_one(index, upload_file, content))
+        for index, (upload_file, content) in enumerate(zip(files, contents))
+    ]
+    try:
+        return await asyncio.gather(*tasks)
+    except PdfExecutorSaturated as e:
+        for task in tasks:
+            task.cancel()
+        raise _saturated_error(e)
+
+
+def _batch_file_path(current_user: dict | None, name: str, index: int, batch_size: int) -> str:
+    # Files of one batch share a timestamp, so suffix the index to keep paths unique
+    root, extension = os.path.splitext(name)
+    if batch_size > 1:
+        name = f"{root}_{index + 1}{extension}"
+    owner = current_user['_id'] if current_user else "guest"
+    return f"{owner}/{name}"
+
+
+async def _increment_usage(db, current_user: dict | None):
+    if not current_user:
+        return None
+    updated_user_doc = await db["users"].find_one_and_update(
+        {"_id": ObjectId(current_user['_id'])},
+        {"$inc": {"usage_metrics.pdf_processed_today": 1}},
+        return_document=True
+    )
+    updated_user_doc['_id'] = str(updated_user_doc['_id'])
+    return jsonable_encoder(updated_user_doc)
+
+
+def _batch_status(results: List[Dict[str, Any]], action: str) -> Tuple[str, str]:
+    failed = sum(1 for result in results if result["status"] != "success")
+    if failed == 0:
+        return "success", f"PDFs {action} successfully!"
+    if failed == len(results):
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail={"status": "error", "message": f"No PDFs could be {action}.", "results": results}
+        )
+    return "partial", f"{len(results) - failed} of {len(results)} PDFs {action}; see results for the failures."
+
 
 # Assume router and all dependencies (get_current_user_or_guest, etc.) are defined
 
@@ -37,9 +188,7 @@ async def merge_pdf(
     if current_user and current_user["usage_metrics"]["pdf_processed_today"] >= current_user["usage_metrics"]["pdf_processed_limit_daily"]:
         raise HTTPException(detail={"status":"error", "message":"Daily PDF merge limit exceeded."}, status_code=status.HTTP_403_FORBIDDEN)
 
-    merger = PdfMerger()
-    merged_pdf_stream = BytesIO()
-
+    work_dir = None
     try:
         # --- 1. Filename Logic (Corrected) ---
         # Use the name of the *first* uploaded file as the base for the new filename.
@@ -50,19 +199,24 @@ async def merge_pdf(
             # Provide a default name if the first file has no name
             base_name = "merged_file"
 
-        # --- 2. PDF Merging ---
+        # --- 2. Spool uploads to disk ---
         for upload_file in files:
             if upload_file.content_type != "application/pdf":
                 raise HTTPException(detail={"status":"error", "message":f"File {upload_file.filename} is not a PDF."}, status_code=status.HTTP_400_BAD_REQUEST)
-            
-            file_content = await upload_file.read()
-            merger.append(BytesIO(file_content))
-        
-        merger.write(merged_pdf_stream)
-        merger.close()
-        merged_pdf_stream.seek(0)
-        
-        # --- 3. Supabase Upload (Corrected) ---
+
+        work_dir = await asyncio.to_thread(tempfile.mkdtemp, prefix="pdf-merge-")
+        input_paths = []
+        for index, upload_file in enumerate(files):
+            input_path = os.path.join(work_dir, f"input_{index}.pdf")
+            if await asyncio.to_thread(spool_upload, upload_file, input_path) == 0:
+                raise HTTPException(detail={"status":"error", "message":f"File {upload_file.filename} is empty."}, status_code=status.HTTP_400_BAD_REQUEST)
+            input_paths.append(input_path)
+
+        # --- 3. PDF Merging (in the shared process pool, disk to disk) ---
+        output_path = os.path.join(work_dir, "merged.pdf")
+        await run_pdf_job("merge", merge_pdf_files, input_paths, output_path)
+
+        # --- 4. Supabase Upload (streamed from the merged file) ---
         supabase_client = await get_supabase_client()
         bucket = get_pdf_bucket_name()
         
@@ -74,27 +228,12 @@ async def merge_pdf(
 
         print(f"Uploading to Supabase with path: {file_path}") # For debugging
 
-        # Upload the file, passing the stream object directly
-        supabase_client.storage.from_(bucket).upload(
-            path=file_path, 
-            file=merged_pdf_stream.getvalue(), # Reverted to .getvalue()
-            file_options={"contentType": "application/pdf"}
-        )
+        await get_storage_uploader().upload_async(bucket, file_path, output_path)
         
-        # --- 4. Generate Public URL ---
-        public = supabase_client.storage.from_(bucket).get_public_url(file_path)
-        download_url = None
-        if isinstance(public, dict):
-            download_url = public.get("publicURL") or public.get("publicUrl") or public.get("public_url")
-        else:
-            pdata = getattr(public, "data", None)
-            if isinstance(pdata, dict):
-                download_url = pdata.get("publicUrl") or pdata.get("publicURL") or pdata.get("public_url")
-        if not download_url:
-            base = settings.SUPABASE_URL.rstrip("/")
-            download_url = f"{base}/storage/v1/object/public/{bucket}/{file_path}"
-
-        # --- 5. Update Database ---
+        # --- 5. Generate Public URL ---
+        download_url = get_public_url(supabase_client, bucket, file_path)
+
+        # --- 6. Update Database ---
         updated_user_doc = None
         if current_user:
             updated_user_doc = await db["users"].find_one_and_update(
@@ -117,6 +256,9 @@ async def merge_pdf(
     except Exception as e:
         print(f"Error during PDF merge or upload: {e}")
         raise HTTPException(detail={"status":"error", "message":"An internal error occurred."}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    finally:
+        if work_dir:
+            await asyncio.to_thread(shutil.rmtree, work_dir, True)
 
 
 @router.post("/pdf/compress")
@@ -140,71 +282,42 @@ async def compress_pdf(
             detail={"status": "error", "message": "Daily PDF processing limit exceeded."}
         )
 
-    try:
-        supabase_client = await get_supabase_client()
-        bucket = get_pdf_bucket_name()
-        compressed_urls = []
+    if compression_level not in COMPRESSION_PROFILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"status": "error", "message": f"Compression level must be one of: {', '.join(COMPRESSION_PROFILES)}."}
+        )
 
-        for upload_file in files:
-            if upload_file.content_type != "application/pdf":
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail={"status": "error", "message": f"File {upload_file.filename} is not a PDF."}
-                )
-
-            # Read the PDF file
-            file_content = await upload_file.read()
-            
-            # Compress the PDF
-            compressed_content = compress_pdf_content(file_content, compression_level)
-            
-            # Generate filename and path
-            original_name = upload_file.filename or "compressed_file"
-            base_name = os.path.splitext(original_name)[0]
-            timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
-            
-            if current_user:
-                file_path = f"{current_user['_id']}/{base_name}_compressed_{timestamp}.pdf"
-            else:
-                file_path = f"guest/{base_name}_compressed_{timestamp}.pdf"
-
-            # Upload to Supabase
-            supabase_client.storage.from_(bucket).upload(
-                path=file_path,
-                file=compressed_content,
-                file_options={"contentType": "application/pdf"}
+    for upload_file in files:
+        if upload_file.content_type != "application/pdf":
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail={"status": "error", "message": f"File {upload_file.filename} is not a PDF."}
             )
-            SUPABASE_URL=settings.SUPABASE_URL
-            # Generate public URL
-            public = supabase_client.storage.from_(bucket).get_public_url(file_path)
-            public_url = None
-            if isinstance(public, dict):
-                public_url = public.get("publicURL") or public.get("publicUrl") or public.get("public_url")
-            else:
-                pdata = getattr(public, "data", None)
-                if isinstance(pdata, dict):
-                    public_url = pdata.get("publicUrl") or pdata.get("publicURL") or pdata.get("public_url")
-            if not public_url:
-                base = settings.SUPABASE_URL.rstrip("/")
-                public_url = f"{base}/storage/v1/object/public/{bucket}/{file_path}"
-            compressed_urls.append(public_url)
+
+    try:
+        timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
+
+        def path_for(upload_file: UploadFile, index: int) -> str:
+            base_name = os.path.splitext(upload_file.filename or "compressed_file")[0]
+            return _batch_file_path(current_user, f"{base_name}_compressed_{timestamp}.pdf", index, len(files))
+
+        # Compress all files concurrently and upload each one as soon as it is ready
+        results = await process_file_batch(
+            files, "compress", compress_pdf_with_report, (compression_level,), path_for,
+            is_valid=lambda upload_file: True
+        )
+        batch_status, message = _batch_status(results, "compressed and uploaded")
 
         # Update user usage if logged in
-        updated_user_doc = None
-        if current_user:
-            updated_user_doc = await db["users"].find_one_and_update(
-                {"_id": ObjectId(current_user['_id'])},
-                {"$inc": {"usage_metrics.pdf_processed_today": 1}},
-                return_document=True
-            )
-            updated_user_doc['_id'] = str(updated_user_doc['_id'])
-            updated_user_doc = jsonable_encoder(updated_user_doc)
+        updated_user_doc = await _increment_usage(db, current_user)
 
         return JSONResponse(
             content={
-                "status": "success",
-                "message": "PDFs compressed and uploaded successfully!",
-                "download_urls": compressed_urls,
+                "status": batch_status,
+                "message": message,
+                "download_urls": [result["download_url"] for result in results if result["status"] == "success"],
+                "results": results,
                 "user_usage": updated_user_doc.get('usage_metrics', {}) if updated_user_doc else None
             },
             status_code=status.HTTP_200_OK
@@ -270,68 +383,27 @@ async def protect_pdf(
                 "form_filling": False
             }
 
-        # Process each file
-        # Upload to storage
-        supabase = await get_supabase_client()
-        bucket_name = get_pdf_bucket_name()
-        processed_urls = []
-
-        for file in files:
-            if not file.filename.lower().endswith('.pdf'):
-                continue
-
-            # Read file content
-            file_content = await file.read()
-            
-            # Protect PDF
-            protected_pdf = await protect_pdf_content(file_content, password, permissions_dict)
-            
-            
-            
-            # Generate unique filename
-            if current_user:
-                safe_filename = f"{current_user['_id']}/protected_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{file.filename}"
-            else:
-                safe_filename = f"guest/protected_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{file.filename}"
-            
-            # Upload to Supabase
-            res = supabase.storage.from_(bucket_name).upload(
-                path=safe_filename,
-                file_options={"content-type": "application/pdf"},
-                file=protected_pdf
-            )
-            
-            # Get public URL
-            pub = supabase.storage.from_(bucket_name).get_public_url(safe_filename)
-            public_url = None
-            if isinstance(pub, dict):
-                public_url = pub.get("publicURL") or pub.get("publicUrl") or pub.get("public_url")
-            else:
-                pdata = getattr(pub, "data", None)
-                if isinstance(pdata, dict):
-                    public_url = pdata.get("publicUrl") or pdata.get("publicURL") or pdata.get("public_url")
-            if not public_url:
-                base = settings.SUPABASE_URL.rstrip("/")
-                public_url = f"{base}/storage/v1/object/public/{bucket_name}/{safe_filename}"
-            
-            processed_urls.append(public_url)
-
-         # Update user usage if logged in
-        updated_user_doc = None
-        if current_user:
-            updated_user_doc = await db["users"].find_one_and_update(
-                {"_id": ObjectId(current_user['_id'])},
-                {"$inc": {"usage_metrics.pdf_processed_today": 1}},
-                return_document=True
-            )
-            updated_user_doc['_id'] = str(updated_user_doc['_id'])
-            updated_user_doc = jsonable_encoder(updated_user_doc)
+        timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
+
+        def path_for(upload_file: UploadFile, index: int) -> str:
+            return _batch_file_path(current_user, f"protected_{timestamp}_{upload_file.filename}", index, len(files))
+
+        # Protect all files concurrently and upload each one as soon as it is ready
+        results = await process_file_batch(
+            files, "protect", protect_pdf_content, (password, permissions_dict), path_for,
+            is_valid=lambda upload_file: bool(upload_file.filename) and upload_file.filename.lower().endswith('.pdf')
+        )
+        batch_status, message = _batch_status(results, "protected")
+
+        # Update user usage if logged in
+        updated_user_doc = await _increment_usage(db, current_user)
 
         return JSONResponse(
             content={
-                "status": "success",
-                "message": "PDFs protected successfully!",
-                "download_url": processed_urls,
+                "status": batch_status,
+                "message": message,
+                "download_url": [result["download_url"] for result in results if result["status"] == "success"],
+                "results": results,
                 "user_usage": updated_user_doc.get("usage_metrics", {}) if updated_user_doc else None
             },
             status_code=status.HTTP_200_OK
@@ -54,17 +54,95 @@ class Settings(BaseSettings):
     LLM_MODEL_NAME: str = "gemini-pro" # or "gpt-3.5-turbo" or other
     EMBEDDING_MODEL_NAME: str = "text-embedding-004" # or "text-embedding-ada-002" or "models/text-embedding-004"
 
-    # Pinecone Settings
-    PINECONE_API_KEY: str
-    PINECONE_ENVIRONMENT: str # e.g., "us-east-1"
+    LLM_PROVIDER_MAX_WORKERS: int = 16 # Threads for blocking LLM/embedding SDK calls
+    MODEL_REGISTRY_TTL_SECONDS: int = 3600 # Resolved model names count as stale after this; refreshed in the background every TTL/2
+
+    # Embedding Cache
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_PATH: str = ".cache/embeddings.sqlite3"
+    EMBEDDING_CACHE_MAX_BYTES: int = 512 * 1024 * 1024 # On-disk size before least recently used entries are evicted
+    EMBEDDING_CACHE_MEMORY_ITEMS: int = 10000 # Vectors kept in the in-memory LRU
+
+    # Vector Store Settings
+    VECTOR_STORE_BACKEND: str = "pinecone" # "pinecone" or "local"
+    LOCAL_VECTOR_STORE_PATH: str = ".cache/vectors" # One sub-directory per user-{id} namespace
+    LOCAL_VECTOR_DTYPE: str = "float32" # "float32" or "float16" (half the memory, slightly lower precision)
+    LOCAL_VECTOR_HNSW_MIN_SIZE: int = 50000 # Namespaces at least this large use an HNSW index when hnswlib is installed
+
+    # Pinecone Settings (required when VECTOR_STORE_BACKEND is "pinecone")
+    PINECONE_API_KEY: Optional[str] = None
+    PINECONE_ENVIRONMENT: Optional[str] = None # e.g., "us-east-1"
     PINECONE_INDEX_NAME: str = "pdf-rag-index" # Name of your Pinecone index
+    PINECONE_POOL_THREADS: int = 16 # Threads (and keep-alive connections) for Pinecone requests
+    PINECONE_REQUEST_TIMEOUT_SECONDS: float = 10.0 # Per-call timeout for queries and fetches
+
+    # PDF Text Extraction
+    PDF_TEXT_BACKEND: str = "pypdf" # "pypdf" or "pymupdf" (faster)
+    PDF_EXTRACTION_WORKERS: int = 0 # Processes used for page-parallel extraction, 0 = one per CPU core
+    PDF_PARALLEL_MIN_PAGES: int = 32 # Smaller documents are extracted without the process pool
+
+    # PDF Tools (merge, compress, protect)
+    PDF_TOOL_WORKERS: int = 0 # Processes in the shared PDF tool pool, 0 = one per CPU core
+    PDF_TOOL_MAX_QUEUE_DEPTH: int = 32 # Jobs allowed to wait for a process before requests are rejected with 503
+    PDF_TOOL_TIMEOUT_SECONDS: float = 120.0 # Per-job limit before the request fails with 504
+    PDF_TOOL_UPLOAD_CONCURRENCY: int = 4 # Outputs of one batch uploaded to storage at once
+
+    # Storage Uploads
+    STORAGE_RESUMABLE_THRESHOLD_BYTES: int = 6 * 1024 * 1024 # Larger files use resumable (TUS) uploads
+    STORAGE_UPLOAD_CHUNK_BYTES: int = 6 * 1024 * 1024 # Supabase expects 6 MiB TUS parts
+    STORAGE_UPLOAD_MAX_RETRIES: int = 3 # Per request or part, for network errors, 429 and 5xx
+    STORAGE_UPLOAD_RETRY_BACKOFF_SECONDS: float = 1.0 # Doubled after every failed attempt
+    STORAGE_UPLOAD_TIMEOUT_SECONDS: float = 60.0
 
     # RAG Configuration
     CHUNK_SIZE: int = 1000
     CHUNK_OVERLAP: int = 200
+    CHUNK_LENGTH_UNIT: str = "characters" # "characters" or "tokens"; CHUNK_SIZE/CHUNK_OVERLAP are measured in this unit
+    CHUNK_TOKENIZER_ENCODING: str = "cl100k_base" # tiktoken encoding used when CHUNK_LENGTH_UNIT is "tokens"
+    CHUNK_STORE_PATH: str = ".cache/chunk_store.sqlite3" # Local cache of document_chunks.content, keyed by Pinecone vector ID
+    CHUNK_STORE_BLOCK_SIZE: int = 64 # Chunks per compressed block
+    CHUNK_STORE_COMPRESSION_LEVEL: int = 6 # zstd level
     TOP_K_RETRIEVAL: int = 5 # Number of top relevant chunks to retrieve
+    RETRIEVAL_MODE: str = "hybrid" # Default retrieval: "vector", "lexical" or "hybrid" (overridable per chat request)
+    LEXICAL_INDEX_PATH: str = ".cache/lexical_index.sqlite3" # Per-collection BM25 postings, rebuilt from document_chunks when missing
+    HYBRID_CANDIDATES: int = 20 # Results taken from each retriever before rank fusion
+    RRF_K: int = 60 # Reciprocal-rank fusion constant
+    RERANKER: str = "none" # "none", "lexical" or "cross-encoder" (needs sentence-transformers)
+    RERANKER_MODEL_NAME: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    RERANK_CANDIDATES: int = 50 # Candidates fetched for reranking before trimming to TOP_K_RETRIEVAL
+    RERANK_BATCH_SIZE: int = 16 # (query, passage) pairs scored per batch
+    RERANK_TIMEOUT_SECONDS: float = 0.3 # Hard latency budget; the retrieval order is kept if exceeded
+    RERANK_MAX_WORKERS: int = 2 # Threads running the scorer
+    CONTEXT_PACKING_ENABLED: bool = True # Merge adjacent chunks and drop near-duplicates before building the prompt
+    CONTEXT_TOKEN_BUDGET: int = 3000 # Maximum tokens of retrieved context in the prompt
+    CONTEXT_DEDUP_MAX_HAMMING: int = 3 # SimHash bit distance at or below which two contexts count as duplicates
+    EMBEDDING_DIMENSION: int = 768 # Must match the Pinecone index dimension
+    EMBEDDING_BATCH_SIZE: int = 100 # Texts per embedding provider call (Gemini allows up to 100)
+    EMBEDDING_MAX_CONCURRENT_BATCHES: int = 4 # Embedding batches in flight at once during ingestion
     CONVERSATION_HISTORY_LIMIT: int = 5 # Number of messages to include in conversation history
+    CHAT_WEBSOCKET_ENABLED: bool = False # Expose the WebSocket variant of the streaming chat endpoint at /chat/ws
+
+    # Answer Cache
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = 0.95 # Minimum cosine similarity between query embeddings for a hit
+    ANSWER_CACHE_TTL_SECONDS: int = 3600
+    ANSWER_CACHE_MAX_ENTRIES_PER_COLLECTION: int = 256
+    ANSWER_CACHE_MAX_COLLECTIONS: int = 1024
     
+    # Vector Garbage Collection
+    VECTOR_GC_INTERVAL_SECONDS: int = 86400 # How often vectors are reconciled with document_chunks, 0 = disabled
+    VECTOR_GC_DELETE_ORPHANS: bool = True # Delete vectors whose document no longer exists (others are only reported)
+
+    # Ingestion Queue
+    INGESTION_BACKEND: str = "background" # "background" (in the web process) or "queue" (run by worker.py)
+    INGESTION_QUEUE_PATH: str = ".cache/ingestion_queue.sqlite3"
+    INGESTION_WORKER_PROCESSES: int = 2
+    INGESTION_EXTRACTION_WORKERS: int = 1 # Extraction processes inside each ingestion process, 1 = extract in a thread (no nested pool)
+    INGESTION_VISIBILITY_TIMEOUT_SECONDS: int = 300 # A claimed job is retried if its lease is not renewed in time
+    INGESTION_MAX_ATTEMPTS: int = 3
+    INGESTION_RETRY_BACKOFF_SECONDS: int = 30 # Doubled after every failed attempt
+    INGESTION_POLL_INTERVAL_SECONDS: float = 2.0
+
     # Google OAuth 2.0 Configuration
     GOOGLE_CLIENT_ID: str
     GOOGLE_CLIENT_SECRET: str
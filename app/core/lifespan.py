@@ -1,8 +1,12 @@
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from app.database.connection import connect_to_mongo, close_mongo_connection
-from app.integrations.supabase_connect import initialize_supabase
-from app.integrations.vector_db import initialize_pinecone
+from app.integrations.supabase_connect import initialize_supabase, get_supabase_client
+from app.integrations.vector_db import initialize_vector_store
+from app.integrations.model_registry import model_registry
+from app.services.document_cleanup import run_background_gc
+from app.core.config import settings
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -13,8 +17,16 @@ async def lifespan(app: FastAPI):
     # Startup event
     await connect_to_mongo()
     await initialize_supabase()
-    await initialize_pinecone()
+    await initialize_vector_store()
+    model_refresh_task = asyncio.create_task(model_registry.run_background_refresh())
+    gc_task = None
+    if settings.VECTOR_GC_INTERVAL_SECONDS > 0:
+        gc_task = asyncio.create_task(run_background_gc(
+            get_supabase_client, settings.VECTOR_GC_INTERVAL_SECONDS, settings.VECTOR_GC_DELETE_ORPHANS
+        ))
     yield # Application will run and handle requests here
     # Shutdown event
+    model_refresh_task.cancel()
+    if gc_task is not None:
+        gc_task.cancel()
     await close_mongo_connection()
-    
\ No newline at end of file
@@ -0,0 +1,91 @@
+# app/core/metrics.py
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Union
+
+# Upper bounds in seconds; the last bucket catches everything slower
+DEFAULT_LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram, safe to update from several threads."""
+
+    def __init__(self, name: str, buckets: Optional[List[float]] = None):
+        self.name = name
+        self.buckets = sorted(buckets or DEFAULT_LATENCY_BUCKETS)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._errors = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, error: bool = False) -> None:
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self._sum += seconds
+            if error:
+                self._errors += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.observe(time.perf_counter() - start, error)
+
+    def _quantile(self, q: float, total: int) -> Optional[Union[float, str]]:
+        # Upper bound of the bucket holding the q-th observation. The overflow
+        # bucket is reported as "+Inf": JSON has no infinity.
+        if not total:
+            return None
+        target = q * total
+        running = 0
+        for bound, count in zip(self.buckets, self._counts):
+            running += count
+            if running >= target:
+                return bound
+        return "+Inf"
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            total = sum(self._counts)
+            return {
+                "count": total,
+                "errors": self._errors,
+                "mean_seconds": round(self._sum / total, 4) if total else None,
+                "p50_le_seconds": self._quantile(0.5, total),
+                "p95_le_seconds": self._quantile(0.95, total),
+                "p99_le_seconds": self._quantile(0.99, total),
+                "buckets": {
+                    ("+Inf" if bound == float("inf") else str(bound)): count
+                    for bound, count in zip(self.buckets + [float("inf")], self._counts)
+                },
+            }
+
+
+_histograms: Dict[str, LatencyHistogram] = {}
+_registry_lock = threading.Lock()
+
+
+def get_histogram(name: str) -> LatencyHistogram:
+    """Returns the named process-wide histogram, creating it on first use."""
+    with _registry_lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = LatencyHistogram(name)
+            _histograms[name] = histogram
+        return histogram
+
+
+def metrics_snapshot() -> Dict[str, Any]:
+    """Returns every histogram in the process."""
+    with _registry_lock:
+        histograms = dict(_histograms)
+    return {name: histogram.snapshot() for name, histogram in sorted(histograms.items())}
@@ -21,6 +21,31 @@ def create_collection(
         
     return response.data[0] if response.data else None
 
+def get_collection_by_id(supabase: Client, collection_id: UUID) -> Optional[Dict[str, Any]]:
+    response = supabase.table('collections').select('*').eq('id', str(collection_id)).execute()
+
+    if hasattr(response, 'error') and response.error:
+        raise Exception(f"Supabase error fetching collection: {response.error}")
+
+    return response.data[0] if response.data else None
+
+def delete_collection(supabase: Client, collection_id: UUID) -> None:
+    """Deletes the collection row together with its conversations and their messages."""
+    conversations = get_conversations_by_collection(supabase, collection_id)
+    conversation_ids = [str(conversation['id']) for conversation in conversations]
+    for i in range(0, len(conversation_ids), 100):
+        response = supabase.from_('messages').delete().in_('conversation_id', conversation_ids[i:i + 100]).execute()
+        if hasattr(response, 'error') and response.error:
+            raise Exception(f"Supabase error deleting messages: {response.error}")
+
+    response = supabase.from_('conversations').delete().eq('collection_id', str(collection_id)).execute()
+    if hasattr(response, 'error') and response.error:
+        raise Exception(f"Supabase error deleting conversations: {response.error}")
+
+    response = supabase.table('collections').delete().eq('id', str(collection_id)).execute()
+    if hasattr(response, 'error') and response.error:
+        raise Exception(f"Supabase error deleting collection: {response.error}")
+
 def get_collections_by_user(supabase: Client, user_id: str) -> List[Dict[str, Any]]:
     """
     Get all collections for a user.
@@ -35,15 +60,19 @@ def get_collections_by_user(supabase: Client, user_id: str) -> List[Dict[str, An
 
 # --- Documents CRUD ---
 def create_document(
-    supabase: Client, collection_id: UUID, user_id: str, file_name: str, storage_path: str
+    supabase: Client, collection_id: UUID, user_id: str, file_name: str, storage_path: str,
+    file_hash: Optional[str] = None
 ) -> Dict[str, Any]:
-    response = supabase.table('documents').insert({
+    document = {
         "collection_id": str(collection_id),
         "user_id": user_id,
         "file_name": file_name,
         "storage_path": storage_path,
         "status": "processing"
-    }).execute()
+    }
+    if file_hash:
+        document["file_hash"] = file_hash # sha256 of the PDF bytes
+    response = supabase.table('documents').insert(document).execute()
     
     # Check for errors in the response
     if hasattr(response, 'error') and response.error:
@@ -67,6 +96,76 @@ def update_document_status(
         
     return response.data[0]
 
+def update_document_file(
+    supabase: Client, document_id: UUID, storage_path: str, file_hash: str
+) -> Dict[str, Any]:
+    """Points a document at a revised PDF (used when re-indexing)."""
+    response = (
+        supabase.from_('documents')
+        .update({"storage_path": storage_path, "file_hash": file_hash})
+        .eq('id', str(document_id))
+        .execute()
+    )
+
+    if hasattr(response, 'error') and response.error:
+        raise Exception(f"Supabase error updating document file: {response.error}")
+
+    if not response.data or len(response.data) == 0:
+        raise Exception("No data returned from document file update")
+
+    return response.data[0]
+
+def get_document_by_id(supabase: Client, document_id: UUID) -> Optional[Dict[str, Any]]:
+    response = supabase.table('documents').select('*').eq('id', str(document_id)).execute()
+
+    if hasattr(response, 'error') and response.error:
+        raise Exception(f"Supabase error fetching document: {response.error}")
+
+    return response.data[0] if response.data else None
+
+def get_documents_by_ids(supabase: Client, document_ids: List[str]) -> List[Dict[str, Any]]:
+    results = []
+    # Filter values go in the URL, so look up in batches
+    for i in range(0, len(document_ids), 100):
+        response = supabase.table('documents').select('*').in_('id', document_ids[i:i + 100]).execute()
+        if hasattr(response, 'error') and response.error:
+            raise Exception(f"Supabase error fetching documents: {response.error}")
+        results.extend(response.data or [])
+    return results
+
+def count_documents_by_storage_path(supabase: Client, storage_path: str) -> int:
+    """Number of documents referencing a storage object (deduplicated uploads share one)."""
+    response = supabase.table('documents').select('id', count='exact').eq('storage_path', storage_path).execute()
+
+    if hasattr(response, 'error') and response.error:
+        raise Exception(f"Supabase error counting documents: {response.error}")
+
+    return response.count if response.count is not None else len(response.data or [])
+
+def delete_document(supabase: Client, document_id: UUID) -> None:
+    response = supabase.table('documents').delete().eq('id', str(document_id)).execute()
+
+    if hasattr(response, 'error') and response.error:
+        raise Exception(f"Supabase error deleting document: {response.error}")
+
+def find_document_by_file_hash(
+    supabase: Client, user_id: str, file_hash: str, status: str = "completed"
+) -> List[Dict[str, Any]]:
+    """Returns the user's documents (in any collection) with the given PDF hash and status."""
+    response = (
+        supabase.table('documents')
+        .select('*')
+        .eq('user_id', user_id)
+        .eq('file_hash', file_hash)
+        .eq('status', status)
+        .execute()
+    )
+
+    if hasattr(response, 'error') and response.error:
+        raise Exception(f"Supabase error fetching documents by hash: {response.error}")
+
+    return response.data or []
+
 def get_documents_by_collection(
     supabase: Client, collection_id: UUID
 ) -> List[Dict[str, Any]]:
@@ -77,6 +176,20 @@ def get_documents_by_collection(
         
     return response.data if response.data else []    
 
+def get_collection_document_states(supabase: Client, collection_id: UUID) -> List[Dict[str, Any]]:
+    """Returns the id, status and file_hash of every document in a collection."""
+    response = (
+        supabase.table('documents')
+        .select('id, status, file_hash')
+        .eq('collection_id', str(collection_id))
+        .execute()
+    )
+
+    if hasattr(response, 'error') and response.error:
+        raise Exception(f"Supabase error getting document states: {response.error}")
+
+    return response.data if response.data else []
+
 # --- Document Chunks CRUD ---
 def create_document_chunks(
     supabase: Client, chunks_data: List[Dict[str, Any]]
@@ -86,7 +199,8 @@ def create_document_chunks(
     
     Args:
         supabase: Supabase client
-        chunks_data: List of chunk dictionaries with 'id', 'document_id', and 'chunk_index'
+        chunks_data: List of chunk dictionaries with 'id', 'document_id', 'chunk_index'
+            and optionally 'content' (the chunk text) and 'content_hash' (its sha256)
         
     Returns:
         List of inserted chunks
@@ -100,7 +214,9 @@ def create_document_chunks(
             {
                 'id': str(chunk.get('id')),
                 'document_id': str(chunk.get('document_id')),  # Let Supabase handle UUID conversion
-                'chunk_index': int(chunk.get('chunk_index', 0))
+                'chunk_index': int(chunk.get('chunk_index', 0)),
+                'content': chunk.get('content'),
+                'content_hash': chunk.get('content_hash')
             }
             for chunk in chunks_data
         ]
@@ -126,6 +242,55 @@ def create_document_chunks(
         print(error_msg)  # Log the error for debugging
         raise Exception(error_msg)
 
+def get_document_chunks(
+    supabase: Client, document_id: UUID, include_content: bool = False
+) -> List[Dict[str, Any]]:
+    """Returns the chunk_index and content_hash (and, if asked, the content) of every stored chunk of a document."""
+    page_size = 1000 # PostgREST's default maximum rows per response
+    columns = 'chunk_index, content_hash, content' if include_content else 'chunk_index, content_hash'
+    results = []
+    offset = 0
+    while True:
+        response = (
+            supabase.table('document_chunks')
+            .select(columns)
+            .eq('document_id', str(document_id))
+            .order('chunk_index')
+            .range(offset, offset + page_size - 1)
+            .execute()
+        )
+        if hasattr(response, 'error') and response.error:
+            raise Exception(f"Supabase error fetching document chunks: {response.error}")
+        rows = response.data or []
+        results.extend(rows)
+        if len(rows) < page_size:
+            return results
+        offset += page_size
+
+def delete_document_chunks(
+    supabase: Client, document_id: UUID, chunk_indexes: Optional[List[int]] = None
+) -> None:
+    """Deletes the given chunk rows of a document, or all of them if chunk_indexes is None."""
+    if chunk_indexes is None:
+        response = supabase.table('document_chunks').delete().eq('document_id', str(document_id)).execute()
+        if hasattr(response, 'error') and response.error:
+            raise Exception(f"Supabase error deleting document chunks: {response.error}")
+        return
+
+    # Delete in batches to avoid hitting URL length limits
+    batch_size = 100
+    for i in range(0, len(chunk_indexes), batch_size):
+        batch = chunk_indexes[i:i + batch_size]
+        response = (
+            supabase.table('document_chunks')
+            .delete()
+            .eq('document_id', str(document_id))
+            .in_('chunk_index', batch)
+            .execute()
+        )
+        if hasattr(response, 'error') and response.error:
+            raise Exception(f"Supabase error deleting document chunks: {response.error}")
+
 # --- Conversations CRUD ---
 def create_conversation(
     supabase: Client, user_id: str, collection_id: str, title: Optional[str] = None
@@ -0,0 +1,521 @@
+# app/integrations/local_vector_index.py
+
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from app.integrations.vector_store import VectorMatch, VectorStore
+
+try:
+    import fcntl
+except ImportError: # Windows: writers in other processes are not excluded
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_MANIFEST_NAME = "manifest.json"
+_MAX_SEGMENTS = 32 # More segments than this triggers a full compaction
+_MIN_DEAD_ROWS_FOR_COMPACTION = 1000
+
+
+def _write_json(path: str, data: Dict[str, Any]) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class _Segment:
+    """
+    One immutable batch of writes: new or updated vectors (``<name>.npy``,
+    memory-mapped on load) with their IDs and metadata, and the IDs the batch
+    deleted (``<name>.json``). ``live`` marks rows no later write superseded.
+    """
+
+    def __init__(self, name: str, matrix: Optional[np.ndarray], ids: List[str], metadata: List[Dict[str, Any]], deleted: List[str]):
+        self.name = name
+        self.matrix = matrix
+        self.ids = ids
+        self.metadata = metadata
+        self.deleted = deleted
+        self.live = np.ones(len(ids), dtype=bool)
+        self._columns: Dict[str, np.ndarray] = {}
+
+    @classmethod
+    def load(cls, directory: str, name: str) -> "_Segment":
+        with open(os.path.join(directory, name + ".json"), "r", encoding="utf-8") as f:
+            records = json.load(f)
+        matrix = np.load(os.path.join(directory, name + ".npy"), mmap_mode="r") if records["ids"] else None
+        return cls(name, matrix, records["ids"], records["metadata"], records["deleted"])
+
+    def save(self, directory: str, dtype: np.dtype) -> None:
+        if self.ids:
+            vectors_path = os.path.join(directory, self.name + ".npy")
+            tmp_path = os.path.join(directory, self.name + ".tmp.npy")
+            np.save(tmp_path, self.matrix.astype(dtype, copy=False))
+            os.replace(tmp_path, vectors_path)
+            self.matrix = np.load(vectors_path, mmap_mode="r")
+        _write_json(
+            os.path.join(directory, self.name + ".json"),
+            {"ids": self.ids, "metadata": self.metadata, "deleted": self.deleted}
+        )
+
+    def remove_files(self, directory: str) -> None:
+        for extension in (".npy", ".json"):
+            try:
+                os.remove(os.path.join(directory, self.name + extension))
+            except FileNotFoundError:
+                pass
+
+    @property
+    def live_count(self) -> int:
+        return int(self.live.sum())
+
+    def column(self, key: str) -> np.ndarray:
+        column = self._columns.get(key)
+        if column is None:
+            column = np.array([meta.get(key) for meta in self.metadata], dtype=object)
+            self._columns[key] = column
+        return column
+
+
+class _Namespace:
+    """
+    Vectors and metadata of one namespace, persisted in its own directory.
+
+    Vectors are L2-normalised (so a dot product is the cosine similarity).
+    Every write appends a segment and then atomically replaces
+    ``manifest.json``, the list of segments that make up the namespace, so
+    readers never see half a write. Trailing segments of similar size are
+    merged (each row is rewritten O(log n) times), and a full compaction
+    drops superseded rows once they outnumber the live ones.
+
+    Several processes (web workers, the ingestion worker) can share a
+    directory: writers take an exclusive file lock, and every operation
+    first picks up segments another process added since the last one.
+    """
+
+    def __init__(self, directory: str, dtype: str, hnsw_min_size: int):
+        self.directory = directory
+        self.dtype = np.dtype(dtype)
+        self.hnsw_min_size = hnsw_min_size
+        self.lock = threading.RLock()
+        self._manifest_path = os.path.join(directory, _MANIFEST_NAME)
+        self._manifest_stamp = None
+        os.makedirs(directory, exist_ok=True)
+        self._reset()
+        with self.lock:
+            self._refresh()
+
+    def _reset(self) -> None:
+        self.segments: List[_Segment] = []
+        self.location: Dict[str, Tuple[int, int]] = {} # Vector ID -> (segment, row) of its live row
+        self.dim = 0
+        self._dead = 0
+        self._next_segment = 0
+        # HNSW labels are per vector, not per row, so merging segments keeps the index valid
+        self._hnsw = None
+        self._hnsw_label_of: Dict[str, int] = {}
+        self._hnsw_ids: List[str] = []
+
+    @contextmanager
+    def _write_lock(self):
+        with self.lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.directory, ".lock"), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _stamp(self):
+        try:
+            stat = os.stat(self._manifest_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _refresh(self) -> None:
+        """Brings the in-memory view up to the manifest on disk; cheap when nothing changed."""
+        for _ in range(3):
+            stamp = self._stamp()
+            if stamp is not None and stamp == self._manifest_stamp:
+                return
+            try:
+                if stamp is None:
+                    manifest = {"segments": [], "next_segment": 0}
+                else:
+                    with open(self._manifest_path, "r", encoding="utf-8") as f:
+                        manifest = json.load(f)
+                names = manifest["segments"]
+                loaded = [segment.name for segment in self.segments]
+                if names[:len(loaded)] == loaded:
+                    for name in names[len(loaded):]:
+                        self._apply(_Segment.load(self.directory, name))
+                else:
+                    # Another process merged segments
+                    self._reload(names)
+                self._next_segment = manifest["next_segment"]
+                self._manifest_stamp = stamp
+                return
+            except FileNotFoundError:
+                # A compaction removed a segment while we were reading; read the new manifest
+                self._reset()
+                self._manifest_stamp = None
+        raise RuntimeError(f"Could not load vector namespace {self.directory}")
+
+    def _reload(self, names: List[str]) -> None:
+        """
+        Rebuilds the view from ``names``, reusing segments already in memory and,
+        where the vectors did not change, the HNSW index.
+        """
+        cached = {segment.name: segment for segment in self.segments}
+        hnsw, label_of, hnsw_ids = self._hnsw, self._hnsw_label_of, self._hnsw_ids
+        self._reset()
+        fresh = []
+        for name in names:
+            segment = cached.get(name)
+            if segment is None:
+                segment = _Segment.load(self.directory, name)
+                fresh.append(segment)
+            else:
+                segment.live[:] = True
+            self._apply(segment)
+        if hnsw is None:
+            return
+
+        self._hnsw, self._hnsw_label_of, self._hnsw_ids = hnsw, label_of, hnsw_ids
+        for vector_id in [vector_id for vector_id in label_of if vector_id not in self.location]:
+            hnsw.mark_deleted(label_of.pop(vector_id))
+        for segment in fresh:
+            rows = np.flatnonzero(segment.live)
+            known = [(int(row), label_of[segment.ids[int(row)]]) for row in rows if segment.ids[int(row)] in label_of]
+            if known:
+                known_rows = [row for row, _ in known]
+                indexed = np.asarray(hnsw.get_items([label for _, label in known]), dtype=np.float32)
+                current = np.asarray(segment.matrix[known_rows], dtype=np.float32)
+                for (row, label), same in zip(known, np.isclose(indexed, current, atol=1e-3).all(axis=1)):
+                    if not same:
+                        hnsw.mark_deleted(label_of.pop(segment.ids[row]))
+            self._hnsw_add(segment, [int(row) for row in rows if segment.ids[int(row)] not in label_of])
+
+    def _new_segment_name(self) -> str:
+        name = f"seg-{self._next_segment:08d}"
+        self._next_segment += 1
+        return name
+
+    def _apply(self, segment: _Segment, index_in_hnsw: bool = True) -> None:
+        if segment.matrix is not None:
+            if self.dim and segment.matrix.shape[1] != self.dim:
+                raise ValueError(f"Vector dimension {segment.matrix.shape[1]} does not match namespace dimension {self.dim}")
+            self.dim = segment.matrix.shape[1]
+
+        position = len(self.segments)
+        for vector_id in segment.deleted:
+            previous = self.location.pop(vector_id, None)
+            if previous is not None:
+                self._supersede(previous, segment)
+        for row, vector_id in enumerate(segment.ids):
+            previous = self.location.get(vector_id)
+            if previous is not None:
+                self._supersede(previous, segment)
+            self.location[vector_id] = (position, row)
+        self.segments.append(segment)
+
+        if self._hnsw is not None and index_in_hnsw:
+            self._hnsw_add(segment, np.flatnonzero(segment.live))
+
+    def _supersede(self, location: Tuple[int, int], segment: _Segment) -> None:
+        position, row = location
+        owner = segment if position == len(self.segments) else self.segments[position]
+        owner.live[row] = False
+        self._dead += 1
+        if self._hnsw is not None:
+            label = self._hnsw_label_of.pop(owner.ids[row], None)
+            if label is not None:
+                self._hnsw.mark_deleted(label)
+
+    def _hnsw_add(self, segment: _Segment, rows) -> None:
+        rows = np.asarray(rows, dtype=np.int64)
+        if not rows.size:
+            return
+        start = len(self._hnsw_ids)
+        if start + rows.size > self._hnsw.get_max_elements():
+            self._hnsw.resize_index(max(start + rows.size, 2 * self._hnsw.get_max_elements()))
+        self._hnsw.add_items(np.asarray(segment.matrix[rows], dtype=np.float32), np.arange(start, start + rows.size))
+        for offset, row in enumerate(rows):
+            vector_id = segment.ids[int(row)]
+            self._hnsw_label_of[vector_id] = start + offset
+            self._hnsw_ids.append(vector_id)
+
+    def _hnsw_index(self):
+        # Superseded vectors still take up slots; rebuild once they are the majority
+        if self._hnsw is not None and len(self._hnsw_ids) > 2 * len(self._hnsw_label_of):
+            self._hnsw = None
+        if self._hnsw is None:
+            try:
+                import hnswlib # pip install hnswlib
+            except ImportError:
+                return None
+            index = hnswlib.Index(space="ip", dim=self.dim)
+            index.init_index(max_elements=max(1, len(self.location)), ef_construction=200, M=16)
+            index.set_ef(128)
+            self._hnsw = index
+            self._hnsw_label_of = {}
+            self._hnsw_ids = []
+            for segment in self.segments:
+                self._hnsw_add(segment, np.flatnonzero(segment.live))
+        return self._hnsw
+
+    def _commit(self, segment: _Segment) -> None:
+        """Saves a new segment, compacts if due and publishes the result in the manifest."""
+        try:
+            segment.save(self.directory, self.dtype)
+            self._apply(segment)
+            removed = self._compact()
+            _write_json(
+                self._manifest_path,
+                {"segments": [s.name for s in self.segments], "next_segment": self._next_segment}
+            )
+        except Exception:
+            # Memory may now be ahead of the manifest; reload from disk on next use
+            self._reset()
+            self._manifest_stamp = None
+            raise
+        self._manifest_stamp = self._stamp()
+        for old in removed:
+            old.remove_files(self.directory)
+
+    def _compact(self) -> List[_Segment]:
+        """Merges trailing segments of similar size, or everything when due. Returns the replaced segments."""
+        if len(self.segments) > _MAX_SEGMENTS or self._dead > max(len(self.location), _MIN_DEAD_ROWS_FOR_COMPACTION):
+            start = 0
+        else:
+            weights = [segment.live_count + len(segment.deleted) + 1 for segment in self.segments]
+            start = len(self.segments) - 1
+            tail = weights[start]
+            while start > 0 and tail * 2 >= weights[start - 1]:
+                start -= 1
+                tail += weights[start]
+            if start == len(self.segments) - 1:
+                return []
+
+        tail_segments = self.segments[start:]
+        ids: List[str] = []
+        metadata: List[Dict[str, Any]] = []
+        parts = []
+        for segment in tail_segments:
+            rows = np.flatnonzero(segment.live)
+            if rows.size:
+                parts.append(np.asarray(segment.matrix[rows], dtype=np.float32))
+                ids.extend(segment.ids[int(row)] for row in rows)
+                metadata.extend(segment.metadata[int(row)] for row in rows)
+        # Deletions only matter for rows in earlier segments, which a full compaction has none of
+        deleted = [] if start == 0 else sorted({vector_id for s in tail_segments for vector_id in s.deleted} - set(ids))
+        merged = _Segment(self._new_segment_name(), np.vstack(parts) if parts else None, ids, metadata, deleted)
+        merged.save(self.directory, self.dtype)
+
+        # Swap the tail for the merged segment; the vectors are unchanged, so HNSW is too
+        for vector_id in ids:
+            del self.location[vector_id]
+        self._dead -= sum(len(segment.ids) - segment.live_count for segment in tail_segments)
+        self.segments = self.segments[:start]
+        self._apply(merged, index_in_hnsw=False)
+        return tail_segments
+
+    def upsert(self, vectors: List[Dict[str, Any]]) -> None:
+        values = np.asarray([vector["values"] for vector in vectors], dtype=np.float32)
+        norms = np.linalg.norm(values, axis=1, keepdims=True)
+        values = values / np.where(norms == 0, 1, norms)
+
+        with self._write_lock():
+            self._refresh()
+            if self.dim and self.dim != values.shape[1]:
+                raise ValueError(f"Vector dimension {values.shape[1]} does not match namespace dimension {self.dim}")
+            self._commit(_Segment(
+                self._new_segment_name(),
+                values,
+                [vector["id"] for vector in vectors],
+                [vector.get("metadata") or {} for vector in vectors],
+                []
+            ))
+
+    def delete(self, ids: List[str]) -> int:
+        with self._write_lock():
+            self._refresh()
+            present = [vector_id for vector_id in dict.fromkeys(ids) if vector_id in self.location]
+            if not present:
+                return 0
+            self._commit(_Segment(self._new_segment_name(), None, [], [], present))
+            return len(present)
+
+    def _segment_mask(self, segment: _Segment, metadata_filter: Optional[Dict[str, Any]]) -> np.ndarray:
+        mask = segment.live.copy()
+        for key, condition in (metadata_filter or {}).items():
+            column = segment.column(key)
+            if isinstance(condition, dict):
+                if "$eq" in condition:
+                    mask &= column == condition["$eq"]
+                elif "$in" in condition:
+                    mask &= np.isin(column, list(condition["$in"]))
+                else:
+                    raise ValueError(f"Unsupported filter operator for '{key}': {condition}")
+            else:
+                mask &= column == condition
+        return mask
+
+    def query(self, vector: List[float], top_k: int, metadata_filter: Optional[Dict[str, Any]]):
+        with self.lock:
+            self._refresh()
+            if not self.location:
+                return []
+            query = np.asarray(vector, dtype=np.float32)
+            query = query / (np.linalg.norm(query) or 1)
+            allowed = [self._segment_mask(segment, metadata_filter) for segment in self.segments]
+            candidates = sum(int(mask.sum()) for mask in allowed)
+            if candidates == 0:
+                return []
+            top_k = min(top_k, candidates)
+
+            if len(self.location) >= self.hnsw_min_size:
+                index = self._hnsw_index()
+                if index is not None:
+                    def is_allowed(label: int) -> bool:
+                        location = self.location.get(self._hnsw_ids[label])
+                        return location is not None and bool(allowed[location[0]][location[1]])
+
+                    try:
+                        labels, distances = index.knn_query(
+                            query, k=top_k, filter=is_allowed if metadata_filter else None
+                        )
+                        # "ip" distance is 1 - dot product
+                        return [
+                            self._result(self.location[self._hnsw_ids[int(label)]], 1.0 - float(distance))
+                            for label, distance in zip(labels[0], distances[0])
+                        ]
+                    except RuntimeError as e:
+                        # Too few reachable neighbours under the filter, fall back to exact search
+                        logger.debug(f"HNSW query fell back to brute force: {e}")
+
+            # Exact search: one matrix-vector product per segment over its allowed rows
+            found_scores, found_locations = [], []
+            for position, (segment, mask) in enumerate(zip(self.segments, allowed)):
+                rows = np.flatnonzero(mask)
+                if not rows.size:
+                    continue
+                scores = np.asarray(segment.matrix[rows] @ query.astype(segment.matrix.dtype), dtype=np.float32)
+                if scores.size > top_k:
+                    best = np.argpartition(-scores, top_k - 1)[:top_k]
+                    rows, scores = rows[best], scores[best]
+                found_scores.append(scores)
+                found_locations.extend((position, int(row)) for row in rows)
+            scores = np.concatenate(found_scores)
+            best = np.argsort(-scores)[:top_k]
+            return [self._result(found_locations[int(i)], float(scores[i])) for i in best]
+
+    def _result(self, location: Tuple[int, int], score: float):
+        segment = self.segments[location[0]]
+        return segment.ids[location[1]], score, segment.metadata[location[1]]
+
+    def fetch_metadata(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        with self.lock:
+            self._refresh()
+            results = {}
+            for vector_id in ids:
+                location = self.location.get(vector_id)
+                if location is not None:
+                    results[vector_id] = dict(self.segments[location[0]].metadata[location[1]])
+            return results
+
+    def fetch_vectors(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        with self.lock:
+            self._refresh()
+            results = {}
+            for vector_id in ids:
+                location = self.location.get(vector_id)
+                if location is not None:
+                    segment = self.segments[location[0]]
+                    results[vector_id] = {
+                        "values": np.asarray(segment.matrix[location[1]], dtype=np.float32).tolist(),
+                        "metadata": dict(segment.metadata[location[1]])
+                    }
+            return results
+
+    def list_ids(self, prefix: Optional[str] = None) -> List[str]:
+        with self.lock:
+            self._refresh()
+            return [vector_id for vector_id in self.location if not prefix or vector_id.startswith(prefix)]
+
+
+class LocalVectorStore(VectorStore):
+    """
+    Vector store on the local disk: segmented, memory-mapped matrices per
+    namespace, exact NumPy search, and an HNSW index (if ``hnswlib`` is
+    installed) for namespaces with at least ``hnsw_min_size`` vectors.
+    Safe to share between the web and ingestion worker processes of one host.
+    All work runs off the event loop.
+    """
+
+    def __init__(self, root: str, dtype: str = "float32", hnsw_min_size: int = 50000):
+        self.root = root
+        self.dtype = dtype
+        self.hnsw_min_size = hnsw_min_size
+        self._namespaces: Dict[str, _Namespace] = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _namespace(self, namespace: str) -> _Namespace:
+        with self._lock:
+            ns = self._namespaces.get(namespace)
+            if ns is None:
+                safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", namespace)
+                ns = _Namespace(os.path.join(self.root, safe_name), self.dtype, self.hnsw_min_size)
+                self._namespaces[namespace] = ns
+            return ns
+
+    async def _run(self, namespace: str, method: str, *args):
+        return await asyncio.to_thread(lambda: getattr(self._namespace(namespace), method)(*args))
+
+    async def upsert(self, namespace: str, vectors: List[Dict[str, Any]]) -> None:
+        if vectors:
+            await self._run(namespace, "upsert", vectors)
+
+    async def query(self, namespace, vector, top_k, filter=None, include_metadata=True) -> List[VectorMatch]:
+        results = await self._run(namespace, "query", vector, top_k, filter)
+        return [
+            VectorMatch(id=vector_id, score=score, metadata=dict(metadata) if include_metadata else None)
+            for vector_id, score, metadata in results
+        ]
+
+    async def fetch_metadata(self, namespace: str, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        return await self._run(namespace, "fetch_metadata", ids)
+
+    async def fetch_vectors(self, namespace: str, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        return await self._run(namespace, "fetch_vectors", ids)
+
+    async def delete(self, namespace: str, ids: List[str]) -> int:
+        return await self._run(namespace, "delete", ids)
+
+    async def list_ids(self, namespace: str, prefix: Optional[str] = None) -> List[str]:
+        return await self._run(namespace, "list_ids", prefix)
+
+    async def list_namespaces(self) -> List[str]:
+        # Directory names are the sanitised namespace names, which for user-{id} are unchanged
+        def scan():
+            with self._lock:
+                loaded = set(self._namespaces)
+            on_disk = {name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name))}
+            return sorted(loaded | on_disk)
+
+        return await asyncio.to_thread(scan)
@@ -0,0 +1,180 @@
+# app/integrations/model_registry.py
+
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import google.generativeai as genai
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GOOGLE_EMBEDDING_MODEL = "models/text-embedding-004"
+_MIN_RETRY_BACKOFF_SECONDS = 5.0
+
+
+class ModelRegistry:
+    """
+    Resolves the chat and embedding model names once per process.
+
+    ``genai.list_models()`` is a network call, so its result is cached and
+    refreshed every ``ttl_seconds / 2`` by a background task started in the
+    app lifespan, well before it goes stale. Request paths never wait on a
+    refresh once names are resolved: a stale cache is served while a single
+    background thread refreshes it. Only the very first resolution blocks,
+    and then only one caller makes the call. Failed refreshes are retried
+    with exponential backoff instead of on every request.
+    """
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock() # Held by whoever is calling list_models
+        self._chat_model: Optional[str] = None
+        self._embedding_model: Optional[str] = None
+        self._resolved_at: Optional[float] = None
+        self._last_error: Optional[str] = None
+        self._retry_at = 0.0
+        self._retry_backoff = _MIN_RETRY_BACKOFF_SECONDS
+
+    def _is_stale(self) -> bool:
+        return self._resolved_at is None or time.monotonic() - self._resolved_at > self.ttl_seconds
+
+    def _may_retry(self) -> bool:
+        return time.monotonic() >= self._retry_at
+
+    def refresh(self) -> None:
+        """Lists the provider's models and re-resolves the configured names."""
+        with self._refresh_lock:
+            self._refresh_locked()
+
+    def _refresh_locked(self) -> None:
+        if not settings.GOOGLE_API_KEY:
+            # Nothing to resolve for non-Google providers, use the configured names as-is
+            with self._lock:
+                self._chat_model = settings.LLM_MODEL_NAME
+                self._embedding_model = settings.EMBEDDING_MODEL_NAME
+                self._resolved_at = time.monotonic()
+            return
+
+        try:
+            models = list(genai.list_models())
+        except Exception as e:
+            # Keep serving the previously resolved (or configured) names and back off
+            with self._lock:
+                self._last_error = str(e)
+                self._retry_at = time.monotonic() + self._retry_backoff
+                logger.error(f"Failed to list Google models, retrying in {self._retry_backoff}s: {e}")
+                self._retry_backoff = min(self._retry_backoff * 2, max(self.ttl_seconds, _MIN_RETRY_BACKOFF_SECONDS))
+            return
+
+        chat_models = [m.name for m in models if 'generateContent' in m.supported_generation_methods]
+        embedding_models = [m.name for m in models if 'embedContent' in m.supported_generation_methods]
+
+        with self._lock:
+            self._chat_model = _pick_chat_model(chat_models)
+            self._embedding_model = _pick_embedding_model(embedding_models)
+            self._resolved_at = time.monotonic()
+            self._last_error = None
+            self._retry_at = 0.0
+            self._retry_backoff = _MIN_RETRY_BACKOFF_SECONDS
+        logger.info(f"Model registry resolved chat={self._chat_model} embedding={self._embedding_model}")
+
+    def _refresh_in_background(self) -> None:
+        # Single flight: skip if a refresh is already running
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self._refresh_locked()
+            finally:
+                self._refresh_lock.release()
+
+        threading.Thread(target=run, name="model-registry-refresh", daemon=True).start()
+
+    def _ensure_resolved(self) -> None:
+        if self._resolved_at is not None:
+            # Serve what we have; the background task normally refreshes long before this
+            if self._is_stale() and self._may_retry():
+                self._refresh_in_background()
+            return
+        if not self._may_retry():
+            return # Recent failure, fall back to the configured names until the backoff passes
+        with self._refresh_lock:
+            # Another caller may have resolved (or failed) while we waited
+            if self._resolved_at is None and self._may_retry():
+                self._refresh_locked()
+
+    def get_chat_model(self) -> str:
+        """Returns the chat model name (without the ``models/`` prefix)."""
+        self._ensure_resolved()
+        return self._chat_model or settings.LLM_MODEL_NAME
+
+    def get_embedding_model(self) -> str:
+        """Returns the embedding model name to pass to ``genai.embed_content``."""
+        self._ensure_resolved()
+        return self._embedding_model or DEFAULT_GOOGLE_EMBEDDING_MODEL
+
+    async def run_background_refresh(self) -> None:
+        """Refreshes the registry every ``ttl_seconds / 2`` (sooner after a failure) until cancelled."""
+        interval = max(1.0, self.ttl_seconds / 2)
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self.refresh)
+            except Exception as e:
+                logger.error(f"Model registry refresh failed: {e}")
+            delay = interval
+            if self._retry_at:
+                delay = min(interval, max(1.0, self._retry_at - time.monotonic()))
+            await asyncio.sleep(delay)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Returns the resolved models for the health endpoint."""
+        with self._lock:
+            age = None if self._resolved_at is None else time.monotonic() - self._resolved_at
+            return {
+                "chat_model": self._chat_model,
+                "embedding_model": self._embedding_model,
+                "configured_chat_model": settings.LLM_MODEL_NAME,
+                "configured_embedding_model": settings.EMBEDDING_MODEL_NAME,
+                "age_seconds": round(age, 1) if age is not None else None,
+                "ttl_seconds": self.ttl_seconds,
+                "last_error": self._last_error,
+                "checked_at": datetime.utcnow().isoformat(),
+            }
+
+
+def _pick_chat_model(available_models: List[str]) -> str:
+    # Format the configured model
+    configured_model = settings.LLM_MODEL_NAME
+    if not configured_model.startswith("models/"):
+        configured_model = f"models/{configured_model}"
+
+    eval_model = settings.LLM_MODEL_NAME
+    if configured_model not in available_models:
+        # Fallback to the first available chat model, preferring flash models
+        flash_models = [m for m in available_models if "flash" in m]
+        if flash_models:
+            eval_model = flash_models[0].replace("models/", "")
+        elif available_models:
+            eval_model = available_models[0].replace("models/", "")
+        print(f"Configured model {settings.LLM_MODEL_NAME} not found. Falling back to {eval_model}")
+    return eval_model
+
+
+def _pick_embedding_model(available_models: List[str]) -> str:
+    # Prefer the configured model when it is actually available to prevent 404s
+    configured_model = settings.EMBEDDING_MODEL_NAME
+    if not configured_model.startswith("models/"):
+        configured_model = f"models/{configured_model}"
+    if configured_model in available_models:
+        return configured_model
+    return available_models[0] if available_models else DEFAULT_GOOGLE_EMBEDDING_MODEL
+
+
+model_registry = ModelRegistry(settings.MODEL_REGISTRY_TTL_SECONDS)
@@ -47,12 +47,27 @@ async def initialize_pinecone():
 
         # 3. Connect to the specific index
         # Access the index object using the client
-        pinecone_index_instance = pinecone_client.Index(name=settings.PINECONE_INDEX_NAME)
+        # Size the client's keep-alive connection pool to match the thread pool
+        # that issues requests, so concurrent queries reuse connections
+        pinecone_index_instance = pinecone_client.Index(
+            name=settings.PINECONE_INDEX_NAME,
+            pool_threads=settings.PINECONE_POOL_THREADS,
+            connection_pool_maxsize=settings.PINECONE_POOL_THREADS
+        )
         print("✅ Pinecone client initialized successfully and connected to index.")
     except Exception as e:
         print(f"❌ Error initializing Pinecone client: {e}")
         raise RuntimeError(f"Failed to initialize Pinecone: {e}")
 
+async def initialize_vector_store():
+    """Initializes the backend selected by VECTOR_STORE_BACKEND."""
+    if settings.VECTOR_STORE_BACKEND == "pinecone":
+        await initialize_pinecone()
+    else:
+        from app.integrations.vector_store import get_vector_store
+        get_vector_store()
+        print(f"✅ Using {settings.VECTOR_STORE_BACKEND} vector store.")
+
 async def get_pinecone_index():
     """Returns the initialized Pinecone index instance."""
     if pinecone_index_instance is None:
@@ -0,0 +1,179 @@
+# app/integrations/vector_store.py
+
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+import asyncio
+import time
+
+from app.core.config import settings
+from app.core.metrics import get_histogram
+from app.integrations.vector_db import get_pinecone_index
+
+
+@dataclass
+class VectorMatch:
+    """A single query result, shaped like a Pinecone match (id, score, metadata)."""
+    id: str
+    score: float
+    metadata: Optional[Dict[str, Any]] = field(default=None)
+
+
+class VectorStore(ABC):
+    """
+    Interface every vector backend implements.
+
+    Namespaces isolate users (``user-{id}``); ``filter`` uses Pinecone's
+    metadata filter syntax (equality, ``$eq`` and ``$in``).
+    """
+
+    @abstractmethod
+    async def upsert(self, namespace: str, vectors: List[Dict[str, Any]]) -> None:
+        ...
+
+    @abstractmethod
+    async def query(
+        self,
+        namespace: str,
+        vector: List[float],
+        top_k: int,
+        filter: Optional[Dict[str, Any]] = None,
+        include_metadata: bool = True
+    ) -> List[VectorMatch]:
+        ...
+
+    @abstractmethod
+    async def fetch_metadata(self, namespace: str, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def fetch_vectors(self, namespace: str, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Returns ``{id: {"values": [...], "metadata": {...}}}`` for the IDs that exist."""
+
+    @abstractmethod
+    async def delete(self, namespace: str, ids: List[str]) -> int:
+        """Deletes vectors by ID. Returns the number removed (for Pinecone, the number requested)."""
+
+    @abstractmethod
+    async def list_ids(self, namespace: str, prefix: Optional[str] = None) -> List[str]:
+        """Returns every vector ID in the namespace, optionally only those starting with ``prefix``."""
+
+    @abstractmethod
+    async def list_namespaces(self) -> List[str]:
+        ...
+
+
+class PineconeVectorStore(VectorStore):
+    """
+    Vector store backed by the shared Pinecone index.
+
+    The Pinecone client is synchronous, so every call runs on a dedicated,
+    sized thread pool (never on the event loop or the default executor),
+    with a per-call timeout and a latency histogram per operation.
+    """
+
+    def __init__(self, max_workers: int, timeout_seconds: float):
+        self.timeout_seconds = timeout_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pinecone")
+
+    async def _call(self, operation: str, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        histogram = get_histogram(f"pinecone.{operation}")
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(
+                loop.run_in_executor(self._executor, fn),
+                timeout=timeout or self.timeout_seconds
+            )
+        except Exception:
+            histogram.observe(time.perf_counter() - start, error=True)
+            raise
+        histogram.observe(time.perf_counter() - start)
+        return result
+
+    async def upsert(self, namespace: str, vectors: List[Dict[str, Any]]) -> None:
+        pinecone_index = await get_pinecone_index()
+        # The Pinecone client's upsert method handles batch operations efficiently.
+        # Large documents take several requests, so allow more time per vector batch.
+        await self._call(
+            "upsert",
+            lambda: pinecone_index.upsert(vectors=vectors, namespace=namespace, batch_size=100),
+            timeout=self.timeout_seconds * max(1, len(vectors) // 100)
+        )
+
+    async def query(self, namespace, vector, top_k, filter=None, include_metadata=True) -> List[VectorMatch]:
+        pinecone_index = await get_pinecone_index()
+        response = await self._call("query", lambda: pinecone_index.query(
+            vector=vector,
+            top_k=top_k,
+            include_metadata=include_metadata,
+            namespace=namespace,
+            filter=filter
+        ))
+        return [VectorMatch(id=match.id, score=match.score, metadata=match.metadata) for match in response.matches]
+
+    async def fetch_metadata(self, namespace: str, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        pinecone_index = await get_pinecone_index()
+        response = await self._call("fetch", lambda: pinecone_index.fetch(ids=ids, namespace=namespace))
+        return {vector_id: (vector.metadata or {}) for vector_id, vector in response.vectors.items()}
+
+    async def fetch_vectors(self, namespace: str, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        pinecone_index = await get_pinecone_index()
+        vectors = {}
+        # IDs go in the query string, so fetch in modest batches
+        for i in range(0, len(ids), 100):
+            batch = ids[i:i + 100]
+            response = await self._call("fetch", lambda batch=batch: pinecone_index.fetch(ids=batch, namespace=namespace))
+            for vector_id, vector in response.vectors.items():
+                vectors[vector_id] = {"values": list(vector.values), "metadata": vector.metadata or {}}
+        return vectors
+
+    async def delete(self, namespace: str, ids: List[str]) -> int:
+        pinecone_index = await get_pinecone_index()
+        # Pinecone accepts at most 1000 IDs per delete request
+        for i in range(0, len(ids), 1000):
+            batch = ids[i:i + 1000]
+            await self._call("delete", lambda batch=batch: pinecone_index.delete(ids=batch, namespace=namespace))
+        return len(ids)
+
+    async def list_ids(self, namespace: str, prefix: Optional[str] = None) -> List[str]:
+        # Paginated ID listing is only available on serverless indexes
+        pinecone_index = await get_pinecone_index()
+        kwargs = {"namespace": namespace}
+        if prefix:
+            kwargs["prefix"] = prefix
+        return await self._call(
+            "list",
+            lambda: [vector_id for page in pinecone_index.list(**kwargs) for vector_id in page],
+            timeout=self.timeout_seconds * 30
+        )
+
+    async def list_namespaces(self) -> List[str]:
+        pinecone_index = await get_pinecone_index()
+        stats = await self._call("describe_index_stats", lambda: pinecone_index.describe_index_stats())
+        return list(stats.namespaces.keys())
+
+
+_vector_store: Optional[VectorStore] = None
+
+
+def get_vector_store() -> VectorStore:
+    """Returns the vector store selected by VECTOR_STORE_BACKEND ("pinecone" or "local")."""
+    global _vector_store
+    if _vector_store is None:
+        if settings.VECTOR_STORE_BACKEND == "local":
+            from app.integrations.local_vector_index import LocalVectorStore
+            _vector_store = LocalVectorStore(
+                settings.LOCAL_VECTOR_STORE_PATH,
+                dtype=settings.LOCAL_VECTOR_DTYPE,
+                hnsw_min_size=settings.LOCAL_VECTOR_HNSW_MIN_SIZE
+            )
+        elif settings.VECTOR_STORE_BACKEND == "pinecone":
+            _vector_store = PineconeVectorStore(
+                max_workers=settings.PINECONE_POOL_THREADS,
+                timeout_seconds=settings.PINECONE_REQUEST_TIMEOUT_SECONDS
+            )
+        else:
+            raise ValueError(f"Unsupported vector store backend: {settings.VECTOR_STORE_BACKEND}")
+    return _vector_store
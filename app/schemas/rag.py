@@ -1,7 +1,7 @@
 # app/schemas/rag.py (New file)
 
 from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal
 from datetime import datetime
 from uuid import UUID
 
@@ -42,6 +42,7 @@ class DocumentInDB(DocumentBase):
     user_id: str
     storage_path: str
     uploaded_at: datetime
+    file_hash: Optional[str] = None # sha256 of the PDF bytes, used to deduplicate uploads
 
     class Config:
         from_attributes = True
@@ -64,6 +65,7 @@ class DocumentChunkInDB(BaseModel):
     id: UUID # This is the Pinecone vector ID
     document_id: UUID
     chunk_index: int
+    content_hash: Optional[str] = None # sha256 of the chunk text, used for incremental re-indexing
     created_at: datetime
 
     class Config:
@@ -120,6 +122,7 @@ class ChatMessagePayload(BaseModel):
     query: str
     collection_id: str
     conversation_id: Optional[str] = None
+    retrieval_mode: Optional[Literal["vector", "lexical", "hybrid"]] = None # Defaults to settings.RETRIEVAL_MODE
     # Add optional selected_pdf_id if you want to chat against a single PDF explicitly
 
 class ChatResponseChunk(BaseModel):
@@ -0,0 +1,192 @@
+# app/services/answer_cache.py
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def collection_version(documents: Iterable[Dict[str, Any]]) -> str:
+    """
+    Fingerprint of a collection's documents rows (ID, status and file hash).
+    It changes whenever a document is added, removed or re-indexed from a
+    different file, and every process derives it from the same rows.
+    """
+    digest = hashlib.sha256()
+    for row in sorted(f"{doc['id']}:{doc.get('status') or ''}:{doc.get('file_hash') or ''}" for doc in documents):
+        digest.update(row.encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    source_ids: List[str]
+    similarity: float = 1.0
+
+
+@dataclass
+class _Entry:
+    embedding: np.ndarray
+    answer: str
+    source_ids: List[str]
+    version: str
+    created_at: float = field(default_factory=time.monotonic)
+
+
+class AnswerCache:
+    """
+    Semantic cache of RAG answers.
+
+    Entries are grouped by (user, collection, retrieval mode). A lookup hits
+    when a stored query embedding has cosine similarity >= ``threshold`` with
+    the new one, the entry is younger than ``ttl_seconds`` and it was stored
+    for the collection version the caller passes (see ``collection_version``).
+    Both the groups and the entries inside each group are evicted
+    least-recently-used first.
+    """
+
+    def __init__(
+        self,
+        threshold: float,
+        ttl_seconds: int,
+        max_entries_per_collection: int,
+        max_collections: int
+    ):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries_per_collection = max_entries_per_collection
+        self.max_collections = max_collections
+        self._groups: "OrderedDict[Tuple[str, str, str], List[_Entry]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1)
+
+    def lookup(
+        self, user_id: str, collection_id: str, mode: str, embedding: List[float], version: str
+    ) -> Optional[CachedAnswer]:
+        key = (user_id, collection_id, mode)
+        query = self._normalize(embedding)
+        now = time.monotonic()
+
+        with self._lock:
+            entries = self._groups.get(key)
+            if entries:
+                # Drop anything stale or indexed against an older collection version
+                entries[:] = [
+                    entry for entry in entries
+                    if entry.version == version and now - entry.created_at <= self.ttl_seconds
+                ]
+            if not entries:
+                self.misses += 1
+                return None
+
+            similarities = np.stack([entry.embedding for entry in entries]) @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            entry = entries.pop(best)
+            entries.append(entry) # Most recently used last
+            self._groups.move_to_end(key)
+            self.hits += 1
+            return CachedAnswer(answer=entry.answer, source_ids=list(entry.source_ids), similarity=float(similarities[best]))
+
+    def store(
+        self,
+        user_id: str,
+        collection_id: str,
+        mode: str,
+        embedding: List[float],
+        answer: str,
+        source_ids: List[str],
+        version: str,
+        current_version: str
+    ) -> bool:
+        """
+        Caches an answer generated against collection ``version`` (captured at
+        retrieval time). The write is dropped, returning False, if the
+        collection has since moved on to ``current_version``.
+        """
+        if version != current_version:
+            return False
+        entry = _Entry(
+            embedding=self._normalize(embedding),
+            answer=answer,
+            source_ids=list(source_ids),
+            version=version
+        )
+        key = (user_id, collection_id, mode)
+        with self._lock:
+            entries = self._groups.setdefault(key, [])
+            entries.append(entry)
+            if len(entries) > self.max_entries_per_collection:
+                del entries[0]
+            self._groups.move_to_end(key)
+            while len(self._groups) > self.max_collections:
+                self._groups.popitem(last=False)
+        return True
+
+    def invalidate(self, collection_id: str) -> None:
+        """
+        Drops this process's cached answers for the collection. Other processes
+        stop serving theirs once the collection version moves on.
+        """
+        with self._lock:
+            for key in [key for key in self._groups if key[1] == collection_id]:
+                del self._groups[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "collections": len(self._groups),
+                "entries": sum(len(entries) for entries in self._groups.values()),
+            }
+
+
+_answer_cache: Optional[AnswerCache] = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    """Returns the process-wide answer cache, or None if it is disabled."""
+    global _answer_cache
+    if not settings.ANSWER_CACHE_ENABLED:
+        return None
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                _answer_cache = AnswerCache(
+                    threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+                    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+                    max_entries_per_collection=settings.ANSWER_CACHE_MAX_ENTRIES_PER_COLLECTION,
+                    max_collections=settings.ANSWER_CACHE_MAX_COLLECTIONS
+                )
+    return _answer_cache
+
+
+def invalidate_collection_answers(collection_id: str) -> None:
+    """Invalidates cached answers after a document in the collection is added, re-indexed or removed."""
+    try:
+        cache = get_answer_cache()
+        if cache is not None:
+            cache.invalidate(collection_id)
+    except Exception as e:
+        logger.error(f"Failed to invalidate cached answers for collection {collection_id}: {e}")
@@ -0,0 +1,172 @@
+# app/services/chunk_store.py
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import zstandard
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def parse_vector_id(vector_id: str) -> Tuple[str, int]:
+    """Splits a ``{document_id}-{chunk_index}`` vector ID into its parts."""
+    document_id, chunk_index = vector_id.rsplit("-", 1)
+    return document_id, int(chunk_index)
+
+
+class ChunkStore:
+    """
+    Local cache of full chunk text, kept outside the vector index.
+
+    The durable copy is ``document_chunks.content``; this store only saves the
+    round trip. Chunks are grouped per document into blocks of ``block_size``
+    consecutive chunk indices, and each block is a zstd-compressed JSON list.
+    Lookups use the existing ``{document_id}-{i}`` vector IDs and read every
+    needed block in a single query. Each document is stored with a stamp (the
+    file hash it was indexed from) so callers can tell when another host
+    re-indexed it.
+    """
+
+    def __init__(self, path: str, block_size: int, compression_level: int):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.block_size = block_size
+        self.compression_level = compression_level
+        self._local = threading.local()
+
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_blocks ("
+            " document_id TEXT NOT NULL,"
+            " block_index INTEGER NOT NULL,"
+            " data BLOB NOT NULL,"
+            " PRIMARY KEY (document_id, block_index))"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_documents ("
+            " document_id TEXT PRIMARY KEY,"
+            " stamp TEXT NOT NULL)"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread; SQLite connections must not be shared
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def put_document(self, document_id: str, chunks: Dict[int, str], stamp: str = "") -> None:
+        """Replaces the stored chunks of a document. ``chunks`` maps chunk index to text."""
+        blocks: Dict[int, List[Optional[str]]] = defaultdict(lambda: [None] * self.block_size)
+        for chunk_index, text in chunks.items():
+            blocks[chunk_index // self.block_size][chunk_index % self.block_size] = text
+
+        compressor = zstandard.ZstdCompressor(level=self.compression_level)
+        rows = [
+            (document_id, block_index, compressor.compress(json.dumps(texts).encode("utf-8")))
+            for block_index, texts in blocks.items()
+        ]
+
+        conn = self._connection()
+        conn.execute("BEGIN")
+        try:
+            conn.execute("DELETE FROM chunk_blocks WHERE document_id = ?", (document_id,))
+            conn.executemany(
+                "INSERT INTO chunk_blocks (document_id, block_index, data) VALUES (?, ?, ?)", rows
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO chunk_documents (document_id, stamp) VALUES (?, ?)", (document_id, stamp)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get_chunks(self, vector_ids: Iterable[str]) -> Dict[str, str]:
+        """Returns the text for every vector ID found in the store."""
+        wanted: Dict[Tuple[str, int], List[Tuple[str, int]]] = defaultdict(list)
+        for vector_id in vector_ids:
+            try:
+                document_id, chunk_index = parse_vector_id(vector_id)
+            except ValueError:
+                continue
+            wanted[(document_id, chunk_index // self.block_size)].append((vector_id, chunk_index % self.block_size))
+        if not wanted:
+            return {}
+
+        keys = list(wanted)
+        placeholders = ",".join("(?, ?)" for _ in keys)
+        params = [value for key in keys for value in key]
+        rows = self._connection().execute(
+            f"SELECT document_id, block_index, data FROM chunk_blocks"
+            f" WHERE (document_id, block_index) IN (VALUES {placeholders})",
+            params
+        ).fetchall()
+
+        decompressor = zstandard.ZstdDecompressor()
+        found: Dict[str, str] = {}
+        for document_id, block_index, data in rows:
+            texts = json.loads(decompressor.decompress(data))
+            for vector_id, offset in wanted[(document_id, block_index)]:
+                if offset < len(texts) and texts[offset] is not None:
+                    found[vector_id] = texts[offset]
+        return found
+
+    def get_stamps(self, document_ids: Iterable[str]) -> Dict[str, str]:
+        """Returns the stamp each of the given documents was stored with, for those in the store."""
+        document_ids = list(document_ids)
+        stamps = {}
+        conn = self._connection()
+        for i in range(0, len(document_ids), 500):
+            batch = document_ids[i:i + 500]
+            rows = conn.execute(
+                f"SELECT document_id, stamp FROM chunk_documents WHERE document_id IN ({','.join('?' * len(batch))})",
+                batch
+            ).fetchall()
+            stamps.update(rows)
+        return stamps
+
+    def get_chunk_indexes(self, document_id: str) -> List[int]:
+        """Returns the indexes of every chunk stored for a document."""
+        rows = self._connection().execute(
+            "SELECT block_index, data FROM chunk_blocks WHERE document_id = ? ORDER BY block_index", (document_id,)
+        ).fetchall()
+        decompressor = zstandard.ZstdDecompressor()
+        indexes = []
+        for block_index, data in rows:
+            texts = json.loads(decompressor.decompress(data))
+            indexes.extend(block_index * self.block_size + offset for offset, text in enumerate(texts) if text is not None)
+        return indexes
+
+    def delete_document(self, document_id: str) -> None:
+        conn = self._connection()
+        conn.execute("DELETE FROM chunk_blocks WHERE document_id = ?", (document_id,))
+        conn.execute("DELETE FROM chunk_documents WHERE document_id = ?", (document_id,))
+
+
+_chunk_store: Optional[ChunkStore] = None
+_chunk_store_lock = threading.Lock()
+
+
+def get_chunk_store() -> ChunkStore:
+    """Returns the process-wide chunk store."""
+    global _chunk_store
+    if _chunk_store is None:
+        with _chunk_store_lock:
+            if _chunk_store is None:
+                _chunk_store = ChunkStore(
+                    settings.CHUNK_STORE_PATH,
+                    settings.CHUNK_STORE_BLOCK_SIZE,
+                    settings.CHUNK_STORE_COMPRESSION_LEVEL
+                )
+    return _chunk_store
@@ -0,0 +1,149 @@
+# app/services/context_packing.py
+
+import hashlib
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from app.services.chunk_store import parse_vector_id
+from app.services.tokenization import get_token_counter
+
+_WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+# Shortest prefix of the next chunk used to look for the overlap with the previous one
+_OVERLAP_PROBE_CHARS = 32
+
+
+@dataclass
+class PackedContext:
+    """Contexts ready for the prompt, plus what the packing stage did to get there."""
+    contexts: List[str]
+    source_ids: List[str]
+    original_tokens: int
+    packed_tokens: int
+    merged_chunks: int = 0
+    duplicates_dropped: int = 0
+    dropped_for_budget: List[str] = field(default_factory=list)
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.original_tokens - self.packed_tokens)
+
+
+@dataclass
+class _Group:
+    text: str
+    source_ids: List[str]
+    rank: int # Best (lowest) retrieval rank of any member
+
+
+def simhash(text: str, shingle_size: int = 3) -> int:
+    """64-bit SimHash over word shingles; near-identical texts differ in few bits."""
+    words = _WORD_PATTERN.findall(text.lower())
+    if len(words) < shingle_size:
+        shingles = [" ".join(words)]
+    else:
+        shingles = [" ".join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)]
+
+    weights = [0] * 64
+    for shingle in shingles:
+        value = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+def _hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def _join_overlapping(first: str, second: str) -> str:
+    """
+    Concatenates two consecutive chunks, dropping the text the second one
+    repeats from the end of the first (the chunker's overlap).
+    """
+    probe = second[:_OVERLAP_PROBE_CHARS]
+    if probe:
+        start = first.rfind(probe)
+        while start != -1:
+            overlap = len(first) - start
+            if second.startswith(first[start:]):
+                return first + second[overlap:]
+            start = first.rfind(probe, 0, start)
+    return first + "\n" + second
+
+
+def _merge_adjacent(ids: List[str], texts: List[str]) -> Tuple[List[_Group], int]:
+    """Merges runs of consecutive chunk indices from the same document into one group each."""
+    positions: List[Tuple[str, int, int]] = []
+    unparsed: List[_Group] = []
+    for rank, vector_id in enumerate(ids):
+        try:
+            document_id, chunk_index = parse_vector_id(vector_id)
+        except ValueError:
+            unparsed.append(_Group(texts[rank], [vector_id], rank))
+            continue
+        positions.append((document_id, chunk_index, rank))
+
+    groups: List[_Group] = []
+    merged = 0
+    previous: Optional[Tuple[str, int]] = None
+    for document_id, chunk_index, rank in sorted(positions):
+        if previous == (document_id, chunk_index - 1):
+            group = groups[-1]
+            group.text = _join_overlapping(group.text, texts[rank])
+            group.source_ids.append(ids[rank])
+            group.rank = min(group.rank, rank)
+            merged += 1
+        elif previous == (document_id, chunk_index):
+            pass # Same chunk retrieved twice
+        else:
+            groups.append(_Group(texts[rank], [ids[rank]], rank))
+        previous = (document_id, chunk_index)
+    return groups + unparsed, merged
+
+
+def pack_contexts(
+    source_ids: List[str],
+    contexts: List[str],
+    token_budget: int,
+    max_hamming_distance: int = 3
+) -> PackedContext:
+    """
+    Turns retrieved chunks (best first) into prompt context:
+
+    1. adjacent chunks of the same document are merged, without repeating their overlap,
+    2. near-duplicates (SimHash distance <= ``max_hamming_distance``, e.g. the
+       same passage from a re-uploaded file) are dropped, keeping the better ranked one,
+    3. the rest is ordered by relevance and added until ``token_budget`` is reached.
+       The most relevant context is always kept, even if it alone exceeds the budget.
+    """
+    counter = get_token_counter()
+    original_tokens = sum(counter.count_many(contexts))
+
+    groups, merged = _merge_adjacent(source_ids, contexts)
+    groups.sort(key=lambda group: group.rank)
+
+    kept: List[_Group] = []
+    fingerprints: List[int] = []
+    duplicates = 0
+    for group in groups:
+        fingerprint = simhash(group.text)
+        if any(_hamming(fingerprint, other) <= max_hamming_distance for other in fingerprints):
+            duplicates += 1
+            continue
+        fingerprints.append(fingerprint)
+        kept.append(group)
+
+    packed = PackedContext(
+        contexts=[], source_ids=[], original_tokens=original_tokens, packed_tokens=0,
+        merged_chunks=merged, duplicates_dropped=duplicates
+    )
+    for group, tokens in zip(kept, counter.count_many([group.text for group in kept])):
+        if packed.contexts and packed.packed_tokens + tokens > token_budget:
+            # A smaller, less relevant context may still fit
+            packed.dropped_for_budget.extend(group.source_ids)
+            continue
+        packed.contexts.append(group.text)
+        packed.source_ids.extend(group.source_ids)
+        packed.packed_tokens += tokens
+    return packed
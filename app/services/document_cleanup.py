@@ -0,0 +1,191 @@
+# app/services/document_cleanup.py
+
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set
+from uuid import UUID
+
+from supabase import Client
+from app.database.crud import (
+    count_documents_by_storage_path,
+    delete_collection,
+    delete_document,
+    delete_document_chunks,
+    get_document_chunks,
+    get_documents_by_collection,
+    get_documents_by_ids,
+)
+from app.integrations.supabase_connect import get_pdf_bucket_name
+from app.integrations.vector_store import get_vector_store
+from app.services.answer_cache import invalidate_collection_answers
+from app.services.chunk_store import get_chunk_store, parse_vector_id
+from app.services.lexical_index import get_lexical_index
+
+logger = logging.getLogger(__name__)
+
+# Documents in these states may have vectors without chunk rows yet
+_IN_PROGRESS_STATUSES = {"queued", "processing", "downloading", "extracting", "embedding", "indexing"}
+
+
+async def _document_vector_ids(supabase: Client, user_id: str, document_id: str) -> List[str]:
+    """
+    Every vector ID the document may own: from its chunk rows, the chunk store
+    and, where the index supports it, an ID-prefix listing.
+    """
+    indexes: Set[int] = set()
+    try:
+        rows = await asyncio.to_thread(get_document_chunks, supabase, document_id)
+        indexes.update(row['chunk_index'] for row in rows)
+    except Exception as e:
+        logger.error(f"Failed to read chunk rows of document {document_id}: {e}")
+    indexes.update(await asyncio.to_thread(get_chunk_store().get_chunk_indexes, document_id))
+    vector_ids = {f"{document_id}-{i}" for i in indexes}
+
+    try:
+        vector_ids.update(await get_vector_store().list_ids(f"user-{user_id}", prefix=f"{document_id}-"))
+    except Exception as e:
+        # e.g. pod-based Pinecone indexes cannot list IDs
+        logger.debug(f"Vector ID listing unavailable for document {document_id}: {e}")
+    return sorted(vector_ids)
+
+
+async def delete_document_data(supabase: Client, user_id: str, document: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Deletes a document everywhere: vectors (in bulk, by ``{document_id}-{i}``
+    ID), chunk text, BM25 postings, chunk rows, the document row and, unless
+    another document shares it, the stored PDF.
+    """
+    document_id = str(document['id'])
+    vector_ids = await _document_vector_ids(supabase, user_id, document_id)
+
+    # Vectors first, so the document stops appearing in answers right away
+    if vector_ids:
+        await get_vector_store().delete(f"user-{user_id}", vector_ids)
+    await asyncio.to_thread(get_chunk_store().delete_document, document_id)
+    await asyncio.to_thread(get_lexical_index().delete_document, document_id)
+    await asyncio.to_thread(delete_document_chunks, supabase, document_id)
+
+    storage_path = document.get('storage_path')
+    shared = False
+    if storage_path:
+        shared = await asyncio.to_thread(count_documents_by_storage_path, supabase, storage_path) > 1
+    await asyncio.to_thread(delete_document, supabase, document_id)
+    if storage_path and not shared:
+        try:
+            await asyncio.to_thread(supabase.storage.from_(get_pdf_bucket_name()).remove, [storage_path])
+        except Exception as e:
+            logger.error(f"Failed to remove stored file {storage_path} of document {document_id}: {e}")
+
+    await asyncio.to_thread(invalidate_collection_answers, str(document['collection_id']))
+    logger.info(f"Deleted document {document_id} and {len(vector_ids)} vectors")
+    return {"document_id": document_id, "vectors_deleted": len(vector_ids), "file_removed": bool(storage_path) and not shared}
+
+
+async def delete_collection_data(supabase: Client, user_id: str, collection_id: UUID) -> Dict[str, Any]:
+    """Deletes every document of a collection, then its conversations and the collection itself."""
+    documents = await asyncio.to_thread(get_documents_by_collection, supabase, collection_id)
+    vectors_deleted = 0
+    for document in documents:
+        result = await delete_document_data(supabase, user_id, document)
+        vectors_deleted += result["vectors_deleted"]
+    await asyncio.to_thread(delete_collection, supabase, collection_id)
+    logger.info(f"Deleted collection {collection_id}: {len(documents)} documents, {vectors_deleted} vectors")
+    return {"collection_id": str(collection_id), "documents_deleted": len(documents), "vectors_deleted": vectors_deleted}
+
+
+async def reconcile_vectors(supabase: Client, delete_orphans: bool) -> Dict[str, Any]:
+    """
+    Compares every ``user-{id}`` namespace with the documents and
+    ``document_chunks`` rows in Supabase and reports:
+
+    - orphaned vectors, whose document no longer exists (deleted if ``delete_orphans``),
+    - unreferenced vectors, of a finished document but without a chunk row,
+    - missing vectors, chunk rows of a finished document without a vector.
+    """
+    store = get_vector_store()
+    started = time.time()
+    report: Dict[str, Any] = {
+        "started_at": started,
+        "namespaces": 0,
+        "vectors": 0,
+        "orphaned_vectors": 0,
+        "orphaned_vectors_deleted": 0,
+        "unreferenced_vectors": 0,
+        "missing_vectors": 0,
+        "orphaned_documents": [],
+        "errors": [],
+    }
+
+    for namespace in await store.list_namespaces():
+        if not namespace.startswith("user-"):
+            continue
+        report["namespaces"] += 1
+        try:
+            vector_ids = await store.list_ids(namespace)
+        except Exception as e:
+            report["errors"].append(f"{namespace}: cannot list vector IDs ({e})")
+            continue
+        report["vectors"] += len(vector_ids)
+
+        by_document: Dict[str, Set[int]] = defaultdict(set)
+        for vector_id in vector_ids:
+            try:
+                document_id, chunk_index = parse_vector_id(vector_id)
+            except ValueError:
+                continue
+            by_document[document_id].add(chunk_index)
+
+        documents = {
+            str(document['id']): document
+            for document in await asyncio.to_thread(get_documents_by_ids, supabase, list(by_document))
+        }
+        for document_id, indexes in by_document.items():
+            document = documents.get(document_id)
+            if document is None:
+                orphans = [f"{document_id}-{i}" for i in sorted(indexes)]
+                report["orphaned_vectors"] += len(orphans)
+                report["orphaned_documents"].append(document_id)
+                if delete_orphans:
+                    await store.delete(namespace, orphans)
+                    await asyncio.to_thread(get_chunk_store().delete_document, document_id)
+                    await asyncio.to_thread(get_lexical_index().delete_document, document_id)
+                    report["orphaned_vectors_deleted"] += len(orphans)
+                continue
+            if document.get('status') in _IN_PROGRESS_STATUSES:
+                continue
+
+            rows = await asyncio.to_thread(get_document_chunks, supabase, document_id)
+            row_indexes = {row['chunk_index'] for row in rows}
+            report["unreferenced_vectors"] += len(indexes - row_indexes)
+            report["missing_vectors"] += len(row_indexes - indexes)
+
+    report["duration_seconds"] = round(time.time() - started, 2)
+    return report
+
+
+_last_gc_report: Optional[Dict[str, Any]] = None
+
+
+def get_last_gc_report() -> Optional[Dict[str, Any]]:
+    return _last_gc_report
+
+
+async def run_background_gc(supabase_getter, interval_seconds: int, delete_orphans: bool) -> None:
+    """Runs ``reconcile_vectors`` every ``interval_seconds``, keeping the last report."""
+    global _last_gc_report
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            _last_gc_report = await reconcile_vectors(await supabase_getter(), delete_orphans)
+            logger.info(
+                f"Vector GC: {_last_gc_report['orphaned_vectors']} orphaned "
+                f"({_last_gc_report['orphaned_vectors_deleted']} deleted), "
+                f"{_last_gc_report['unreferenced_vectors']} unreferenced, "
+                f"{_last_gc_report['missing_vectors']} missing"
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Vector garbage collection failed: {e}", exc_info=True)
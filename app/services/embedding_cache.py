@@ -0,0 +1,187 @@
+# app/services/embedding_cache.py
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional
+
+from cachetools import LRUCache
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache.
+
+    Entries are keyed by (model, task_type, dimensionality, sha256(text)) and
+    stored as float32 blobs in a local SQLite database. A small in-memory LRU
+    sits in front of it. When the database grows past ``max_bytes`` the least
+    recently used rows are evicted.
+    """
+
+    def __init__(self, path: str, max_bytes: int, memory_items: int):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._memory: LRUCache = LRUCache(maxsize=memory_items)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(model: str, task_type: str, dimensionality: int, text: str) -> str:
+        text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{model}|{task_type}|{dimensionality}|{text_hash}"
+
+    @staticmethod
+    def _encode(vector: List[float]) -> bytes:
+        return array("f", vector).tobytes()
+
+    @staticmethod
+    def _decode(blob: bytes) -> List[float]:
+        values = array("f")
+        values.frombytes(blob)
+        return values.tolist()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, List[float]]:
+        """Returns the cached vectors for the keys that are present."""
+        found: Dict[str, List[float]] = {}
+        disk_keys: List[str] = []
+
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    found[key] = vector
+                    self.memory_hits += 1
+                else:
+                    disk_keys.append(key)
+
+            # SQLite limits the number of bound parameters per statement
+            for i in range(0, len(disk_keys), 500):
+                batch = disk_keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = self._decode(blob)
+                    found[key] = vector
+                    self._memory[key] = vector
+                if rows:
+                    self._conn.executemany(
+                        "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                        [(time.time(), key) for key, _ in rows]
+                    )
+                self.disk_hits += len(rows)
+                self.misses += len(batch) - len(rows)
+
+        return found
+
+    def get(self, key: str) -> Optional[List[float]]:
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items: Dict[str, List[float]]) -> None:
+        """Stores vectors and evicts old entries if the size limit is exceeded."""
+        if not items:
+            return
+
+        now = time.time()
+        rows = []
+        for key, vector in items.items():
+            blob = self._encode(vector)
+            rows.append((key, blob, len(blob), now))
+
+        with self._lock:
+            for key, vector in items.items():
+                self._memory[key] = vector
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, size, last_access) VALUES (?, ?, ?, ?)",
+                    rows
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+            self._evict_if_needed()
+
+    def put(self, key: str, vector: List[float]) -> None:
+        self.put_many({key: vector})
+
+    def _evict_if_needed(self) -> None:
+        # Evict down to 90% of the limit so we don't evict on every insert
+        if self._total_bytes <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        while self._total_bytes > target:
+            rows = self._conn.execute(
+                "SELECT key, size FROM embeddings ORDER BY last_access LIMIT 500"
+            ).fetchall()
+            if not rows:
+                break
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", [(key,) for key, _ in rows])
+            for key, size in rows:
+                self._memory.pop(key, None)
+                self._total_bytes -= size
+            self.evictions += len(rows)
+        logger.info(f"Embedding cache evicted down to {self._total_bytes} bytes")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "memory_items": len(self._memory),
+                "disk_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+_embedding_cache: Optional[EmbeddingCache] = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Returns the process-wide embedding cache, or None if it is disabled."""
+    global _embedding_cache
+    if not settings.EMBEDDING_CACHE_ENABLED:
+        return None
+    if _embedding_cache is None:
+        with _embedding_cache_lock:
+            if _embedding_cache is None:
+                _embedding_cache = EmbeddingCache(
+                    settings.EMBEDDING_CACHE_PATH,
+                    settings.EMBEDDING_CACHE_MAX_BYTES,
+                    settings.EMBEDDING_CACHE_MEMORY_ITEMS
+                )
+    return _embedding_cache
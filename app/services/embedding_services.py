@@ -3,10 +3,15 @@
 from openai import AsyncOpenAI # pip install openai
 import google.generativeai as genai
 from google.generativeai import GenerativeModel, configure # pip install google-generativeai
-from typing import List, Optional
+from typing import Dict, List, Optional
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from app.core.config import settings
 import logging
 from app.integrations.llm_client import initialize_llm_clients
+from app.integrations.model_registry import model_registry
+from app.services.embedding_cache import EmbeddingCache, get_embedding_cache
 
 
 logger = logging.getLogger(__name__)
@@ -20,23 +25,8 @@ def initialize_llm_clients():
     if settings.GOOGLE_API_KEY:
         genai.configure(api_key=settings.GOOGLE_API_KEY)
         
-        # Check generated content model availability dynamically
-        available_models = [m.name for m in genai.list_models() if 'generateContent' in m.supported_generation_methods]
-        
-        # Format the configured model 
-        configured_model = settings.LLM_MODEL_NAME
-        if not configured_model.startswith("models/"):
-             configured_model = f"models/{configured_model}"
-             
-        eval_model = settings.LLM_MODEL_NAME
-        if configured_model not in available_models:
-             # Fallback to the first available chat model, preferring flash models
-             flash_models = [m for m in available_models if "flash" in m]
-             if flash_models:
-                 eval_model = flash_models[0].replace("models/", "") 
-             elif available_models:
-                 eval_model = available_models[0].replace("models/", "")
-             print(f"Configured model {settings.LLM_MODEL_NAME} not found. Falling back to {eval_model}")
+        # Resolved once per process and cached by the shared model registry
+        eval_model = model_registry.get_chat_model()
 
         google_gemini_model = genai.GenerativeModel(eval_model) # Initialize chat model
         print(f" Google Gemini client initialized with model: {eval_model}.")
@@ -49,66 +39,113 @@ def initialize_llm_clients():
 # Initialize clients when module is imported
 initialize_llm_clients()
 
-async def generate_embedding(text: str) -> List[float]:
+# Dedicated, bounded pool for the synchronous Gemini SDK calls so they never
+# run on (or starve) the event loop or the default executor.
+provider_executor = ThreadPoolExecutor(
+    max_workers=settings.LLM_PROVIDER_MAX_WORKERS,
+    thread_name_prefix="llm-provider"
+)
+
+GEMINI_SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
+]
+
+_STREAM_END = object()
+
+OPENAI_EMBEDDING_MODELS = ["text-embedding-ada-002", "text-embedding-3-small", "text-embedding-3-large"]
+
+
+def _google_embed_sync(texts: List[str], task_type: str) -> List[List[float]]:
+    """Runs the blocking Gemini embedding call. Executed on ``provider_executor``."""
+    result = genai.embed_content(
+        model=model_registry.get_embedding_model(),
+        content=texts,
+        task_type=task_type,
+        output_dimensionality=settings.EMBEDDING_DIMENSION
+    )
+    return result["embedding"]
+
+
+async def _stream_gemini_completion(prompt: str):
     """
-    Generates an embedding for the given text using the configured model.
-    
-    Args:
-        text: The input text to generate embedding for
-        
-    Returns:
-        List[float]: The embedding vector
-        
-    Raises:
-        RuntimeError: If embedding generation fails
-        ValueError: If the model is not supported or clients are not initialized
+    Streams a Gemini completion without blocking the event loop.
+
+    The synchronous SDK iterator is drained on ``provider_executor`` and each
+    chunk is handed back to the event loop through an ``asyncio.Queue``.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stop_event = threading.Event()
+
+    def produce():
+        try:
+            response_stream = google_gemini_model.generate_content(
+                prompt,
+                stream=True,
+                safety_settings=GEMINI_SAFETY_SETTINGS
+            )
+            for chunk in response_stream:
+                if stop_event.is_set():
+                    break
+                if chunk.text:
+                    loop.call_soon_threadsafe(queue.put_nowait, chunk.text)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, _STREAM_END)
+
+    loop.run_in_executor(provider_executor, produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item is _STREAM_END:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Tell the worker thread to stop if the consumer went away early
+        stop_event.set()
+
+
+async def _embed_batch(texts: List[str], task_type: str) -> List[List[float]]:
+    """
+    Embeds a single batch of texts with one provider call.
+
+    The returned list is aligned with ``texts``.
     """
-    if not text.strip():
-        raise ValueError("Input text cannot be empty")
-    
     # OpenAI models
-    if settings.EMBEDDING_MODEL_NAME in ["text-embedding-ada-002", "text-embedding-3-small", "text-embedding-3-large"]:
+    if settings.EMBEDDING_MODEL_NAME in OPENAI_EMBEDDING_MODELS:
         if not openai_client:
             raise ValueError("OpenAI client not initialized. Check your API key.")
-            
+
         try:
             response = await openai_client.embeddings.create(
-                input=text,
+                input=texts,
                 model=settings.EMBEDDING_MODEL_NAME
             )
-            return response.data[0].embedding
+            # The API returns items tagged with their input index
+            return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
         except Exception as e:
             logger.error(f"Error generating OpenAI embedding: {e}")
             raise RuntimeError(f"Failed to generate embedding: {e}")
-    
+
     # Google models
     elif ("embedding" in settings.EMBEDDING_MODEL_NAME) and settings.GOOGLE_API_KEY:
         if not google_gemini_model:
             raise ValueError("Google Gemini client not initialized. Check your API key.")
-            
+
         try:
-            import google.generativeai as genai
-            
-            # Find an available embedding model dynamically
-            available_models = [m.name for m in genai.list_models() if 'embedContent' in m.supported_generation_methods]
-            eval_model = available_models[0] if available_models else "models/text-embedding-004"
-
-            # If the user-specified model is actually valid, we optionally could use it, 
-            # but let's just safely use the first available one to prevent 404s.
-            if settings.EMBEDDING_MODEL_NAME in available_models:
-                eval_model = settings.EMBEDDING_MODEL_NAME
-
-            result = genai.embed_content(
-                model=eval_model,
-                content=text,
-                task_type="RETRIEVAL_DOCUMENT",
-                output_dimensionality=768
-            )
-            return result["embedding"]
+            # The Gemini SDK call is synchronous, keep it off the event loop
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(provider_executor, _google_embed_sync, texts, task_type)
         except Exception as e:
             logger.error(f"Error generating Google embedding: {e}")
             raise RuntimeError(f"Failed to generate embedding: {e}")
-    
+
     # Unsupported model
     else:
         raise ValueError(
@@ -117,6 +154,148 @@ async def generate_embedding(text: str) -> List[float]:
             "text-embedding-3-large, text-embedding-004, or Google's models/embedding-*"
         )
 
+
+def _embedding_cache_keys(texts: List[str], task_type: str) -> List[str]:
+    """Builds the embedding cache keys for ``texts`` under the active model."""
+    if settings.EMBEDDING_MODEL_NAME in OPENAI_EMBEDDING_MODELS:
+        model_id = settings.EMBEDDING_MODEL_NAME
+    else:
+        model_id = model_registry.get_embedding_model()
+    return [
+        EmbeddingCache.make_key(model_id, task_type, settings.EMBEDDING_DIMENSION, text)
+        for text in texts
+    ]
+
+
+def _cache_lookup(cache: EmbeddingCache, texts: List[str], task_type: str):
+    """Returns the cache keys for ``texts`` and the vectors already cached. Runs in a worker thread."""
+    keys = _embedding_cache_keys(texts, task_type)
+    return keys, cache.get_many(set(keys))
+
+
+async def generate_embedding(text: str, task_type: str = "RETRIEVAL_DOCUMENT") -> List[float]:
+    """
+    Generates an embedding for the given text using the configured model.
+    Results are served from and written to the embedding cache when it is enabled.
+    
+    Args:
+        text: The input text to generate embedding for
+        task_type: Embedding task type (used by Google models)
+        
+    Returns:
+        List[float]: The embedding vector
+        
+    Raises:
+        RuntimeError: If embedding generation fails
+        ValueError: If the model is not supported or clients are not initialized
+    """
+    if not text.strip():
+        raise ValueError("Input text cannot be empty")
+
+    cache = get_embedding_cache()
+    key = None
+    if cache:
+        try:
+            keys, cached = await asyncio.to_thread(_cache_lookup, cache, [text], task_type)
+            key = keys[0]
+            if key in cached:
+                return cached[key]
+        except Exception as e:
+            # A locked or corrupt cache should never fail a query; ask the provider instead
+            logger.error(f"Embedding cache lookup failed: {e}")
+
+    embeddings = await _embed_batch([text], task_type)
+    if key is not None:
+        try:
+            await asyncio.to_thread(cache.put, key, embeddings[0])
+        except Exception as e:
+            logger.error(f"Failed to write embedding to cache: {e}")
+    return embeddings[0]
+
+
+async def generate_embeddings_batch(
+    texts: List[str],
+    task_type: str = "RETRIEVAL_DOCUMENT",
+    batch_size: int = settings.EMBEDDING_BATCH_SIZE,
+    max_concurrent_batches: int = settings.EMBEDDING_MAX_CONCURRENT_BATCHES,
+) -> List[Optional[List[float]]]:
+    """
+    Generates embeddings for many texts, sending several texts per provider call.
+
+    Texts already in the embedding cache are not sent to the provider, and
+    identical texts are only embedded once. The remaining texts are split into
+    batches of ``batch_size`` and at most ``max_concurrent_batches`` batches
+    are in flight at any time.
+
+    Args:
+        texts: The input texts to embed
+        task_type: Embedding task type (used by Google models)
+        batch_size: Number of texts sent in a single provider call
+        max_concurrent_batches: Upper bound on concurrent provider calls
+
+    Returns:
+        List of embeddings aligned with ``texts``. Entries are None for empty
+        texts and for texts whose batch failed, so callers can skip them.
+    """
+    results: List[Optional[List[float]]] = [None] * len(texts)
+    indexed_texts = [(i, text) for i, text in enumerate(texts) if text and text.strip()]
+    if not indexed_texts:
+        return results
+
+    # Group positions by cache key (or by text when the cache is disabled)
+    cache = get_embedding_cache()
+    if cache:
+        try:
+            keys, cached = await asyncio.to_thread(
+                _cache_lookup, cache, [text for _, text in indexed_texts], task_type
+            )
+        except Exception as e:
+            logger.error(f"Embedding cache lookup of {len(indexed_texts)} texts failed: {e}")
+            cache = None
+    if not cache:
+        keys, cached = [text for _, text in indexed_texts], {}
+
+    pending: Dict[str, List[int]] = {}
+    pending_texts: Dict[str, str] = {}
+    for (index, text), key in zip(indexed_texts, keys):
+        if key in cached:
+            results[index] = cached[key]
+            continue
+        pending.setdefault(key, []).append(index)
+        pending_texts[key] = text
+
+    unique_keys = list(pending)
+    batches = [unique_keys[i:i + batch_size] for i in range(0, len(unique_keys), batch_size)]
+    semaphore = asyncio.Semaphore(max(1, max_concurrent_batches))
+    new_entries: Dict[str, List[float]] = {}
+
+    async def run_batch(batch):
+        async with semaphore:
+            try:
+                embeddings = await _embed_batch([pending_texts[key] for key in batch], task_type)
+            except Exception as e:
+                logger.error(f"Embedding batch of {len(batch)} texts failed: {e}")
+                return
+            for key, embedding in zip(batch, embeddings):
+                new_entries[key] = embedding
+                for index in pending[key]:
+                    results[index] = embedding
+
+    await asyncio.gather(*(run_batch(batch) for batch in batches))
+
+    if cache and new_entries:
+        try:
+            await asyncio.to_thread(cache.put_many, new_entries)
+        except Exception as e:
+            # A cache write failure should never fail ingestion
+            logger.error(f"Failed to write {len(new_entries)} embeddings to cache: {e}")
+
+    logger.info(
+        f"Embedded {len(indexed_texts)} texts: {len(indexed_texts) - sum(len(v) for v in pending.values())} "
+        f"from cache, {len(new_entries)} provider embeddings in {len(batches)} batches"
+    )
+    return results
+
 async def get_llm_completion_stream(prompt: str):
     """Generates a streaming response from the configured LLM."""
     if settings.LLM_MODEL_NAME.startswith("gpt") and openai_client:
@@ -138,19 +317,8 @@ async def get_llm_completion_stream(prompt: str):
     elif settings.LLM_MODEL_NAME.startswith("gemini") and google_gemini_model:
         try:
             # Assuming google_gemini_model is already configured with API key
-            response_stream = google_gemini_model.generate_content(
-                prompt,
-                stream=True,
-                safety_settings=[
-                    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-                    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-                    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-                    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-                ]
-            )
-            for chunk in response_stream:
-                if chunk.text:
-                    yield chunk.text
+            async for text in _stream_gemini_completion(prompt):
+                yield text
         except Exception as e:
             print(f"Error streaming Google Gemini LLM response: {e}")
             yield "[ERROR] Could not generate response."
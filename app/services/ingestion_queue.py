@@ -0,0 +1,222 @@
+# app/services/ingestion_queue.py
+
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+
+class IngestionQueue:
+    """
+    Durable job queue for document ingestion, backed by a local SQLite file.
+
+    Jobs survive web worker restarts. A claimed job is leased for
+    ``visibility_timeout`` seconds; if the worker dies without finishing or
+    extending the lease, the job becomes claimable again. Claims prefer users
+    with the fewest jobs currently running so one large batch cannot starve
+    everyone else.
+    """
+
+    def __init__(self, path: str, visibility_timeout: int, max_attempts: int, retry_backoff: int):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ingestion_jobs ("
+                " id TEXT PRIMARY KEY,"
+                " user_id TEXT NOT NULL,"
+                " collection_id TEXT NOT NULL,"
+                " document_id TEXT NOT NULL,"
+                " file_name TEXT NOT NULL,"
+                " storage_path TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " stage TEXT,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " last_error TEXT,"
+                " visible_at REAL NOT NULL,"
+                " leased_until REAL,"
+                " created_at REAL NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_status ON ingestion_jobs(status, visible_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_user ON ingestion_jobs(user_id, status)")
+
+    @contextmanager
+    def _connect(self):
+        # A short-lived connection per operation keeps this safe to use from
+        # the web threadpool and from several worker processes at once.
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(
+        self, user_id: str, collection_id: str, document_id: str, file_name: str, storage_path: str
+    ) -> str:
+        """Adds an ingestion job and returns its ID."""
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO ingestion_jobs (id, user_id, collection_id, document_id, file_name, storage_path,"
+                " status, attempts, visible_at, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?, ?, ?)",
+                (job_id, user_id, collection_id, document_id, file_name, storage_path, JOB_QUEUED, now, now, now)
+            )
+        logger.info(f"Enqueued ingestion job {job_id} for document {document_id}")
+        return job_id
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """
+        Leases the next runnable job, or returns None if there is nothing to do.
+
+        Runnable jobs are queued jobs whose retry delay has passed and running
+        jobs whose lease has expired while they still have attempts left.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT j.* FROM ingestion_jobs j"
+                    " WHERE (j.status = ? AND j.visible_at <= ?)"
+                    "    OR (j.status = ? AND j.leased_until <= ? AND j.attempts < ?)"
+                    " ORDER BY ("
+                    "   SELECT COUNT(*) FROM ingestion_jobs r"
+                    "   WHERE r.user_id = j.user_id AND r.status = ? AND r.leased_until > ?"
+                    " ), j.created_at"
+                    " LIMIT 1",
+                    (JOB_QUEUED, now, JOB_RUNNING, now, self.max_attempts, JOB_RUNNING, now)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE ingestion_jobs SET status = ?, attempts = attempts + 1, leased_until = ?, updated_at = ?"
+                    " WHERE id = ?",
+                    (JOB_RUNNING, now + self.visibility_timeout, now, row["id"])
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        job = dict(row)
+        job["attempts"] += 1
+        return job
+
+    def extend_lease(self, job_id: str) -> None:
+        """Pushes the lease of a running job forward by another visibility timeout."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE ingestion_jobs SET leased_until = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (now + self.visibility_timeout, now, job_id, JOB_RUNNING)
+            )
+
+    def set_stage(self, job_id: str, stage: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE ingestion_jobs SET stage = ?, updated_at = ? WHERE id = ?",
+                (stage, time.time(), job_id)
+            )
+
+    def complete(self, job_id: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE ingestion_jobs SET status = ?, leased_until = NULL, last_error = NULL, updated_at = ?"
+                " WHERE id = ?",
+                (JOB_SUCCEEDED, time.time(), job_id)
+            )
+
+    def fail(self, job_id: str, attempts: int, error: str) -> bool:
+        """
+        Records a failed attempt. The job is re-queued with exponential backoff
+        until ``max_attempts`` is reached.
+
+        Returns True if the job will be retried.
+        """
+        now = time.time()
+        retry = attempts < self.max_attempts
+        with self._connect() as conn:
+            if retry:
+                conn.execute(
+                    "UPDATE ingestion_jobs SET status = ?, leased_until = NULL, last_error = ?,"
+                    " visible_at = ?, updated_at = ? WHERE id = ?",
+                    (JOB_QUEUED, error, now + self.retry_backoff * (2 ** (attempts - 1)), now, job_id)
+                )
+            else:
+                conn.execute(
+                    "UPDATE ingestion_jobs SET status = ?, leased_until = NULL, last_error = ?, updated_at = ?"
+                    " WHERE id = ?",
+                    (JOB_FAILED, error, now, job_id)
+                )
+        return retry
+
+    def fail_expired(self) -> List[Dict[str, Any]]:
+        """
+        Marks running jobs whose lease expired after their last allowed attempt
+        as failed, and returns them so their documents can be marked too.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    "SELECT * FROM ingestion_jobs WHERE status = ? AND leased_until <= ? AND attempts >= ?",
+                    (JOB_RUNNING, now, self.max_attempts)
+                ).fetchall()
+                for row in rows:
+                    conn.execute(
+                        "UPDATE ingestion_jobs SET status = ?, leased_until = NULL, updated_at = ?,"
+                        " last_error = COALESCE(last_error, ?) WHERE id = ?",
+                        (JOB_FAILED, now, "Lease expired on the last attempt", row["id"])
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return [dict(row) for row in rows]
+
+    def get_jobs_for_document(self, document_id: str) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM ingestion_jobs WHERE document_id = ? ORDER BY created_at DESC", (document_id,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+
+_ingestion_queue: Optional[IngestionQueue] = None
+
+
+def get_ingestion_queue() -> IngestionQueue:
+    """Returns the process-wide ingestion queue."""
+    global _ingestion_queue
+    if _ingestion_queue is None:
+        _ingestion_queue = IngestionQueue(
+            settings.INGESTION_QUEUE_PATH,
+            settings.INGESTION_VISIBILITY_TIMEOUT_SECONDS,
+            settings.INGESTION_MAX_ATTEMPTS,
+            settings.INGESTION_RETRY_BACKOFF_SECONDS
+        )
+    return _ingestion_queue
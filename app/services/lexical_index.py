@@ -0,0 +1,249 @@
+# app/services/lexical_index.py
+
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+
+# Keeps identifiers such as "AB-1234", "4.2.1" or "ISO/IEC" together as one token
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._\-/][a-z0-9]+)*")
+_PART_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased terms; compound identifiers also contribute their alphanumeric parts."""
+    terms = []
+    for token in _TOKEN_PATTERN.findall(text.lower()):
+        terms.append(token)
+        parts = _PART_PATTERN.findall(token)
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+
+def _encode_postings(postings: List[Tuple[int, int]]) -> bytes:
+    """Varint-encodes sorted (chunk_index, term_frequency) pairs, delta-coding the indexes."""
+    out = bytearray()
+    previous = 0
+    for chunk_index, frequency in postings:
+        for value in (chunk_index - previous, frequency):
+            while value >= 0x80:
+                out.append((value & 0x7F) | 0x80)
+                value >>= 7
+            out.append(value)
+        previous = chunk_index
+    return bytes(out)
+
+
+def _decode_postings(data: bytes) -> List[Tuple[int, int]]:
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    postings = []
+    chunk_index = 0
+    for i in range(0, len(values), 2):
+        chunk_index += values[i]
+        postings.append((chunk_index, values[i + 1]))
+    return postings
+
+
+class LexicalIndex:
+    """
+    Per-collection BM25 index over chunk text, stored in a local SQLite file.
+
+    Postings are kept per (collection, term, document) as a varint blob, so a
+    document can be re-indexed or dropped without touching the rest of the
+    collection. Results use the same ``{document_id}-{i}`` IDs as the vectors.
+    Like the chunk store, this is a local cache: each document is indexed with
+    a stamp, and callers rebuild documents whose stamp is stale.
+    """
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._local = threading.local()
+
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS lexical_chunks ("
+            " collection_id TEXT NOT NULL,"
+            " document_id TEXT NOT NULL,"
+            " chunk_index INTEGER NOT NULL,"
+            " length INTEGER NOT NULL,"
+            " PRIMARY KEY (collection_id, document_id, chunk_index))"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS lexical_postings ("
+            " collection_id TEXT NOT NULL,"
+            " term TEXT NOT NULL,"
+            " document_id TEXT NOT NULL,"
+            " postings BLOB NOT NULL,"
+            " PRIMARY KEY (collection_id, term, document_id))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_lexical_postings_document ON lexical_postings(document_id)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS lexical_documents ("
+            " collection_id TEXT NOT NULL,"
+            " document_id TEXT NOT NULL,"
+            " stamp TEXT NOT NULL,"
+            " PRIMARY KEY (collection_id, document_id))"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def index_document(self, collection_id: str, document_id: str, chunks: Dict[int, str], stamp: str = "") -> None:
+        """(Re)indexes every chunk of a document. ``chunks`` maps chunk index to text."""
+        lengths = []
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for chunk_index in sorted(chunks):
+            terms = tokenize(chunks[chunk_index])
+            lengths.append((collection_id, document_id, chunk_index, len(terms)))
+            for term, frequency in Counter(terms).items():
+                postings[term].append((chunk_index, frequency))
+
+        conn = self._connection()
+        conn.execute("BEGIN")
+        try:
+            self._delete(conn, document_id, collection_id)
+            conn.executemany(
+                "INSERT INTO lexical_chunks (collection_id, document_id, chunk_index, length) VALUES (?, ?, ?, ?)",
+                lengths
+            )
+            conn.executemany(
+                "INSERT INTO lexical_postings (collection_id, term, document_id, postings) VALUES (?, ?, ?, ?)",
+                [(collection_id, term, document_id, _encode_postings(items)) for term, items in postings.items()]
+            )
+            conn.execute(
+                "INSERT INTO lexical_documents (collection_id, document_id, stamp) VALUES (?, ?, ?)",
+                (collection_id, document_id, stamp)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _delete(conn: sqlite3.Connection, document_id: str, collection_id: Optional[str] = None) -> None:
+        if collection_id is None:
+            conn.execute("DELETE FROM lexical_chunks WHERE document_id = ?", (document_id,))
+            conn.execute("DELETE FROM lexical_postings WHERE document_id = ?", (document_id,))
+            conn.execute("DELETE FROM lexical_documents WHERE document_id = ?", (document_id,))
+        else:
+            conn.execute("DELETE FROM lexical_chunks WHERE collection_id = ? AND document_id = ?", (collection_id, document_id))
+            conn.execute("DELETE FROM lexical_postings WHERE collection_id = ? AND document_id = ?", (collection_id, document_id))
+            conn.execute("DELETE FROM lexical_documents WHERE collection_id = ? AND document_id = ?", (collection_id, document_id))
+
+    def delete_document(self, document_id: str) -> None:
+        self._delete(self._connection(), document_id)
+
+    def get_stamps(self, collection_id: str) -> Dict[str, str]:
+        """Returns the stamp of every document indexed in the collection."""
+        rows = self._connection().execute(
+            "SELECT document_id, stamp FROM lexical_documents WHERE collection_id = ?", (collection_id,)
+        ).fetchall()
+        return dict(rows)
+
+    def search(self, collection_id: str, query: str, top_k: int) -> List[Tuple[str, float]]:
+        """Returns up to ``top_k`` (vector_id, bm25_score) pairs, best first."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        conn = self._connection()
+
+        total_chunks, total_length = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM lexical_chunks WHERE collection_id = ?",
+            (collection_id,)
+        ).fetchone()
+        if not total_chunks:
+            return []
+        average_length = total_length / total_chunks
+
+        placeholders = ",".join("?" * len(terms))
+        rows = conn.execute(
+            f"SELECT term, document_id, postings FROM lexical_postings"
+            f" WHERE collection_id = ? AND term IN ({placeholders})",
+            [collection_id, *terms]
+        ).fetchall()
+
+        term_postings: Dict[str, List[Tuple[str, int, int]]] = defaultdict(list)
+        for term, document_id, data in rows:
+            for chunk_index, frequency in _decode_postings(data):
+                term_postings[term].append((document_id, chunk_index, frequency))
+
+        candidate_keys = {(document_id, chunk_index) for items in term_postings.values() for document_id, chunk_index, _ in items}
+        if not candidate_keys:
+            return []
+        lengths = self._chunk_lengths(conn, collection_id, candidate_keys)
+
+        scores: Dict[Tuple[str, int], float] = defaultdict(float)
+        for term, items in term_postings.items():
+            document_frequency = len(items)
+            idf = math.log(1 + (total_chunks - document_frequency + 0.5) / (document_frequency + 0.5))
+            for document_id, chunk_index, frequency in items:
+                length = lengths.get((document_id, chunk_index), average_length)
+                norm = self.k1 * (1 - self.b + self.b * length / average_length)
+                scores[(document_id, chunk_index)] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [(f"{document_id}-{chunk_index}", score) for (document_id, chunk_index), score in best]
+
+    @staticmethod
+    def _chunk_lengths(
+        conn: sqlite3.Connection, collection_id: str, keys: Iterable[Tuple[str, int]]
+    ) -> Dict[Tuple[str, int], int]:
+        lengths = {}
+        keys = list(keys)
+        for i in range(0, len(keys), 400):
+            batch = keys[i:i + 400]
+            placeholders = ",".join("(?, ?)" for _ in batch)
+            rows = conn.execute(
+                f"SELECT document_id, chunk_index, length FROM lexical_chunks"
+                f" WHERE collection_id = ? AND (document_id, chunk_index) IN (VALUES {placeholders})",
+                [collection_id, *[value for key in batch for value in key]]
+            ).fetchall()
+            lengths.update({(document_id, chunk_index): length for document_id, chunk_index, length in rows})
+        return lengths
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """Fuses several ranked ID lists; IDs ranked highly in any list come first."""
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking):
+            scores[item_id] += 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda item_id: scores[item_id], reverse=True)
+
+
+_lexical_index: Optional[LexicalIndex] = None
+_lexical_index_lock = threading.Lock()
+
+
+def get_lexical_index() -> LexicalIndex:
+    """Returns the process-wide lexical index."""
+    global _lexical_index
+    if _lexical_index is None:
+        with _lexical_index_lock:
+            if _lexical_index is None:
+                _lexical_index = LexicalIndex(settings.LEXICAL_INDEX_PATH)
+    return _lexical_index
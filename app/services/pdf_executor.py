@@ -0,0 +1,159 @@
+# app/services/pdf_executor.py
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+from app.core.config import settings
+from app.core.metrics import get_histogram
+
+logger = logging.getLogger(__name__)
+
+
+class PdfExecutorSaturated(Exception):
+    """Raised when the pool already has ``max_workers + max_queue_depth`` jobs."""
+
+
+class PdfJobTimeout(Exception):
+    """Raised when a job does not finish within the per-job timeout."""
+
+
+def _run_timed(fn: Callable[..., Any], args: tuple, kwargs: dict):
+    # Runs in the pool process; reports when the job actually started
+    started_at = time.time()
+    return started_at, fn(*args, **kwargs)
+
+
+class PdfExecutor:
+    """
+    Shared process pool for CPU-bound PDF work (merge, compress, protect).
+
+    Admission is bounded: at most ``max_workers`` jobs run and at most
+    ``max_queue_depth`` more wait; further submissions fail fast with
+    ``PdfExecutorSaturated``. A job that is still queued after
+    ``timeout_seconds`` is cancelled; one that is running cannot be stopped
+    inside its process, so the pool is recycled: its processes are
+    terminated, the jobs sharing it fail with ``BrokenProcessPool`` and every
+    slot is released. Later jobs start a fresh pool.
+
+    Metrics: ``pdf_pool.wait`` (time queued), ``pdf_pool.<operation>`` (run
+    time, errors include timeouts) and ``stats()`` for saturation.
+    """
+
+    def __init__(self, max_workers: int, max_queue_depth: int, timeout_seconds: float):
+        self.max_workers = max_workers
+        self.max_queue_depth = max_queue_depth
+        self.timeout_seconds = timeout_seconds
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.peak_in_flight = 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._pool
+
+    def _reset(self, pool: ProcessPoolExecutor, reason: str = "it is broken") -> None:
+        # A worker died (e.g. killed for memory) or hung; start a fresh pool for later jobs
+        logger.error(f"Replacing the PDF process pool: {reason}")
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        # Terminating the processes fails their futures, which releases the
+        # slots they hold (shutdown() alone would wait for them to finish)
+        for process in list((getattr(pool, "_processes", None) or {}).values()):
+            if process.is_alive():
+                process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _release(self, _future) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    async def run(self, operation: str, fn: Callable[..., Any], *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """Runs ``fn(*args, **kwargs)`` in a pool process. ``fn`` must be a picklable top-level function."""
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_queue_depth:
+                self.rejected += 1
+                raise PdfExecutorSaturated(
+                    f"PDF processing is at capacity ({self._in_flight} jobs in progress or queued)"
+                )
+            self._in_flight += 1
+            self.submitted += 1
+            self.peak_in_flight = max(self.peak_in_flight, self._in_flight)
+            pool = self._get_pool()
+
+        histogram = get_histogram(f"pdf_pool.{operation}")
+        submitted_at = time.time()
+        try:
+            future = pool.submit(_run_timed, fn, args, kwargs)
+        except BrokenProcessPool:
+            self._reset(pool)
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        try:
+            started_at, result = await asyncio.wait_for(
+                asyncio.wrap_future(future), timeout=timeout or self.timeout_seconds
+            )
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            histogram.observe(time.time() - submitted_at, error=True)
+            if not future.cancel():
+                # Already running; only killing its process frees the worker
+                self._reset(pool, f"a {operation} job timed out")
+            raise PdfJobTimeout(f"PDF {operation} did not finish within {timeout or self.timeout_seconds}s")
+        except BrokenProcessPool:
+            histogram.observe(time.time() - submitted_at, error=True)
+            self._reset(pool)
+            raise
+        except Exception:
+            histogram.observe(time.time() - submitted_at, error=True)
+            raise
+
+        finished_at = time.time()
+        get_histogram("pdf_pool.wait").observe(max(0.0, started_at - submitted_at))
+        histogram.observe(finished_at - started_at)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue_depth": self.max_queue_depth,
+                "in_flight": self._in_flight,
+                "queued": max(0, self._in_flight - self.max_workers),
+                "saturated": self._in_flight >= self.max_workers + self.max_queue_depth,
+                "peak_in_flight": self.peak_in_flight,
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+            }
+
+
+_pdf_executor: Optional[PdfExecutor] = None
+_pdf_executor_lock = threading.Lock()
+
+
+def get_pdf_executor() -> PdfExecutor:
+    """Returns the process-wide PDF executor."""
+    global _pdf_executor
+    if _pdf_executor is None:
+        with _pdf_executor_lock:
+            if _pdf_executor is None:
+                _pdf_executor = PdfExecutor(
+                    max_workers=settings.PDF_TOOL_WORKERS or os.cpu_count() or 1,
+                    max_queue_depth=settings.PDF_TOOL_MAX_QUEUE_DEPTH,
+                    timeout_seconds=settings.PDF_TOOL_TIMEOUT_SECONDS
+                )
+    return _pdf_executor
@@ -1,19 +1,259 @@
 # app/services/pdf_processing.py
 
+import asyncio
+import logging
+import mmap
+import os
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
 from PyPDF2 import PdfReader # pip install pypdf
 from langchain_text_splitters import RecursiveCharacterTextSplitter # pip install langchain-text-splitters
 from fastapi import UploadFile
-from typing import List
+from typing import Any, AsyncIterator, Iterator, List, Optional, Tuple, Union
+from bisect import bisect_right
+from io import BytesIO
+from app.core.config import settings
+from app.services.tokenization import get_chunk_length_function, get_token_counter
 
-async def extract_text_from_pdf(pdf_file: UploadFile) -> str:
-    """Extracts text from a PDF file."""
+logger = logging.getLogger(__name__)
+
+PAGE_SEPARATOR = "\n\n"
+
+_extraction_pool: Optional[ProcessPoolExecutor] = None
+_extraction_pool_lock = threading.Lock()
+_extraction_workers: Optional[int] = None # Overrides PDF_EXTRACTION_WORKERS, see set_extraction_workers
+_pool_document: Optional[Tuple[str, Any, Any]] = None # (document key, parsed document, mapping) in a pool process
+
+
+@dataclass
+class ExtractedPages:
+    """Per-page text of a PDF, in page order, plus each page's offset in the joined text."""
+    pages: List[str]
+    offsets: List[int] = field(default_factory=list)
+    text: str = ""
+
+    @classmethod
+    def from_pages(cls, pages: List[str]) -> "ExtractedPages":
+        offsets = []
+        position = 0
+        for page in pages:
+            offsets.append(position)
+            position += len(page) + len(PAGE_SEPARATOR)
+        # Join once instead of growing a string page by page
+        return cls(pages=pages, offsets=offsets, text=PAGE_SEPARATOR.join(pages))
+
+
+def set_extraction_workers(workers: int) -> None:
+    """
+    Overrides PDF_EXTRACTION_WORKERS for this process. The ingestion worker
+    uses it so its processes do not each start a pool of their own; 1
+    extracts in a thread.
+    """
+    global _extraction_workers
+    _extraction_workers = workers
+
+
+def _get_extraction_workers() -> int:
+    if _extraction_workers is not None:
+        return max(1, _extraction_workers)
+    return settings.PDF_EXTRACTION_WORKERS or os.cpu_count() or 1
+
+
+def _get_extraction_pool() -> ProcessPoolExecutor:
+    global _extraction_pool
+    with _extraction_pool_lock:
+        if _extraction_pool is None:
+            _extraction_pool = ProcessPoolExecutor(max_workers=_get_extraction_workers())
+        return _extraction_pool
+
+
+def _reset_extraction_pool(pool: ProcessPoolExecutor) -> None:
+    # A worker died (e.g. killed for memory); later extractions get a fresh pool
+    global _extraction_pool
+    logger.error("PDF extraction pool is broken, replacing it")
+    with _extraction_pool_lock:
+        if _extraction_pool is pool:
+            _extraction_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _write_temp_pdf(pdf_bytes: bytes) -> str:
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    with os.fdopen(fd, "wb") as f:
+        f.write(pdf_bytes)
+    return path
+
+
+def _remove_temp_pdf(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError as e:
+        logger.warning(f"Could not remove temporary PDF {path}: {e}")
+
+
+def _submit_page_ranges(pdf_path: str, page_count: int, workers: int, backend: str) -> Tuple[ProcessPoolExecutor, List[asyncio.Future]]:
+    # A couple of ranges per worker evens out pages that are slow to parse.
+    # Tasks carry the path of the spooled PDF, not its bytes.
+    loop = asyncio.get_running_loop()
+    pool = _get_extraction_pool()
+    document_key = uuid.uuid4().hex
+    futures = []
+    try:
+        for start, end in _page_ranges(page_count, workers * 2):
+            futures.append(loop.run_in_executor(
+                pool, _extract_page_range_from_file, pdf_path, document_key, start, end, backend
+            ))
+    except BrokenProcessPool:
+        for future in futures:
+            future.cancel()
+        _reset_extraction_pool(pool)
+        raise
+    return pool, futures
+
+
+def _count_pages(pdf_bytes: bytes, backend: str) -> int:
+    if backend == "pymupdf":
+        import fitz
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+            return doc.page_count
+    return len(PdfReader(BytesIO(pdf_bytes)).pages)
+
+
+def _extract_page_range(pdf_bytes: bytes, start: int, end: int, backend: str) -> List[str]:
+    """Extracts the text of pages ``start``..``end - 1``."""
+    if backend == "pymupdf":
+        import fitz
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+            return [doc.load_page(i).get_text("text") or "" for i in range(start, end)]
+    reader = PdfReader(BytesIO(pdf_bytes))
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def _open_pool_document(pdf_path: str, document_key: str, backend: str):
+    """
+    Opens the spooled PDF in a pool process. The parsed document is kept for
+    the other ranges of the same document that land on this process, so it is
+    parsed once per process rather than once per range. PyPDF2 reads from a
+    read-only mapping, which the pool processes share through the page cache.
+    """
+    global _pool_document
+    if _pool_document is not None and _pool_document[0] == document_key:
+        return _pool_document[1]
+    _close_pool_document()
+    if backend == "pymupdf":
+        import fitz
+        _pool_document = (document_key, fitz.open(pdf_path), None)
+    else:
+        with open(pdf_path, "rb") as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _pool_document = (document_key, PdfReader(mapping), mapping)
+    return _pool_document[1]
+
+
+def _close_pool_document() -> None:
+    global _pool_document
+    if _pool_document is None:
+        return
+    _, document, mapping = _pool_document
+    _pool_document = None
+    if mapping is None:
+        document.close()
+    else:
+        mapping.close()
+
+
+def _extract_page_range_from_file(pdf_path: str, document_key: str, start: int, end: int, backend: str) -> List[str]:
+    """Extracts the text of pages ``start``..``end - 1`` of a spooled PDF. Runs in a pool process."""
+    document = _open_pool_document(pdf_path, document_key, backend)
+    if backend == "pymupdf":
+        return [document.load_page(i).get_text("text") or "" for i in range(start, end)]
+    return [document.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def _page_ranges(page_count: int, parts: int) -> List[Tuple[int, int]]:
+    size = max(1, -(-page_count // parts))
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+
+async def extract_pages_from_pdf(pdf_bytes: bytes, backend: Optional[str] = None) -> ExtractedPages:
+    """
+    Extracts text page by page, fanning page ranges out to a process pool.
+    The PDF is written to a temp file once and the workers read it from there.
+
+    Small documents (fewer than PDF_PARALLEL_MIN_PAGES pages) are extracted in
+    a single worker thread since process start-up would dominate.
+    """
+    backend = backend or settings.PDF_TEXT_BACKEND
+    page_count = await asyncio.to_thread(_count_pages, pdf_bytes, backend)
+    if page_count == 0:
+        return ExtractedPages.from_pages([])
+
+    workers = _get_extraction_workers()
+    if page_count < settings.PDF_PARALLEL_MIN_PAGES or workers <= 1:
+        pages = await asyncio.to_thread(_extract_page_range, pdf_bytes, 0, page_count, backend)
+        return ExtractedPages.from_pages(pages)
+
+    pdf_path = await asyncio.to_thread(_write_temp_pdf, pdf_bytes)
+    try:
+        pool, futures = _submit_page_ranges(pdf_path, page_count, workers, backend)
+        try:
+            results = await asyncio.gather(*futures)
+        except BrokenProcessPool:
+            _reset_extraction_pool(pool)
+            raise
+    finally:
+        _remove_temp_pdf(pdf_path)
+    return ExtractedPages.from_pages([page for pages in results for page in pages])
+
+
+async def iter_pdf_pages(pdf_bytes: bytes, backend: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Yields page texts in order as soon as each page range has been extracted,
+    so downstream stages can start before the whole document is parsed.
+    """
+    backend = backend or settings.PDF_TEXT_BACKEND
+    page_count = await asyncio.to_thread(_count_pages, pdf_bytes, backend)
+    if page_count == 0:
+        return
+
+    workers = _get_extraction_workers()
+    if page_count < settings.PDF_PARALLEL_MIN_PAGES or workers <= 1:
+        for page in await asyncio.to_thread(_extract_page_range, pdf_bytes, 0, page_count, backend):
+            yield page
+        return
+
+    pdf_path = await asyncio.to_thread(_write_temp_pdf, pdf_bytes)
+    futures = []
     try:
-        pdf_file.file.seek(0) # Reset file pointer
-        reader = PdfReader(pdf_file.file)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() or ""
-        return text
+        pool, futures = _submit_page_ranges(pdf_path, page_count, workers, backend)
+        for future in futures:
+            try:
+                pages = await future
+            except BrokenProcessPool:
+                _reset_extraction_pool(pool)
+                raise
+            for page in pages:
+                yield page
+    finally:
+        for future in futures:
+            future.cancel()
+        _remove_temp_pdf(pdf_path)
+
+
+async def extract_text_from_pdf(pdf_file: Union[UploadFile, bytes]) -> str:
+    """Extracts text from a PDF file (an UploadFile or the raw PDF bytes)."""
+    try:
+        if isinstance(pdf_file, (bytes, bytearray)):
+            pdf_bytes = bytes(pdf_file)
+        else:
+            pdf_file.file.seek(0) # Reset file pointer
+            pdf_bytes = pdf_file.file.read()
+        extracted = await extract_pages_from_pdf(pdf_bytes)
+        return extracted.text
     except Exception as e:
         print(f"Error extracting text from PDF: {e}")
         raise ValueError(f"Could not extract text from PDF: {e}")
@@ -23,8 +263,132 @@ def chunk_text(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
-        length_function=len, # or a token counter if you have one
+        length_function=get_chunk_length_function(), # characters or tokens, see CHUNK_LENGTH_UNIT
         separators=["\n\n", "\n", " ", ""] # Prioritize larger breaks
     )
     chunks = text_splitter.split_text(text)
-    return chunks
\ No newline at end of file
+    return chunks
+
+
+@dataclass
+class TextChunk:
+    """A chunk of document text with its position in the source PDF (1-based pages)."""
+    index: int
+    text: str
+    page_start: int
+    page_end: int
+    char_start: int
+    char_end: int
+
+
+class StreamingChunker:
+    """
+    Incremental, page-aware text splitter.
+
+    Pages are fed one at a time with ``add_page``. Whenever enough text is
+    buffered, every chunk except the trailing (possibly incomplete) one is
+    emitted, so only a few chunks' worth of text is held in memory. Each chunk
+    records the pages it spans and its character offsets in the joined text.
+    """
+
+    def __init__(self, chunk_size: int, chunk_overlap: int):
+        self.chunk_size = chunk_size
+        self._length_function = get_chunk_length_function()
+        self._counter = get_token_counter() if settings.CHUNK_LENGTH_UNIT == "tokens" else None
+        self._splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            length_function=self._length_function,
+            separators=["\n\n", "\n", " ", ""] # Prioritize larger breaks
+        )
+        self._buffer = ""
+        self._buffer_start = 0 # Offset of the buffer in the joined document text
+        self._page_offsets: List[int] = [] # Offset where each page starts
+        self._next_offset = 0
+        self._next_index = 0
+
+    def add_page(self, page_text: str) -> Iterator[TextChunk]:
+        if self._page_offsets:
+            self._buffer += PAGE_SEPARATOR
+            self._next_offset += len(PAGE_SEPARATOR)
+        self._page_offsets.append(self._next_offset)
+        self._buffer += page_text
+        self._next_offset += len(page_text)
+
+        # Only split once there is enough text for the early chunks to be final
+        if self._buffered_length() >= self.chunk_size * 4:
+            yield from self._split(final=False)
+
+    def _buffered_length(self) -> int:
+        if self._counter is None:
+            return len(self._buffer)
+        # Cheap upper bound first; tokens are never more than characters
+        if len(self._buffer) < self.chunk_size * 4:
+            return len(self._buffer)
+        return sum(self._counter.count_many(self._buffer.split(PAGE_SEPARATOR)))
+
+    def finish(self) -> Iterator[TextChunk]:
+        yield from self._split(final=True)
+
+    def _page_at(self, offset: int) -> int:
+        return max(1, bisect_right(self._page_offsets, offset))
+
+    def _split(self, final: bool) -> Iterator[TextChunk]:
+        if self._counter is not None:
+            # Count the splitter's first-level candidate pieces in one batch
+            # so its per-piece length calls hit the counter's memo
+            for separator in ("\n\n", "\n"):
+                self._counter.count_many(self._buffer.split(separator))
+        texts = self._splitter.split_text(self._buffer)
+        if not texts:
+            return
+        starts = self._chunk_starts(texts)
+        ready = len(texts) if final else len(texts) - 1
+        for text, start in zip(texts[:ready], starts):
+            char_start = self._buffer_start + start
+            char_end = char_start + len(text)
+            yield TextChunk(
+                index=self._next_index,
+                text=text,
+                page_start=self._page_at(char_start),
+                page_end=self._page_at(max(char_start, char_end - 1)),
+                char_start=char_start,
+                char_end=char_end
+            )
+            self._next_index += 1
+
+        if final:
+            self._buffer = ""
+            self._buffer_start = self._next_offset
+        else:
+            # Keep the trailing chunk (and any overlap) for the next split
+            keep_from = starts[-1]
+            self._buffer = self._buffer[keep_from:]
+            self._buffer_start += keep_from
+
+    def _chunk_starts(self, texts: List[str]) -> List[int]:
+        # Chunks are substrings of the buffer in order, each starting after the
+        # previous one. Searched here rather than with the splitter's
+        # add_start_index, which steps back by chunk_overlap characters and so
+        # starts too late when the overlap is counted in tokens.
+        starts = []
+        search_from = 0
+        for text in texts:
+            start = self._buffer.find(text, search_from)
+            if start < 0:
+                raise ValueError(f"Chunk {self._next_index + len(starts)} was not found in the buffered text")
+            starts.append(start)
+            search_from = start + 1
+        return starts
+
+
+async def chunk_pages_stream(
+    pages: AsyncIterator[str], chunk_size: int, chunk_overlap: int
+) -> AsyncIterator[TextChunk]:
+    """Chunks a stream of page texts, yielding chunks while pages are still arriving."""
+    chunker = StreamingChunker(chunk_size, chunk_overlap)
+    async for page_text in pages:
+        for chunk in chunker.add_page(page_text):
+            yield chunk
+    for chunk in chunker.finish():
+        yield chunk
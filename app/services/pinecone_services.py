@@ -3,37 +3,35 @@
 
 from typing import List, Dict, Any
 from uuid import UUID
-from app.integrations.vector_db import get_pinecone_index
+from app.integrations.vector_store import get_vector_store
 from app.core.config import settings
 import asyncio
 
 async def upsert_vectors_to_pinecone(
     user_id: str, vectors_data: List[Dict[str, Any]]
 ):
-    """Upserts vectors to the user's specific Pinecone namespace."""
-    pinecone_index = await get_pinecone_index()
+    """Upserts vectors to the user's specific namespace in the configured vector store."""
     namespace = f"user-{user_id}"
     try:
         # Each dict in vectors_data should have 'id', 'values', 'metadata'
-        # The Pinecone client's upsert method handles batch operations efficiently
-        response = await asyncio.get_event_loop().run_in_executor(
-            None,
-            lambda: pinecone_index.upsert(vectors=vectors_data, namespace=namespace, batch_size=100)
-        )
-        print(f"Successfully upserted {len(vectors_data)} vectors to Pinecone for user {user_id} in namespace {namespace}.")
+        response = await get_vector_store().upsert(namespace, vectors_data)
+        print(f"Successfully upserted {len(vectors_data)} vectors to {settings.VECTOR_STORE_BACKEND} for user {user_id} in namespace {namespace}.")
         return response
     except Exception as e:
-        print(f"Error upserting vectors to Pinecone for user {user_id}: {e}")
-        raise RuntimeError(f"Failed to upsert vectors to Pinecone: {e}")
+        print(f"Error upserting vectors to {settings.VECTOR_STORE_BACKEND} for user {user_id}: {e}")
+        raise RuntimeError(f"Failed to upsert vectors to {settings.VECTOR_STORE_BACKEND}: {e}")
 
 async def query_pinecone(
     user_id: str,
     query_embedding: List[float],
     collection_id: UUID,
-    top_k: int = settings.TOP_K_RETRIEVAL
+    top_k: int = settings.TOP_K_RETRIEVAL,
+    include_metadata: bool = True
 ) -> List[Dict[str, Any]]:
-    """Queries Pinecone for relevant document chunks."""
-    pinecone_index = await get_pinecone_index()
+    """
+    Queries the configured vector store for relevant document chunks.
+    Pass include_metadata=False to get IDs and scores only (chunk text lives in the chunk store).
+    """
     namespace = f"user-{user_id}"
 
     # Define filter to search only within the specified collection
@@ -42,14 +40,46 @@ async def query_pinecone(
     }
 
     try:
-        response = pinecone_index.query(
-            vector=query_embedding,
-            top_k=top_k,
-            include_metadata=True, # Essential to get back chunk content
-            namespace=namespace,
-            filter=pinecone_filter
+        return await get_vector_store().query(
+            namespace,
+            query_embedding,
+            top_k,
+            filter=pinecone_filter,
+            include_metadata=include_metadata
         )
-        return response.matches
     except Exception as e:
-        print(f"Error querying Pinecone for user {user_id}: {e}")
-        raise RuntimeError(f"Failed to query Pinecone: {e}")
\ No newline at end of file
+        print(f"Error querying {settings.VECTOR_STORE_BACKEND} for user {user_id}: {e}")
+        raise RuntimeError(f"Failed to query {settings.VECTOR_STORE_BACKEND}: {e}")
+
+async def fetch_vector_metadata(user_id: str, vector_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Fetches the metadata of specific vectors from the user's namespace."""
+    if not vector_ids:
+        return {}
+    namespace = f"user-{user_id}"
+    try:
+        return await get_vector_store().fetch_metadata(namespace, vector_ids)
+    except Exception as e:
+        print(f"Error fetching vectors from {settings.VECTOR_STORE_BACKEND} for user {user_id}: {e}")
+        raise RuntimeError(f"Failed to fetch vectors from {settings.VECTOR_STORE_BACKEND}: {e}")
+
+async def fetch_vectors_from_pinecone(user_id: str, vector_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Fetches the values and metadata of specific vectors from the user's namespace."""
+    if not vector_ids:
+        return {}
+    namespace = f"user-{user_id}"
+    try:
+        return await get_vector_store().fetch_vectors(namespace, vector_ids)
+    except Exception as e:
+        print(f"Error fetching vectors from {settings.VECTOR_STORE_BACKEND} for user {user_id}: {e}")
+        raise RuntimeError(f"Failed to fetch vectors from {settings.VECTOR_STORE_BACKEND}: {e}")
+
+async def delete_vectors_from_pinecone(user_id: str, vector_ids: List[str]) -> int:
+    """Deletes vectors by ID from the user's namespace."""
+    if not vector_ids:
+        return 0
+    namespace = f"user-{user_id}"
+    try:
+        return await get_vector_store().delete(namespace, vector_ids)
+    except Exception as e:
+        print(f"Error deleting vectors from {settings.VECTOR_STORE_BACKEND} for user {user_id}: {e}")
+        raise RuntimeError(f"Failed to delete vectors from {settings.VECTOR_STORE_BACKEND}: {e}")
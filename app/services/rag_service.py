@@ -1,42 +1,107 @@
 # app/services/rag_service.py
 
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable, Tuple
+from dataclasses import dataclass, field
+import asyncio
+import hashlib
+import logging
 import uuid
 from uuid import UUID
-from app.services.pdf_processing import extract_text_from_pdf, chunk_text
-from app.services.embedding_services import generate_embedding, get_llm_completion_stream
-from app.services.pinecone_services import upsert_vectors_to_pinecone, query_pinecone
-from app.database.crud import create_document_chunks, get_messages_by_conversation
+from app.services.pdf_processing import TextChunk, chunk_pages_stream, iter_pdf_pages
+from app.services.embedding_services import generate_embedding, generate_embeddings_batch, get_llm_completion_stream
+from app.services.pinecone_services import (
+    upsert_vectors_to_pinecone, query_pinecone, fetch_vector_metadata, delete_vectors_from_pinecone,
+    fetch_vectors_from_pinecone
+)
+from app.services.chunk_store import get_chunk_store, parse_vector_id
+from app.services.lexical_index import get_lexical_index, reciprocal_rank_fusion
+from app.services.context_packing import pack_contexts
+from app.services.reranker import get_reranker, rerank
+from app.services.answer_cache import CachedAnswer, collection_version, get_answer_cache, invalidate_collection_answers
+from app.database.crud import (
+    create_document_chunks, delete_document_chunks, get_collection_document_states, get_document_chunks,
+    get_messages_by_conversation
+)
 from app.core.config import settings
 from fastapi import UploadFile
 from app.integrations.supabase_connect import get_supabase_client,Client
 
+logger = logging.getLogger(__name__)
+
+
+def chunk_content_hash(text: str) -> str:
+    """sha256 of a chunk's text, stored in document_chunks.content_hash."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def document_stamp(document: Dict[str, Any]) -> str:
+    """
+    The revision a documents row was indexed from (its file hash). The local
+    chunk store and BM25 index record it, so a host can tell that another one
+    re-indexed the document.
+    """
+    return document.get('file_hash') or ""
+
+
+def _read_durable_chunk_texts(supabase_client: Client, document_id: str, document: Dict[str, Any]) -> Dict[int, str]:
+    """
+    Reads a document's chunk text from document_chunks and caches it in the
+    local chunk store. Documents still being (re-)indexed are not cached,
+    since their rows may be mid-update. Runs in a worker thread.
+    """
+    rows = get_document_chunks(supabase_client, document_id, include_content=True)
+    texts = {row['chunk_index']: row['content'] for row in rows if row.get('content') is not None}
+    if document.get('status') == 'completed':
+        get_chunk_store().put_document(document_id, texts, document_stamp(document))
+    return texts
+
+
 async def process_pdf_for_rag(
     user_id: str,
     collection_id: UUID,
     document_id: UUID,
     file_name: str,
-    file_content_bytes: bytes,  # Pass bytes for background task
-    file:UploadFile,
-    supabase_client: Client  # Pass Supabase client for DB operations
+    file_content_bytes: Optional[bytes],  # Pass bytes when there is no spooled upload to re-read
+    file: Optional[UploadFile],
+    supabase_client: Client,  # Pass Supabase client for DB operations
+    on_stage: Optional[Callable[[str], None]] = None
 ):
     """
     Orchestrates the PDF processing, embedding generation, and Pinecone upsert.
-    Intended to be run as a FastAPI BackgroundTask.
+    Run as a FastAPI BackgroundTask or by the ingestion worker.
+
+    If the document already has chunks (a re-index of an edited file, or a
+    retried job), chunks whose content hash was indexed before, at any index,
+    reuse that vector: it is fetched and re-upserted under the chunk's new ID
+    with fresh metadata. Only unseen hashes are embedded, and vectors past the
+    new last chunk are deleted.
+
+    Chunk text is stored durably in document_chunks.content before the
+    vectors become searchable; the local chunk store and BM25 index are
+    caches of it.
     
     Args:
         user_id: ID of the user who owns the document
         collection_id: ID of the collection this document belongs to
         document_id: ID of the document being processed
         file_name: Original name of the uploaded file
-        file_content_bytes: Binary content of the PDF file
-        file:UploadFile,
+        file_content_bytes: Binary content of the PDF file, or None when ``file`` is given
+        file: The uploaded (spooled) file, or None to read from file_content_bytes
         supabase_client: Supabase client instance for database operations
+        on_stage: Optional callback invoked with the name of each stage as it starts
     """
     from fastapi import HTTPException
     import logging
     
     logger = logging.getLogger(__name__)
+
+    def report_stage(stage: str):
+        if on_stage is None:
+            return
+        try:
+            on_stage(stage)
+        except Exception as e:
+            logger.error(f"Failed to report stage '{stage}' for document {document_id}: {e}")
     
     try:
         logger.info(f"Starting RAG processing for document {document_id} in collection {collection_id}")
@@ -50,103 +115,216 @@ async def process_pdf_for_rag(
             # Continue processing even if status update fails
         logger.info(f"Document status updated to 'processing'")    
 
-        # 2. Extract Text
-        pdf_file_mock = file
+        # Content hashes of the chunks indexed previously, if any
         try:
-            full_text = await extract_text_from_pdf(pdf_file_mock)
-            if not full_text.strip():
-                raise ValueError("Extracted text is empty")
+            existing_rows = await asyncio.to_thread(get_document_chunks, supabase_client, document_id)
+            existing_hashes: Dict[int, Optional[str]] = {
+                row['chunk_index']: row.get('content_hash') for row in existing_rows
+            }
         except Exception as e:
-            error_msg = f"Failed to extract text from PDF: {str(e)}"
-            logger.error(error_msg)
-            update_document_status(supabase_client, document_id, "failed")
-            raise HTTPException(status_code=400, detail=error_msg)
-        logger.info(f"Text extracted from PDF")
+            logger.error(f"Failed to load existing chunks, re-indexing everything: {e}")
+            existing_hashes = {}
+
+        # 2-3. Extract and chunk text as a stream. Embedding batches are started
+        #      as soon as enough chunks are ready, while later pages are still
+        #      being extracted.
+        report_stage("extracting")
+        if file is not None:
+            file.file.seek(0) # Reset file pointer
+            pdf_bytes = file.file.read()
+        else:
+            pdf_bytes = file_content_bytes
+
+        chunks: List[TextChunk] = []
+        changed_chunks: List[TextChunk] = []
+        reused_chunks: List[TextChunk] = []
+        chunk_hashes: Dict[int, str] = {}
+        # Any previously indexed chunk with a given text can lend its vector
+        hash_sources: Dict[str, int] = {}
+        for index, content_hash in sorted(existing_hashes.items(), reverse=True):
+            if content_hash:
+                hash_sources[content_hash] = index
+        embedding_tasks = []
+        pending_texts: List[str] = []
+        embedding_slots = asyncio.Semaphore(max(1, settings.EMBEDDING_MAX_CONCURRENT_BATCHES))
 
-        # 3. Chunk Text
+        async def embed_batch(texts: List[str]):
+            async with embedding_slots:
+                return await generate_embeddings_batch(texts, task_type="RETRIEVAL_DOCUMENT")
+
+        def queue_embedding(chunk: Optional[TextChunk], flush: bool = False):
+            nonlocal pending_texts
+            if chunk is not None:
+                changed_chunks.append(chunk)
+                pending_texts.append(chunk.text)
+            if pending_texts and (flush or len(pending_texts) >= settings.EMBEDDING_BATCH_SIZE):
+                embedding_tasks.append(asyncio.create_task(embed_batch(pending_texts)))
+                pending_texts = []
+
+        def chunk_metadata(chunk: TextChunk) -> Dict[str, Any]:
+            return {
+                "document_id": str(document_id),
+                "collection_id": str(collection_id),
+                "file_name": file_name,
+                "chunk_index": chunk.index,
+                "page_start": chunk.page_start,
+                "page_end": chunk.page_end,
+                "char_start": chunk.char_start,
+                "char_end": chunk.char_end,
+                "content_hash": chunk_hashes[chunk.index]
+            }
+
+        reused_vectors = []
+        supabase_chunks_data = []
         try:
-            chunks = chunk_text(full_text, settings.CHUNK_SIZE, settings.CHUNK_OVERLAP)
+            async for chunk in chunk_pages_stream(iter_pdf_pages(pdf_bytes), settings.CHUNK_SIZE, settings.CHUNK_OVERLAP):
+                chunks.append(chunk)
+                chunk_hashes[chunk.index] = chunk_content_hash(chunk.text)
+                if chunk_hashes[chunk.index] in hash_sources:
+                    reused_chunks.append(chunk) # Same text indexed before, its vector can be reused
+                else:
+                    queue_embedding(chunk)
             if not chunks:
-                raise ValueError("No text chunks generated from the document")
+                raise ValueError("Extracted text is empty")
+
+            # Fetch the vectors to reuse before any upsert can overwrite them,
+            # preferring the chunk's own index when its text did not move
+            source_ids = {}
+            for chunk in reused_chunks:
+                i = chunk.index
+                source_index = i if existing_hashes.get(i) == chunk_hashes[i] else hash_sources[chunk_hashes[i]]
+                source_ids[i] = f"{document_id}-{source_index}"
+            fetched = {}
+            if source_ids:
+                try:
+                    fetched = await fetch_vectors_from_pinecone(user_id, sorted(set(source_ids.values())))
+                except Exception as e:
+                    logger.error(f"Failed to fetch vectors to reuse, embedding those chunks again: {e}")
+            for chunk in reused_chunks:
+                i = chunk.index
+                vector = fetched.get(source_ids[i])
+                if vector is None or vector["metadata"].get("content_hash") not in (None, chunk_hashes[i]):
+                    queue_embedding(chunk) # The vector is gone or no longer holds this text
+                    continue
+                metadata = chunk_metadata(chunk)
+                if source_ids[i] != f"{document_id}-{i}" or vector["metadata"] != metadata:
+                    reused_vectors.append({"id": f"{document_id}-{i}", "values": vector["values"], "metadata": metadata})
+                if existing_hashes.get(i) != chunk_hashes[i]:
+                    supabase_chunks_data.append({
+                        "id": str(uuid.uuid4()),
+                        "document_id": str(document_id),
+                        "chunk_index": i,
+                        "content": chunk.text,
+                        "content_hash": chunk_hashes[i]
+                    })
+            queue_embedding(None, flush=True)
         except Exception as e:
-            error_msg = f"Failed to chunk text: {str(e)}"
+            for task in embedding_tasks:
+                task.cancel()
+            error_msg = f"Failed to extract text from PDF: {str(e)}"
             logger.error(error_msg)
             update_document_status(supabase_client, document_id, "failed")
             raise HTTPException(status_code=400, detail=error_msg)
-        logger.info(f"Text chunked")
+        logger.info(f"Text extracted and chunked into {len(chunks)} chunks")
+        removed_indexes = sorted(index for index in existing_hashes if index not in chunk_hashes)
+        if existing_hashes:
+            logger.info(
+                f"Re-indexing document {document_id}: {len(chunks) - len(changed_chunks)} reused "
+                f"({len(reused_vectors)} moved or updated), {len(changed_chunks)} embedded, "
+                f"{len(removed_indexes)} removed chunks"
+            )
 
-        pinecone_vectors_data = []
-        supabase_chunks_data = []
+        pinecone_vectors_data = list(reused_vectors)
         
-        # 4. Process each chunk
-        for i, chunk_text_content in enumerate(chunks):
-            try:
-                # Generate a unique ID for the chunk
-                chunk_vector_id = f"{document_id}-{i}"
-                
-                # Generate embedding for the chunk
-                embedding = await generate_embedding(chunk_text_content)
-                
-                # Prepare data for Pinecone
-                pinecone_vectors_data.append({
-                    "id": chunk_vector_id,
-                    "values": embedding,
-                    "metadata": {
-                    "document_id": str(document_id),
-                    "collection_id": str(collection_id),
-                    "file_name": file_name,
-                    "chunk_index": i,
-                    "content": chunk_text_content[:500]  # Store first 500 chars in metadata
-                }
-                })
-            except Exception as e:
-                logger.error(f"Error processing chunk {i}: {str(e)}")
+        # 4. Wait for the remaining embedding batches
+        report_stage("embedding")
+        embeddings = [embedding for batch in await asyncio.gather(*embedding_tasks) for embedding in batch]
+
+        for chunk, embedding in zip(changed_chunks, embeddings):
+            i = chunk.index
+            if embedding is None:
+                logger.error(f"Error processing chunk {i}: no embedding generated")
                 # Continue with next chunk even if one fails
                 continue
 
-            try:
-                chunk_id = str(uuid.uuid4())
-                # Ensure document_id is a valid UUID string
-                supabase_chunks_data.append({
-                    "id": chunk_id,
-                    "document_id": str(document_id),  # Let Supabase handle UUID conversion
-                    "chunk_index": i
-                })
-            except Exception as e:
-                logger.error(f"Error processing chunk {i}: {str(e)}")
-                # Continue with next chunk even if one fails
-                continue                
-            
+            # Generate a unique ID for the chunk
+            chunk_vector_id = f"{document_id}-{i}"
+
+            # Prepare data for Pinecone
+            pinecone_vectors_data.append({
+                "id": chunk_vector_id,
+                "values": embedding,
+                "metadata": chunk_metadata(chunk)
+            })
+
+            supabase_chunks_data.append({
+                "id": str(uuid.uuid4()),
+                "document_id": str(document_id),  # Let Supabase handle UUID conversion
+                "chunk_index": i,
+                "content": chunk.text,
+                "content_hash": chunk_hashes[i]
+            })
         
-        if not pinecone_vectors_data:
+        if changed_chunks and not pinecone_vectors_data:
             error_msg = "No valid chunks were processed successfully"
             logger.error(error_msg)
             update_document_status(supabase_client, document_id, "failed")
             raise HTTPException(status_code=400, detail=error_msg)
         logger.info(f"Vectors generated")
 
-        # 5. Upsert vectors to Pinecone
+        # 5. Cache the full chunk text locally
+        report_stage("indexing")
+        stamp = hashlib.sha256(pdf_bytes).hexdigest() # Matches documents.file_hash
         try:
-            logger.info(f"Upserting {len(pinecone_vectors_data)} vectors to Pinecone")
-            await upsert_vectors_to_pinecone(user_id, pinecone_vectors_data)
+            chunk_texts = {chunk.index: chunk.text for chunk in chunks}
+            await asyncio.to_thread(get_chunk_store().put_document, str(document_id), chunk_texts, stamp)
+            await asyncio.to_thread(
+                get_lexical_index().index_document, str(collection_id), str(document_id), chunk_texts, stamp
+            )
         except Exception as e:
-            error_msg = f"Failed to upsert vectors to Pinecone: {str(e)}"
+            error_msg = f"Failed to store chunk text: {str(e)}"
             logger.error(error_msg)
             update_document_status(supabase_client, document_id, "failed")
             raise HTTPException(status_code=500, detail=error_msg)
-        logger.info(f"Vectors upserted")
 
-        # 6. Store chunk metadata in Supabase
+        # 6. Store chunk rows with their text in Supabase (the durable copy, before the vectors become searchable)
+        stale_indexes = [i for i in existing_hashes if i in chunk_hashes and existing_hashes[i] != chunk_hashes[i]]
         try:
             logger.info(f"Storing {len(supabase_chunks_data)} chunks in Supabase")
+            if stale_indexes or removed_indexes:
+                delete_document_chunks(supabase_client, document_id, sorted(stale_indexes) + removed_indexes)
             create_document_chunks(supabase_client, supabase_chunks_data)
         except Exception as e:
             error_msg = f"Failed to store chunks in Supabase: {str(e)}"
             logger.error(error_msg)
-            # Don't fail the entire process if Supabase storage fails
-            # as Pinecone upsert was successful
+            update_document_status(supabase_client, document_id, "failed")
+            raise HTTPException(status_code=500, detail=error_msg)
         logger.info(f"Chunks stored")
-        # 7. Update document status to completed
+
+        # 7. Upsert new and changed vectors to Pinecone, delete the ones past the new last chunk
+        try:
+            if pinecone_vectors_data:
+                logger.info(f"Upserting {len(pinecone_vectors_data)} vectors to Pinecone")
+                await upsert_vectors_to_pinecone(user_id, pinecone_vectors_data)
+            if removed_indexes:
+                logger.info(f"Deleting {len(removed_indexes)} vectors that are no longer in the document")
+                await delete_vectors_from_pinecone(user_id, [f"{document_id}-{i}" for i in removed_indexes])
+        except Exception as e:
+            error_msg = f"Failed to upsert vectors to Pinecone: {str(e)}"
+            logger.error(error_msg)
+            # Drop the new rows so a retry embeds these chunks again
+            try:
+                delete_document_chunks(supabase_client, document_id, [row["chunk_index"] for row in supabase_chunks_data])
+            except Exception as cleanup_err:
+                logger.error(f"Failed to remove chunk rows of document {document_id}: {cleanup_err}")
+            update_document_status(supabase_client, document_id, "failed")
+            raise HTTPException(status_code=500, detail=error_msg)
+        logger.info(f"Vectors upserted")
+
+        # Answers cached for this collection may no longer be correct
+        await asyncio.to_thread(invalidate_collection_answers, str(collection_id))
+
+        # 8. Update document status to completed
         try:
             update_document_status(supabase_client, document_id, "completed")
             logger.info(f"Successfully processed RAG for document {document_id} ({file_name})")
@@ -167,24 +345,369 @@ async def process_pdf_for_rag(
     logger.info(f"Document processing completed successfully")
 
 
+async def lookup_cached_answer(
+    user_id: str, query: str, collection_id: UUID, mode: Optional[str] = None
+) -> Tuple[Optional[List[float]], Optional[CachedAnswer]]:
+    """
+    Embeds the query and looks for a cached answer to a near-identical question
+    in the same collection. Returns the embedding (so retrieval can reuse it)
+    and the cached answer, if any.
+    """
+    cache = get_answer_cache()
+    if cache is None:
+        return None, None
+    try:
+        embedding = await generate_embedding(query)
+        if embedding is None:
+            return None, None
+        documents = await _collection_documents(await get_supabase_client(), collection_id)
+        if documents is None:
+            return embedding, None
+        cached = await asyncio.to_thread(
+            cache.lookup, user_id, str(collection_id), mode or settings.RETRIEVAL_MODE, embedding,
+            collection_version(documents.values())
+        )
+        return embedding, cached
+    except Exception as e:
+        logger.error(f"Answer cache lookup failed for collection {collection_id}: {e}")
+        return None, None
+
+
+async def remember_answer(
+    user_id: str, collection_id: UUID, retrieval: "RetrievalResult", answer: str
+) -> None:
+    """
+    Stores a successfully generated answer in the answer cache, unless the
+    collection changed since ``retrieval`` read it.
+    """
+    cache = get_answer_cache()
+    if cache is None or retrieval.query_embedding is None or retrieval.collection_version is None or not answer:
+        return
+    try:
+        documents = await _collection_documents(await get_supabase_client(), collection_id)
+        if documents is None:
+            return
+        stored = await asyncio.to_thread(
+            cache.store, user_id, str(collection_id), retrieval.mode,
+            retrieval.query_embedding, answer, retrieval.source_ids,
+            retrieval.collection_version, collection_version(documents.values())
+        )
+        if not stored:
+            logger.info(f"Not caching answer for collection {collection_id}: it changed while the answer was generated")
+    except Exception as e:
+        logger.error(f"Failed to cache answer for collection {collection_id}: {e}")
+
+
+async def copy_document_for_rag(
+    user_id: str,
+    source_document_id: UUID,
+    collection_id: UUID,
+    document_id: UUID,
+    file_name: str,
+    file_hash: str,
+    file: UploadFile,
+    supabase_client: Client
+):
+    """
+    Indexes a duplicate upload by copying the already-computed chunks and
+    vectors of ``source_document_id`` (same user, same PDF bytes) to
+    ``document_id`` in ``collection_id``, without extraction or embedding.
+
+    Falls back to the full ``process_pdf_for_rag`` pipeline, reading the
+    spooled upload ``file``, if the source's chunk text or vectors are
+    incomplete.
+    """
+    from app.database.crud import update_document_status
+
+    try:
+        update_document_status(supabase_client, document_id, "processing")
+        source_rows = await asyncio.to_thread(
+            get_document_chunks, supabase_client, source_document_id, include_content=True
+        )
+        if not source_rows:
+            raise ValueError("source document has no chunks")
+
+        source_ids = [f"{source_document_id}-{row['chunk_index']}" for row in source_rows]
+        texts = {
+            source_id: row['content']
+            for row, source_id in zip(source_rows, source_ids) if row.get('content') is not None
+        }
+        vectors = await fetch_vectors_from_pinecone(user_id, source_ids)
+        missing = [vector_id for vector_id in source_ids if vector_id not in texts or vector_id not in vectors]
+        if missing:
+            raise ValueError(f"{len(missing)} of {len(source_ids)} source chunks are missing")
+
+        copied_vectors = []
+        chunk_texts = {}
+        supabase_chunks_data = []
+        for row, source_id in zip(source_rows, source_ids):
+            i = row['chunk_index']
+            chunk_texts[i] = texts[source_id]
+            copied_vectors.append({
+                "id": f"{document_id}-{i}",
+                "values": vectors[source_id]["values"],
+                "metadata": {
+                    **vectors[source_id]["metadata"],
+                    "document_id": str(document_id),
+                    "collection_id": str(collection_id),
+                    "file_name": file_name
+                }
+            })
+            supabase_chunks_data.append({
+                "id": str(uuid.uuid4()),
+                "document_id": str(document_id),
+                "chunk_index": i,
+                "content": texts[source_id],
+                "content_hash": row.get('content_hash') or chunk_content_hash(texts[source_id])
+            })
+    except Exception as e:
+        logger.warning(f"Cannot copy chunks of document {source_document_id}, processing {document_id} from scratch: {e}")
+        await process_pdf_for_rag(
+            user_id=user_id,
+            collection_id=collection_id,
+            document_id=document_id,
+            file_name=file_name,
+            file_content_bytes=None,
+            file=file,
+            supabase_client=supabase_client
+        )
+        return
+
+    try:
+        stamp = file_hash # Matches documents.file_hash
+        await asyncio.to_thread(get_chunk_store().put_document, str(document_id), chunk_texts, stamp)
+        await asyncio.to_thread(
+            get_lexical_index().index_document, str(collection_id), str(document_id), chunk_texts, stamp
+        )
+        # Rows carry the durable text, so they go in before the vectors become searchable
+        create_document_chunks(supabase_client, supabase_chunks_data)
+        await upsert_vectors_to_pinecone(user_id, copied_vectors)
+        await asyncio.to_thread(invalidate_collection_answers, str(collection_id))
+        update_document_status(supabase_client, document_id, "completed")
+        logger.info(f"Copied {len(copied_vectors)} chunks from document {source_document_id} to {document_id}")
+    except Exception as e:
+        logger.error(f"Failed to copy chunks to document {document_id}: {e}", exc_info=True)
+        try:
+            update_document_status(supabase_client, document_id, "failed")
+        except Exception as update_err:
+            logger.error(f"Failed to update document status to 'failed': {update_err}")
+        raise
+
+
+@dataclass
+class RetrievalResult:
+    """The outcome of one query embedding + search, shared by callers of the RAG pipeline."""
+    query: str
+    query_embedding: Optional[List[float]]
+    matches: List[Any]
+    contexts: List[str] = field(default_factory=list)
+    source_ids: List[str] = field(default_factory=list)
+    mode: str = "vector"
+    context_ids: List[str] = field(default_factory=list) # The source ID of each entry in ``contexts``
+    reranked: bool = False
+    collection_version: Optional[str] = None # Version of the collection the search ran against, None if unknown
+
+
+async def _collection_documents(supabase_client: Client, collection_id: UUID) -> Optional[Dict[str, Dict[str, Any]]]:
+    """Returns the collection's documents rows by ID, or None if they cannot be read."""
+    try:
+        rows = await asyncio.to_thread(get_collection_document_states, supabase_client, collection_id)
+        return {str(row['id']): row for row in rows}
+    except Exception as e:
+        logger.error(f"Failed to load the documents of collection {collection_id}, using local caches as they are: {e}")
+        return None
+
+
+def _sync_lexical_index(supabase_client: Client, collection_id: str, documents: Dict[str, Dict[str, Any]]) -> None:
+    """
+    Brings the local BM25 index in line with the collection: drops documents
+    that are gone and (re)builds completed documents it lacks or holds for an
+    older stamp from document_chunks. Runs in a worker thread.
+    """
+    index = get_lexical_index()
+    stamps = index.get_stamps(collection_id)
+    for document_id in set(stamps) - set(documents):
+        index.delete_document(document_id)
+    for document_id, document in documents.items():
+        if document.get('status') != 'completed' or stamps.get(document_id) == document_stamp(document):
+            continue
+        texts = _read_durable_chunk_texts(supabase_client, document_id, document)
+        # Indexed even without text, so documents that have none are not read again on every search
+        index.index_document(collection_id, document_id, texts, document_stamp(document))
+
+
+async def _lexical_search(
+    supabase_client: Client, collection_id: UUID, documents: Optional[Dict[str, Dict[str, Any]]], query: str, top_k: int
+) -> List[str]:
+    try:
+        if documents is not None:
+            await asyncio.to_thread(_sync_lexical_index, supabase_client, str(collection_id), documents)
+        results = await asyncio.to_thread(get_lexical_index().search, str(collection_id), query, top_k)
+        return [vector_id for vector_id, _ in results]
+    except Exception as e:
+        # Lexical search only improves recall; never fail the chat because of it
+        logger.error(f"Lexical search failed for collection {collection_id}: {e}")
+        return []
+
+
+async def _load_chunk_texts(
+    supabase_client: Client, user_id: str, source_ids: List[str], documents: Optional[Dict[str, Dict[str, Any]]]
+) -> Dict[str, str]:
+    """
+    Returns the full text of the given chunks. The local chunk store is a
+    read-through cache: documents it lacks or holds for an older stamp are
+    read from document_chunks. Chunks of documents no longer in the
+    collection are left out. Without the documents rows, the local store is
+    used as it is.
+    """
+    by_document: Dict[str, List[str]] = {}
+    for vector_id in source_ids:
+        try:
+            document_id, _ = parse_vector_id(vector_id)
+        except ValueError:
+            continue
+        if documents is None or document_id in documents:
+            by_document.setdefault(document_id, []).append(vector_id)
+
+    store = get_chunk_store()
+
+    def read_local():
+        stamps = store.get_stamps(by_document)
+        stale = [
+            document_id for document_id in by_document
+            if documents is not None and stamps.get(document_id) != document_stamp(documents[document_id])
+        ]
+        fresh_ids = [vector_id for document_id, ids in by_document.items() if document_id not in stale for vector_id in ids]
+        return store.get_chunks(fresh_ids), stale
+
+    texts, stale = await asyncio.to_thread(read_local)
+    if stale:
+        results = await asyncio.gather(
+            *(asyncio.to_thread(_read_durable_chunk_texts, supabase_client, document_id, documents[document_id])
+              for document_id in stale),
+            return_exceptions=True
+        )
+        for document_id, result in zip(stale, results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to read the chunk text of document {document_id}: {result}")
+                continue
+            for vector_id in by_document[document_id]:
+                chunk_index = parse_vector_id(vector_id)[1]
+                if chunk_index in result:
+                    texts[vector_id] = result[chunk_index]
+
+    missing = [vector_id for ids in by_document.values() for vector_id in ids if vector_id not in texts]
+    if missing:
+        # Documents indexed before chunk text was stored only have a text preview in Pinecone
+        legacy_metadata = await fetch_vector_metadata(user_id, missing)
+        for vector_id, metadata in legacy_metadata.items():
+            if metadata.get('content'):
+                texts[vector_id] = metadata['content']
+    return texts
+
+
+async def retrieve_context(
+    user_id: str,
+    query: str,
+    collection_id: UUID,
+    top_k: int = settings.TOP_K_RETRIEVAL,
+    mode: Optional[str] = None,
+    query_embedding: Optional[List[float]] = None
+) -> RetrievalResult:
+    """
+    Finds the most relevant chunks for the query and reads their full text
+    (from the local chunk store, or document_chunks on a miss).
+
+    ``mode`` is "vector" (dense search), "lexical" (BM25 over the collection) or
+    "hybrid" (both in parallel, fused with reciprocal-rank fusion). Defaults to
+    RETRIEVAL_MODE. Pass ``query_embedding`` if the query was already embedded.
+
+    When RERANKER is set, RERANK_CANDIDATES results are fetched and reranked
+    within RERANK_TIMEOUT_SECONDS before trimming to ``top_k``.
+    """
+    mode = mode or settings.RETRIEVAL_MODE
+    if mode not in ("vector", "lexical", "hybrid"):
+        raise ValueError(f"Unsupported retrieval mode: {mode}")
+    candidates = top_k if mode == "vector" else max(top_k, settings.HYBRID_CANDIDATES)
+    # With a reranker, over-fetch and let it pick the final top_k
+    reranking = get_reranker() is not None
+    shortlist = max(top_k, settings.RERANK_CANDIDATES) if reranking else top_k
+    candidates = max(candidates, shortlist)
+
+    async def vector_search():
+        # 1. Generate Query Embedding
+        embedding = query_embedding or await generate_embedding(query)
+        # 2. Retrieve relevant chunk IDs from Pinecone
+        found = await query_pinecone(user_id, embedding, collection_id, candidates, include_metadata=False)
+        return embedding, found
+
+    supabase_client = await get_supabase_client()
+    documents = await _collection_documents(supabase_client, collection_id)
+
+    retrieved_matches, lexical_ids = [], []
+    if mode == "vector":
+        query_embedding, retrieved_matches = await vector_search()
+    elif mode == "lexical":
+        lexical_ids = await _lexical_search(supabase_client, collection_id, documents, query, candidates)
+    else:
+        (query_embedding, retrieved_matches), lexical_ids = await asyncio.gather(
+            vector_search(), _lexical_search(supabase_client, collection_id, documents, query, candidates)
+        )
+
+    vector_ids = [match.id for match in retrieved_matches if match.id]
+    if mode == "hybrid":
+        source_ids = reciprocal_rank_fusion([vector_ids, lexical_ids], k=settings.RRF_K)[:shortlist]
+    else:
+        source_ids = (vector_ids or lexical_ids)[:shortlist]
+
+    # 3. Read the full chunk text in one batched lookup
+    texts = await _load_chunk_texts(supabase_client, user_id, source_ids, documents)
+
+    reranked = False
+    if reranking:
+        # 4. Rerank the shortlist within the latency budget, else keep the retrieval order
+        shortlisted = [vector_id for vector_id in source_ids if vector_id in texts]
+        order = await rerank(
+            query, shortlisted, [texts[vector_id] for vector_id in shortlisted], settings.RERANK_TIMEOUT_SECONDS
+        )
+        if order is not None:
+            source_ids, reranked = order, True
+        source_ids = source_ids[:top_k]
+
+    context_ids = [vector_id for vector_id in source_ids if vector_id in texts]
+    return RetrievalResult(
+        query=query,
+        query_embedding=query_embedding,
+        matches=retrieved_matches,
+        contexts=[texts[vector_id] for vector_id in context_ids],
+        source_ids=source_ids,
+        mode=mode,
+        context_ids=context_ids,
+        reranked=reranked,
+        collection_version=collection_version(documents.values()) if documents is not None else None,
+    )
+
+
 async def generate_rag_response_stream(
     user_id: str,
     query: str,
     collection_id: UUID,
     conversation_id: UUID,
-    supabase_client: Client
+    supabase_client: Client,
+    retrieval: Optional[RetrievalResult] = None
 ):
     """
     Performs RAG query, constructs prompt, and streams LLM response and metadata.
     Yields structured content chunks and metadata.
-    """
-    # 1. Generate Query Embedding
-    query_embedding = await generate_embedding(query)
 
-    # 2. Retrieve relevant chunks from Pinecone
-    retrieved_matches = await query_pinecone(user_id, query_embedding, collection_id, settings.TOP_K_RETRIEVAL)
-    retrieved_contexts = [match.metadata['content'] for match in retrieved_matches if 'content' in match.metadata]
-    retrieved_source_ids = [match.id for match in retrieved_matches]
+    Pass ``retrieval`` when the caller has already run ``retrieve_context`` for
+    this query so the embedding and vector search are not repeated.
+    """
+    # 1-2. Embed the query and retrieve relevant chunks (unless the caller already did)
+    if retrieval is None:
+        retrieval = await retrieve_context(user_id, query, collection_id, settings.TOP_K_RETRIEVAL)
+    retrieved_contexts = retrieval.contexts
+    retrieved_source_ids = retrieval.source_ids
 
     if not retrieved_contexts:
         yield {
@@ -200,8 +723,31 @@ async def generate_rag_response_stream(
     history_string = ""
     for msg in conversation_history:
         history_string += f"{msg['sender'].capitalize()}: {msg['content']}\n"
+    # 4. Merge overlapping chunks, drop near-duplicates and fit the token budget
+    packing_stats: Dict[str, Any] = {}
+    if settings.CONTEXT_PACKING_ENABLED:
+        packed = pack_contexts(
+            retrieval.context_ids,
+            retrieved_contexts,
+            token_budget=settings.CONTEXT_TOKEN_BUDGET,
+            max_hamming_distance=settings.CONTEXT_DEDUP_MAX_HAMMING
+        )
+        retrieved_contexts = packed.contexts
+        packing_stats = {
+            "original_tokens": packed.original_tokens,
+            "packed_tokens": packed.packed_tokens,
+            "tokens_saved": packed.tokens_saved,
+            "merged_chunks": packed.merged_chunks,
+            "duplicates_dropped": packed.duplicates_dropped,
+            "dropped_for_budget": len(packed.dropped_for_budget),
+        }
+        logger.info(
+            f"Packed {len(retrieval.contexts)} contexts into {len(packed.contexts)} "
+            f"({packed.packed_tokens} tokens, {packed.tokens_saved} saved)"
+        )
+
     print("constructing LLM prompt")
-    # 4. Construct LLM Prompt
+    # 5. Construct LLM Prompt
     context_str = "\n\n".join(retrieved_contexts)
     prompt = f"""
     You are an AI assistant specialized in answering questions based on provided documents.
@@ -220,7 +766,7 @@ async def generate_rag_response_stream(
     Answer:
     """
 
-    # 5. Stream LLM Response
+    # 6. Stream LLM Response
     print("Streaming LLM response")
     async for chunk in get_llm_completion_stream(prompt):
         yield {
@@ -228,9 +774,10 @@ async def generate_rag_response_stream(
             "data": chunk
         }
 
-    # 6. Final metadata
+    # 7. Final metadata
     yield {
         "type": "metadata",
         "sources": retrieved_source_ids,
         "contexts": retrieved_contexts,
+        "context_packing": packing_stats,
     }
@@ -0,0 +1,158 @@
+# app/services/reranker.py
+
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from app.core.config import settings
+from app.core.metrics import get_histogram
+from app.services.lexical_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+
+class RerankTimeout(Exception):
+    """Raised by a scorer when the latency budget ran out between batches."""
+
+
+class Reranker:
+    """
+    Scores (query, passage) pairs; higher is more relevant.
+
+    Scorers work through the passages in batches of ``batch_size`` and stop
+    as soon as ``deadline`` (a ``time.monotonic()`` value) has passed, so a
+    slow model gives the CPU back instead of finishing work nobody waits for.
+    """
+
+    name = "base"
+
+    def __init__(self, batch_size: int = 16):
+        self.batch_size = max(1, batch_size)
+
+    def _score_batch(self, query: str, passages: List[str]) -> List[float]:
+        raise NotImplementedError
+
+    def score(self, query: str, passages: List[str], deadline: Optional[float] = None) -> List[float]:
+        scores: List[float] = []
+        for i in range(0, len(passages), self.batch_size):
+            if deadline is not None and time.monotonic() > deadline:
+                raise RerankTimeout(f"Scored {len(scores)} of {len(passages)} passages before the deadline")
+            scores.extend(self._score_batch(query, passages[i:i + self.batch_size]))
+        return scores
+
+
+class LexicalOverlapReranker(Reranker):
+    """
+    Dependency-free scorer: IDF-weighted query-term coverage of each passage,
+    with IDF taken over the candidate set. Cheap enough to never hit the budget.
+    """
+
+    name = "lexical"
+
+    def score(self, query: str, passages: List[str], deadline: Optional[float] = None) -> List[float]:
+        passage_terms = [Counter(tokenize(passage)) for passage in passages]
+        idf = {}
+        for term in set(tokenize(query)):
+            frequency = sum(1 for terms in passage_terms if term in terms)
+            idf[term] = math.log(1 + (len(passages) - frequency + 0.5) / (frequency + 0.5))
+
+        scores = []
+        for terms in passage_terms:
+            length = sum(terms.values()) or 1
+            scores.append(sum(
+                weight * (1 + math.log(terms[term])) for term, weight in idf.items() if terms[term]
+            ) / math.sqrt(length))
+        return scores
+
+
+class CrossEncoderReranker(Reranker):
+    """
+    Local cross-encoder (sentence-transformers) run on CPU. The model is
+    loaded on first use, on the rerank thread.
+    """
+
+    name = "cross-encoder"
+
+    def __init__(self, model_name: str, batch_size: int = 16):
+        super().__init__(batch_size)
+        from sentence_transformers import CrossEncoder # pip install sentence-transformers
+        self.model_name = model_name
+        self._cross_encoder_class = CrossEncoder
+        self._model = None
+        self._load_lock = threading.Lock()
+
+    def _get_model(self):
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    self._model = self._cross_encoder_class(self.model_name, device="cpu")
+        return self._model
+
+    def _score_batch(self, query: str, passages: List[str]) -> List[float]:
+        model = self._get_model()
+        scores = model.predict([(query, passage) for passage in passages], batch_size=self.batch_size)
+        return [float(score) for score in scores]
+
+
+_reranker: Optional[Reranker] = None
+_reranker_lock = threading.Lock()
+_rerank_executor = ThreadPoolExecutor(max_workers=settings.RERANK_MAX_WORKERS, thread_name_prefix="rerank")
+
+
+def get_reranker() -> Optional[Reranker]:
+    """Returns the scorer selected by RERANKER ("none", "lexical" or "cross-encoder")."""
+    global _reranker
+    if settings.RERANKER == "none":
+        return None
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                if settings.RERANKER == "cross-encoder":
+                    try:
+                        _reranker = CrossEncoderReranker(settings.RERANKER_MODEL_NAME, settings.RERANK_BATCH_SIZE)
+                    except ImportError as e:
+                        logger.warning(f"Cross-encoder reranker unavailable, using lexical reranking: {e}")
+                        _reranker = LexicalOverlapReranker(settings.RERANK_BATCH_SIZE)
+                elif settings.RERANKER == "lexical":
+                    _reranker = LexicalOverlapReranker(settings.RERANK_BATCH_SIZE)
+                else:
+                    raise ValueError(f"Unsupported reranker: {settings.RERANKER}")
+    return _reranker
+
+
+async def rerank(query: str, ids: List[str], passages: List[str], budget_seconds: float) -> Optional[List[str]]:
+    """
+    Reorders ``ids`` by the reranker's score for the matching ``passages``.
+    Returns None (keep the original order) when reranking is disabled, fails
+    or does not finish within ``budget_seconds``.
+    """
+    reranker = get_reranker()
+    if reranker is None or not ids:
+        return None
+
+    histogram = get_histogram(f"rerank.{reranker.name}")
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    deadline = time.monotonic() + budget_seconds
+    try:
+        scores = await asyncio.wait_for(
+            loop.run_in_executor(_rerank_executor, reranker.score, query, passages, deadline),
+            timeout=budget_seconds
+        )
+    except (asyncio.TimeoutError, RerankTimeout):
+        histogram.observe(time.perf_counter() - start, error=True)
+        logger.warning(f"Reranking {len(ids)} candidates exceeded {budget_seconds}s, keeping retrieval order")
+        return None
+    except Exception as e:
+        histogram.observe(time.perf_counter() - start, error=True)
+        logger.error(f"Reranking failed, keeping retrieval order: {e}")
+        return None
+    histogram.observe(time.perf_counter() - start)
+
+    order = sorted(range(len(ids)), key=lambda i: scores[i], reverse=True)
+    return [ids[i] for i in order]
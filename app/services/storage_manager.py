@@ -0,0 +1,219 @@
+# app/services/storage_manager.py
+
+import asyncio
+import base64
+import io
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import BinaryIO, Iterable, Iterator, Optional, Tuple, Union
+from urllib.parse import quote, urljoin
+
+import httpx
+
+from app.core.config import settings
+from app.core.metrics import get_histogram
+
+logger = logging.getLogger(__name__)
+
+_SPOOL_CHUNK_BYTES = 1024 * 1024
+
+# Bytes, a local file path, a binary file object or an iterator of byte chunks
+UploadSource = Union[bytes, str, BinaryIO, Iterable[bytes]]
+
+
+class StorageUploadError(Exception):
+    """Raised when an upload still fails after its retries."""
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, httpx.TransportError):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return False
+
+
+class StorageUploader:
+    """
+    Uploads files to Supabase Storage without holding them in memory.
+
+    Sources are streamed from disk, a file object or an iterator. Files up to
+    ``resumable_threshold`` bytes go in a single request; larger ones use the
+    resumable (TUS) endpoint in ``chunk_size`` parts. A part that fails is
+    retried after asking the server how much it already has, so only the
+    missing bytes are sent again. Methods block; use ``upload_async`` from
+    the event loop.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str,
+        resumable_threshold: int,
+        chunk_size: int,
+        max_retries: int,
+        retry_backoff: float,
+        timeout_seconds: float
+    ):
+        self.storage_url = base_url.rstrip("/") + "/storage/v1/"
+        self.resumable_threshold = resumable_threshold
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._client = httpx.Client(
+            timeout=timeout_seconds,
+            headers={"Authorization": f"Bearer {api_key}", "apikey": api_key}
+        )
+
+    def _with_retries(self, description: str, request):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return request()
+            except Exception as e:
+                if attempt == self.max_retries or not _is_retryable(e):
+                    raise StorageUploadError(f"{description} failed: {e}") from e
+                delay = self.retry_backoff * (2 ** attempt)
+                logger.warning(f"{description} failed (attempt {attempt + 1}), retrying in {delay}s: {e}")
+                time.sleep(delay)
+
+    def _upload_single(self, bucket: str, path: str, source: BinaryIO, content_type: str, upsert: bool) -> None:
+        url = urljoin(self.storage_url, f"object/{bucket}/{quote(path, safe='/')}")
+        headers = {"Content-Type": content_type, "x-upsert": "true" if upsert else "false"}
+
+        def request():
+            source.seek(0)
+            response = self._client.post(url, content=source.read(), headers=headers)
+            response.raise_for_status()
+
+        self._with_retries(f"Upload of {bucket}/{path}", request)
+
+    def _upload_resumable(self, bucket: str, path: str, source: BinaryIO, size: int, content_type: str, upsert: bool) -> None:
+        metadata = {"bucketName": bucket, "objectName": path, "contentType": content_type, "cacheControl": "3600"}
+        tus_headers = {"Tus-Resumable": "1.0.0"}
+
+        def create():
+            response = self._client.post(
+                urljoin(self.storage_url, "upload/resumable"),
+                headers={
+                    **tus_headers,
+                    "Upload-Length": str(size),
+                    "Upload-Metadata": ",".join(
+                        f"{key} {base64.b64encode(value.encode()).decode()}" for key, value in metadata.items()
+                    ),
+                    "x-upsert": "true" if upsert else "false",
+                }
+            )
+            response.raise_for_status()
+            return urljoin(self.storage_url, response.headers["Location"])
+
+        upload_url = self._with_retries(f"Starting resumable upload of {bucket}/{path}", create)
+
+        offset = 0
+        while offset < size:
+            def send_part():
+                nonlocal offset
+                try:
+                    source.seek(offset)
+                    response = self._client.patch(
+                        upload_url,
+                        content=source.read(self.chunk_size),
+                        headers={**tus_headers, "Upload-Offset": str(offset), "Content-Type": "application/offset+octet-stream"}
+                    )
+                    response.raise_for_status()
+                    offset = int(response.headers["Upload-Offset"])
+                except Exception:
+                    # Resume from what the server actually stored
+                    try:
+                        head = self._client.head(upload_url, headers=tus_headers)
+                        head.raise_for_status()
+                        offset = int(head.headers["Upload-Offset"])
+                    except Exception as e:
+                        logger.debug(f"Could not read the offset of {upload_url}: {e}")
+                    raise
+
+            self._with_retries(f"Upload of {bucket}/{path} at byte {offset}", send_part)
+
+    def upload(
+        self,
+        bucket: str,
+        path: str,
+        source: UploadSource,
+        content_type: str = "application/pdf",
+        upsert: bool = False
+    ) -> int:
+        """Uploads ``source`` to ``bucket/path`` and returns the number of bytes sent."""
+        start = time.perf_counter()
+        with _open_source(source) as (stream, size):
+            resumable = size > self.resumable_threshold
+            histogram = get_histogram("storage_upload.resumable" if resumable else "storage_upload.single")
+            try:
+                if resumable:
+                    self._upload_resumable(bucket, path, stream, size, content_type, upsert)
+                else:
+                    self._upload_single(bucket, path, stream, content_type, upsert)
+            except Exception:
+                histogram.observe(time.perf_counter() - start, error=True)
+                raise
+        histogram.observe(time.perf_counter() - start)
+        return size
+
+    async def upload_async(self, bucket: str, path: str, source: UploadSource, content_type: str = "application/pdf", upsert: bool = False) -> int:
+        return await asyncio.to_thread(self.upload, bucket, path, source, content_type, upsert)
+
+
+@contextmanager
+def _open_source(source: UploadSource) -> Iterator[Tuple[BinaryIO, int]]:
+    """
+    Yields ``(seekable binary stream, size)`` for any ``UploadSource``.
+    Iterators and unseekable streams are spooled to a temp file first, since
+    their size is needed up front and parts may have to be re-sent.
+    """
+    if hasattr(source, "read") and hasattr(source, "seek") and getattr(source, "seekable", lambda: True)():
+        source.seek(0, os.SEEK_END)
+        size = source.tell()
+        source.seek(0)
+        yield source, size
+        return
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        stream = io.BytesIO(source)
+    elif isinstance(source, (str, os.PathLike)):
+        stream = open(source, "rb")
+    else:
+        chunks = iter(lambda: source.read(_SPOOL_CHUNK_BYTES), b"") if hasattr(source, "read") else source
+        stream = tempfile.TemporaryFile()
+        for chunk in chunks:
+            stream.write(chunk)
+    try:
+        stream.seek(0, os.SEEK_END)
+        size = stream.tell()
+        stream.seek(0)
+        yield stream, size
+    finally:
+        stream.close()
+
+
+_storage_uploader: Optional[StorageUploader] = None
+_storage_uploader_lock = threading.Lock()
+
+
+def get_storage_uploader() -> StorageUploader:
+    """Returns the process-wide storage uploader."""
+    global _storage_uploader
+    if _storage_uploader is None:
+        with _storage_uploader_lock:
+            if _storage_uploader is None:
+                _storage_uploader = StorageUploader(
+                    settings.SUPABASE_URL,
+                    settings.SUPABASE_SERVICE_ROLE_KEY,
+                    resumable_threshold=settings.STORAGE_RESUMABLE_THRESHOLD_BYTES,
+                    chunk_size=settings.STORAGE_UPLOAD_CHUNK_BYTES,
+                    max_retries=settings.STORAGE_UPLOAD_MAX_RETRIES,
+                    retry_backoff=settings.STORAGE_UPLOAD_RETRY_BACKOFF_SECONDS,
+                    timeout_seconds=settings.STORAGE_UPLOAD_TIMEOUT_SECONDS
+                )
+    return _storage_uploader
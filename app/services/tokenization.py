@@ -0,0 +1,80 @@
+# app/services/tokenization.py
+
+import logging
+import re
+from functools import lru_cache
+from typing import Callable, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Rough stand-in used when tiktoken is unavailable: one token per word or symbol
+_APPROXIMATE_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+class TokenCounter:
+    """
+    Counts tokens with a local BPE tokenizer (tiktoken) when available.
+
+    Single counts are memoised because text splitters measure the same
+    candidate pieces many times; ``count_many`` encodes a whole list in one
+    batched call and seeds the memo with the results.
+    """
+
+    def __init__(self, encoding_name: str, cache_size: int = 65536):
+        self.encoding_name = encoding_name
+        self._encoding = None
+        try:
+            import tiktoken # pip install tiktoken
+            self._encoding = tiktoken.get_encoding(encoding_name)
+        except Exception as e:
+            logger.warning(f"tiktoken encoding '{encoding_name}' unavailable, approximating token counts: {e}")
+        self._memo: dict = {}
+        self._cache_size = cache_size
+
+    @property
+    def is_exact(self) -> bool:
+        return self._encoding is not None
+
+    def _encode_length(self, text: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return len(_APPROXIMATE_TOKEN_PATTERN.findall(text))
+
+    def _remember(self, text: str, count: int) -> None:
+        if len(self._memo) >= self._cache_size:
+            self._memo.clear()
+        self._memo[text] = count
+
+    def count(self, text: str) -> int:
+        count = self._memo.get(text)
+        if count is None:
+            count = self._encode_length(text)
+            self._remember(text, count)
+        return count
+
+    def count_many(self, texts: List[str]) -> List[int]:
+        """Counts tokens for many texts, encoding only the ones not yet seen in one batch."""
+        missing = [text for text in dict.fromkeys(texts) if text not in self._memo]
+        if missing:
+            if self._encoding is not None:
+                lengths = [len(tokens) for tokens in self._encoding.encode_batch(missing, disallowed_special=())]
+            else:
+                lengths = [len(_APPROXIMATE_TOKEN_PATTERN.findall(text)) for text in missing]
+            for text, length in zip(missing, lengths):
+                self._remember(text, length)
+        return [self.count(text) for text in texts]
+
+
+@lru_cache(maxsize=4)
+def get_token_counter(encoding_name: Optional[str] = None) -> TokenCounter:
+    """Returns a process-wide, cached token counter for the encoding."""
+    return TokenCounter(encoding_name or settings.CHUNK_TOKENIZER_ENCODING)
+
+
+def get_chunk_length_function() -> Callable[[str], int]:
+    """Returns the length function matching CHUNK_LENGTH_UNIT ("characters" or "tokens")."""
+    if settings.CHUNK_LENGTH_UNIT == "tokens":
+        return get_token_counter().count
+    return len
@@ -1,38 +1,111 @@
-def compress_pdf_content(pdf_content: bytes, compression_level: str) -> bytes:
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class CompressionProfile:
+    """Image and structure settings for one compression level."""
+    dpi_threshold: Optional[int] # Images above this resolution are downsampled
+    dpi_target: int              # ...to this resolution
+    jpeg_quality: int            # JPEG quality for recompressed photos
+    subset_fonts: bool
+
+
+COMPRESSION_PROFILES: Dict[str, CompressionProfile] = {
+    # Only print-resolution scans are touched; text and vector content stay lossless
+    "low": CompressionProfile(dpi_threshold=300, dpi_target=200, jpeg_quality=85, subset_fonts=True),
+    "medium": CompressionProfile(dpi_threshold=200, dpi_target=150, jpeg_quality=75, subset_fonts=True),
+    "high": CompressionProfile(dpi_threshold=120, dpi_target=96, jpeg_quality=60, subset_fonts=True),
+}
+
+
+@dataclass
+class CompressionReport:
+    level: str
+    original_size: int
+    compressed_size: int = 0
+    kept_original: bool = False # Output was not smaller, so the input is returned unchanged
+    stage_seconds: Dict[str, float] = field(default_factory=dict)
+    warnings: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return {
+            "level": self.level,
+            "original_size": self.original_size,
+            "compressed_size": self.compressed_size,
+            "reduction_percent": round(100 * (1 - self.compressed_size / self.original_size), 1) if self.original_size else 0.0,
+            "kept_original": self.kept_original,
+            "stage_seconds": {stage: round(seconds, 3) for stage, seconds in self.stage_seconds.items()},
+            "warnings": self.warnings,
+        }
+
+
+def compress_pdf_with_report(pdf_content: bytes, compression_level: str) -> Tuple[bytes, dict]:
     """
-    Compress PDF content based on the compression level.
+    Compress PDF content in a single pass and report what it achieved.
+
+    The document is opened once; images above the level's DPI threshold are
+    downsampled and recompressed as JPEG, embedded fonts are subset to the
+    glyphs used, and one save removes duplicate and unused objects
+    (garbage=4), deflates streams and packs objects into object streams.
+    CPU-bound; run it in the shared PDF process pool.
     """
-    print(f"Compressing PDF content with level: {compression_level}")
     import fitz
-    from io import BytesIO
+
+    profile = COMPRESSION_PROFILES.get(compression_level)
+    if profile is None:
+        raise ValueError(f"Unsupported compression level: {compression_level}")
+    report = CompressionReport(level=compression_level, original_size=len(pdf_content))
+
+    stage_start = time.perf_counter()
+
+    def end_stage(name: str):
+        nonlocal stage_start
+        now = time.perf_counter()
+        report.stage_seconds[name] = now - stage_start
+        stage_start = now
 
     doc = fitz.open(stream=pdf_content, filetype="pdf")
-    output = BytesIO()
-    
-    # Set compression parameters based on level
-    if compression_level == "low":
-        compress = True
-        clean = True
-    elif compression_level == "medium":
-        compress = True
-        clean = True
-        doc.save(output, garbage=3, deflate=True, clean=clean)
-        doc = fitz.open(stream=output.getvalue(), filetype="pdf")
-        output = BytesIO()
-    elif compression_level == "high":
-        compress = True
-        clean = True
-        # Save twice for higher compression
-        doc.save(output, garbage=3, deflate=True, clean=clean)
-        doc = fitz.open(stream=output.getvalue(), filetype="pdf")
-        output = BytesIO()
-        doc.save(output, garbage=3, deflate=True, clean=clean)
-        doc = fitz.open(stream=output.getvalue(), filetype="pdf")
-        output = BytesIO()
-    
-    # Final save with appropriate compression
-    doc.save(output, garbage=3, deflate=compress, clean=clean)
-    compressed_pdf = output.getvalue()
-    doc.close()
-    
-    return compressed_pdf
\ No newline at end of file
+    try:
+        end_stage("open")
+
+        if profile.dpi_threshold:
+            doc.rewrite_images(
+                dpi_threshold=profile.dpi_threshold,
+                dpi_target=profile.dpi_target,
+                quality=profile.jpeg_quality,
+                lossy=True,
+                lossless=True,
+                bitonal=False, # JPEG would blur scanned line art; deflate keeps it small
+            )
+            end_stage("images")
+
+        if profile.subset_fonts:
+            try:
+                doc.subset_fonts()
+            except Exception as e:
+                # Some embedded fonts cannot be subset; keep them whole
+                report.warnings.append(f"Font subsetting skipped: {e}")
+            end_stage("fonts")
+
+        compressed_pdf = doc.tobytes(garbage=4, deflate=True, clean=True, use_objstms=1)
+        end_stage("save")
+    finally:
+        doc.close()
+
+    if len(compressed_pdf) >= len(pdf_content):
+        compressed_pdf = pdf_content
+        report.kept_original = True
+    report.compressed_size = len(compressed_pdf)
+    print(f"Compressed PDF ({compression_level}): {report.original_size} -> {report.compressed_size} bytes")
+    return compressed_pdf, report.to_dict()
+
+
+def compress_pdf_content(pdf_content: bytes, compression_level: str) -> bytes:
+    """
+    Compress PDF content based on the compression level (low, medium, high).
+    CPU-bound; run it in the shared PDF process pool.
+    """
+    compressed_pdf, _ = compress_pdf_with_report(pdf_content, compression_level)
+    return compressed_pdf
@@ -0,0 +1,62 @@
+import os
+import shutil
+from typing import List
+
+# Pages copied per open/save cycle; bounds the objects held in memory at once
+PAGES_PER_BATCH = 200
+
+
+def _offset_toc(toc: List[list], page_offset: int, previous_level: int) -> List[list]:
+    """Shifts outline entries to their pages in the merged file, keeping the levels valid for set_toc."""
+    shifted = []
+    for level, title, page, *_ in toc:
+        level = max(1, min(level, previous_level + 1))
+        shifted.append([level, title, page + page_offset if page > 0 else -1])
+        previous_level = level
+    return shifted
+
+
+def merge_pdf_files(input_paths: List[str], output_path: str, pages_per_batch: int = PAGES_PER_BATCH) -> int:
+    """
+    Merge PDF files, in order, into ``output_path`` and return its size in bytes.
+    Runs in the shared PDF process pool.
+
+    The first input is copied as-is; every other input is appended
+    ``pages_per_batch`` pages at a time with PyMuPDF, each batch written as an
+    incremental save. Source and output are reopened per batch, so their
+    object caches are dropped and memory stays bounded by the batch size, not
+    by the total number of pages.
+
+    Appending does not carry outlines over, so the merged outline is rebuilt
+    from every input's, shifted by its page offset. A final garbage-collecting
+    save then drops the objects the batches copied more than once.
+    """
+    import fitz
+
+    shutil.copyfile(input_paths[0], output_path)
+    with fitz.open(output_path) as out:
+        page_offset = out.page_count
+        toc = _offset_toc(out.get_toc(), 0, 0)
+        repaired = not out.can_save_incrementally()
+        if repaired:
+            # Damaged (repaired on open) files cannot be appended to; write a clean copy once
+            out.save(output_path + ".tmp")
+    if repaired:
+        os.replace(output_path + ".tmp", output_path)
+
+    for input_path in input_paths[1:]:
+        with fitz.open(input_path) as src:
+            page_count = src.page_count
+            toc.extend(_offset_toc(src.get_toc(), page_offset, toc[-1][0] if toc else 0))
+        for start in range(0, page_count, pages_per_batch):
+            with fitz.open(input_path) as src, fitz.open(output_path) as out:
+                out.insert_pdf(src, from_page=start, to_page=min(start + pages_per_batch, page_count) - 1)
+                out.saveIncr()
+        page_offset += page_count
+
+    if len(input_paths) > 1:
+        with fitz.open(output_path) as out:
+            out.set_toc(toc)
+            out.save(output_path + ".tmp", garbage=3, deflate=True)
+        os.replace(output_path + ".tmp", output_path)
+    return os.path.getsize(output_path)
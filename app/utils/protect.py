@@ -1,9 +1,10 @@
 import fitz  # PyMuPDF
 from io import BytesIO
 
-async def protect_pdf_content(pdf_content: bytes, password: str, permissions: dict) -> bytes:
+def protect_pdf_content(pdf_content: bytes, password: str, permissions: dict) -> bytes:
     """
-    Protect a PDF with password and permissions using PyMuPDF
+    Protect a PDF with password and permissions using PyMuPDF.
+    CPU-bound; run it in the shared PDF process pool.
     
     Args:
         pdf_content: Raw PDF content as bytes
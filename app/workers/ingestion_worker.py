@@ -0,0 +1,170 @@
+# app/workers/ingestion_worker.py
+
+import argparse
+import asyncio
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Tuple
+from uuid import UUID
+
+from app.core.config import settings
+from app.database.crud import update_document_status
+from app.integrations import supabase_connect
+from app.integrations.supabase_connect import initialize_supabase, get_pdf_bucket_name
+from app.integrations.vector_db import initialize_vector_store
+from app.services.ingestion_queue import get_ingestion_queue
+
+logger = logging.getLogger(__name__)
+
+
+def _init_worker_process():
+    """Initializes the external clients once in every pool process."""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(levelname)s %(message)s")
+    # The ingestion processes already use the cores; do not nest a full extraction pool in each
+    from app.services.pdf_processing import set_extraction_workers
+    set_extraction_workers(settings.INGESTION_EXTRACTION_WORKERS)
+    asyncio.run(initialize_supabase())
+    asyncio.run(initialize_vector_store())
+
+
+def run_ingestion_job(job: Dict[str, Any]) -> None:
+    """
+    Runs one ingestion job inside a pool process.
+
+    Raises RuntimeError on failure: exceptions travel back to the parent
+    pickled, and Starlette's HTTPException cannot be unpickled, which would
+    break the whole pool.
+    """
+    try:
+        _run_ingestion_job(job)
+    except Exception as e:
+        raise RuntimeError(str(getattr(e, "detail", None) or e)) from None
+
+
+def _run_ingestion_job(job: Dict[str, Any]) -> None:
+    # Imported here so the parent process never loads the LLM clients
+    from app.services.rag_service import process_pdf_for_rag
+
+    queue = get_ingestion_queue()
+    supabase = supabase_connect.supabase_client
+
+    def on_stage(stage: str):
+        queue.set_stage(job["id"], stage)
+        update_document_status(supabase, job["document_id"], stage)
+
+    on_stage("downloading")
+    file_content_bytes = supabase.storage.from_(get_pdf_bucket_name()).download(job["storage_path"])
+
+    asyncio.run(process_pdf_for_rag(
+        user_id=job["user_id"],
+        collection_id=UUID(job["collection_id"]),
+        document_id=UUID(job["document_id"]),
+        file_name=job["file_name"],
+        file_content_bytes=file_content_bytes,
+        file=None,
+        supabase_client=supabase,
+        on_stage=on_stage
+    ))
+
+
+async def run_worker(concurrency: int, poll_interval: float) -> None:
+    """Claims jobs from the ingestion queue and runs them in a process pool."""
+    queue = get_ingestion_queue()
+    loop = asyncio.get_running_loop()
+    running: Dict[str, Tuple[Dict[str, Any], asyncio.Future]] = {}
+    lease_renew_interval = max(1, queue.visibility_timeout // 3)
+    last_lease_renewal = time.monotonic()
+
+    # Needed in the parent too, to update document status after failures
+    await initialize_supabase()
+
+    pool = ProcessPoolExecutor(max_workers=concurrency, initializer=_init_worker_process)
+    logger.info(f"Ingestion worker started with {concurrency} processes")
+    try:
+        while True:
+            # 0. Give up on jobs whose lease expired once too often (e.g. the process was OOM-killed)
+            for job in await asyncio.to_thread(queue.fail_expired):
+                logger.error(f"Job {job['id']} exhausted its attempts without finishing")
+                try:
+                    update_document_status(supabase_connect.supabase_client, job["document_id"], "failed")
+                except Exception as e:
+                    logger.error(f"Failed to mark document {job['document_id']} as failed: {e}")
+
+            # 1. Fill free slots with the next jobs (fairly across users)
+            while len(running) < concurrency:
+                job = await asyncio.to_thread(queue.claim)
+                if job is None:
+                    break
+                logger.info(f"Claimed job {job['id']} for document {job['document_id']} (attempt {job['attempts']})")
+                try:
+                    future = loop.run_in_executor(pool, run_ingestion_job, job)
+                except BrokenProcessPool:
+                    await asyncio.to_thread(queue.fail, job["id"], job["attempts"], "Ingestion process pool was broken")
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = ProcessPoolExecutor(max_workers=concurrency, initializer=_init_worker_process)
+                    break
+                running[job["id"]] = (job, future)
+
+            # 2. Wait for something to finish or for the next poll
+            if running:
+                await asyncio.wait([future for _, future in running.values()], timeout=poll_interval)
+            else:
+                await asyncio.sleep(poll_interval)
+
+            # 3. Record finished jobs
+            pool_broken = False
+            for job_id, (job, future) in list(running.items()):
+                if not future.done():
+                    continue
+                del running[job_id]
+                error = future.exception()
+                if isinstance(error, BrokenProcessPool):
+                    # A pool process died; every job still running in it fails the same way
+                    pool_broken = True
+                    error = RuntimeError("Ingestion process exited unexpectedly")
+                if error is None:
+                    await asyncio.to_thread(queue.complete, job_id)
+                    logger.info(f"Job {job_id} succeeded")
+                    continue
+                error_msg = getattr(error, "detail", None) or str(error)
+                retry = await asyncio.to_thread(queue.fail, job_id, job["attempts"], error_msg)
+                logger.error(f"Job {job_id} failed (attempt {job['attempts']}, retry={retry}): {error_msg}")
+                if retry:
+                    try:
+                        update_document_status(supabase_connect.supabase_client, job["document_id"], "queued")
+                    except Exception as e:
+                        logger.error(f"Failed to reset status of document {job['document_id']}: {e}")
+
+            if pool_broken:
+                logger.error("Ingestion process pool is broken, replacing it")
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = ProcessPoolExecutor(max_workers=concurrency, initializer=_init_worker_process)
+
+            # 4. Keep leases alive for jobs that are still running
+            if running and time.monotonic() - last_lease_renewal >= lease_renew_interval:
+                for job_id in running:
+                    await asyncio.to_thread(queue.extend_lease, job_id)
+                last_lease_renewal = time.monotonic()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="pdfier-worker", description="Runs queued PDF ingestion jobs.")
+    parser.add_argument("--concurrency", type=int, default=settings.INGESTION_WORKER_PROCESSES,
+                        help="Number of ingestion processes")
+    parser.add_argument("--poll-interval", type=float, default=settings.INGESTION_POLL_INTERVAL_SECONDS,
+                        help="Seconds between queue polls when idle")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(levelname)s %(message)s")
+    try:
+        asyncio.run(run_worker(args.concurrency, args.poll_interval))
+    except KeyboardInterrupt:
+        logger.info("Ingestion worker stopped")
+
+
+if __name__ == "__main__":
+    main()
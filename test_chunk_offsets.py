@@ -0,0 +1,55 @@
+import random
+
+from app.core.config import settings
+from app.services.pdf_processing import PAGE_SEPARATOR, StreamingChunker
+
+
+def _pages(seed: int = 7, count: int = 30):
+    rng = random.Random(seed)
+    words = ["alpha", "beta", "gamma", "delta", "pdf", "page", "chunk", "overlap", "token", "the", "of", "and"]
+    pages = []
+    for _ in range(count):
+        paragraphs = []
+        for _ in range(rng.randint(1, 6)):
+            lines = [" ".join(rng.choice(words) for _ in range(rng.randint(3, 25))) for _ in range(rng.randint(1, 5))]
+            paragraphs.append("\n".join(lines))
+        pages.append("\n\n".join(paragraphs))
+    # Repeated pages make the same chunk text occur more than once
+    pages[10] = pages[9]
+    return pages
+
+
+def _check_offsets(unit: str, chunk_size: int, chunk_overlap: int):
+    original_unit = settings.CHUNK_LENGTH_UNIT
+    settings.CHUNK_LENGTH_UNIT = unit
+    try:
+        pages = _pages()
+        full = PAGE_SEPARATOR.join(pages)
+        chunker = StreamingChunker(chunk_size, chunk_overlap)
+        chunks = [chunk for page in pages for chunk in chunker.add_page(page)]
+        chunks.extend(chunker.finish())
+    finally:
+        settings.CHUNK_LENGTH_UNIT = original_unit
+
+    assert chunks
+    previous_start = -1
+    for i, chunk in enumerate(chunks):
+        assert chunk.index == i
+        assert chunk.char_start > previous_start
+        assert full[chunk.char_start:chunk.char_end] == chunk.text
+        assert 1 <= chunk.page_start <= chunk.page_end <= len(pages)
+        previous_start = chunk.char_start
+
+
+def test_chunk_offsets_in_characters():
+    _check_offsets("characters", chunk_size=400, chunk_overlap=80)
+
+
+def test_chunk_offsets_in_tokens():
+    _check_offsets("tokens", chunk_size=100, chunk_overlap=20)
+
+
+if __name__ == "__main__":
+    test_chunk_offsets_in_characters()
+    test_chunk_offsets_in_tokens()
+    print("Chunk offsets match the joined text")
@@ -0,0 +1,7 @@
+# pdfier-worker: runs queued document ingestion outside the web process.
+# Usage: python worker.py [--concurrency N]
+
+from app.workers.ingestion_worker import main
+
+if __name__ == "__main__":
+    main()